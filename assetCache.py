@@ -0,0 +1,111 @@
+"""
+assetCache.py
+
+Versioned on-disk cache of decoded game assets, for a fast client start. Decoding
+the webp images and the mp3 (and scaling the suit images) on every launch is most
+of the time to first frame, and surfaces that were never converted pay a
+pixel-format conversion on every blit.
+
+The first launch stores every image as raw pixels, already scaled and in the pixel
+format of the display, and every sound as PCM in the mixer's format. Later launches
+read those files and copy them straight into a display-format surface or a Sound,
+without decoding or converting anything. pygame copies the data into its own
+buffers, so every client still holds its own copy of the assets.
+
+An entry's name is derived from its source file (path, size, modification time),
+the scale, the display or mixer format, the pygame version and
+ASSET_CACHE_VERSION, so changing any of them misses the cache and rebuilds the
+entry. A cache directory that cannot be written only costs the speed-up.
+"""
+
+import hashlib
+import os
+import struct
+import threading
+
+import pygame
+
+ASSET_CACHE_VERSION = 1  # Bump when the entry layout changes
+IMAGE_HEADER = struct.Struct("<4sIIIII4I")  # magic, width, height, pitch, flags, bitsize, RGBA masks
+IMAGE_MAGIC = b'LSIM'
+SOUND_MAGIC = b'LSPC'
+
+cache_dir = None  # Overrides the default cache directory next to the assets when set
+
+def get_cache_dir(source):
+    return cache_dir or os.path.join(os.path.dirname(os.path.abspath(source)), 'cache')
+
+def entry_path(source, *key):
+    """Path of the cache entry for source under key, changing whenever source or key changes."""
+    stat = os.stat(source)
+    identity = repr((ASSET_CACHE_VERSION, pygame.version.ver, os.path.abspath(source),
+                     stat.st_size, stat.st_mtime_ns) + key)
+    digest = hashlib.sha1(identity.encode()).hexdigest()[:16]
+    return os.path.join(get_cache_dir(source), f"{os.path.basename(source)}.{digest}.raw")
+
+def write_entry(path, *chunks):
+    """Write an entry atomically, so a reader never reads a half-written file."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Could not write asset cache entry {path}: {e}")
+
+def read_entry(path):
+    """Return the contents of a cache entry, or None when it does not exist."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def decode_image(source, scale):
+    image = pygame.image.load(source)
+    if scale != 1.0:
+        width, height = image.get_size()
+        image = pygame.transform.scale(image, (int(width * scale), int(height * scale)))
+    # Images with transparency keep their alpha channel
+    return image.convert_alpha() if image.get_flags() & pygame.SRCALPHA else image.convert()
+
+def load_image(source, scale=1.0):
+    """Return the image at source scaled by scale, as a surface in the display's pixel format."""
+    display = pygame.display.get_surface()
+    path = entry_path(source, 'image', scale, display.get_bitsize(), display.get_masks())
+    data = read_entry(path)
+    if data is not None and data[:4] == IMAGE_MAGIC and len(data) >= IMAGE_HEADER.size:
+        _, width, height, pitch, flags, bitsize, *masks = IMAGE_HEADER.unpack_from(data)
+        surface = pygame.Surface((width, height), flags, bitsize, masks)
+        if surface.get_pitch() == pitch and len(data) == IMAGE_HEADER.size + pitch * height:
+            memoryview(surface.get_buffer())[:] = memoryview(data)[IMAGE_HEADER.size:]
+            return surface
+
+    surface = decode_image(source, scale)
+    header = IMAGE_HEADER.pack(IMAGE_MAGIC, surface.get_width(), surface.get_height(), surface.get_pitch(),
+                               surface.get_flags() & pygame.SRCALPHA, surface.get_bitsize(), *surface.get_masks())
+    write_entry(path, header, surface.get_buffer().raw)
+    return surface
+
+def load_sound(source):
+    """Return the sound at source, decoded once into PCM in the mixer's format."""
+    path = entry_path(source, 'sound', pygame.mixer.get_init())
+    data = read_entry(path)
+    if data is not None and data[:4] == SOUND_MAGIC:
+        return pygame.mixer.Sound(buffer=memoryview(data)[4:])
+    sound = pygame.mixer.Sound(source)
+    write_entry(path, SOUND_MAGIC, sound.get_raw())
+    return sound
+
+def load_sound_in_background(source, callback):
+    """Load a sound that is not needed for the first frame on a daemon thread, then call callback(sound)."""
+    def load():
+        try:
+            callback(load_sound(source))
+        except Exception as e:
+            print(f"Could not load sound {source}: {e}")
+    thread = threading.Thread(target=load, name="asset-loader", daemon=True)
+    thread.start()
+    return thread
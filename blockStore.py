@@ -0,0 +1,170 @@
+"""
+blockStore.py
+
+On-disk store of luckycoin block hashes. Each height has a fixed 32-byte record at
+offset height * 32, so a hash is read straight out of an mmap of the file without
+keeping the chain in memory. The store syncs incrementally from its last record up
+to the node's tip and can keep refreshing the tip from a background thread.
+"""
+
+import mmap
+import os
+import threading
+
+RECORD_SIZE = 32  # Bytes per block hash record
+SYNC_CHUNK_SIZE = 5000  # Heights fetched and appended per write during a sync
+REORG_CHECK_DEPTH = 6  # Stored blocks re-checked against the node before each sync
+TIP_REFRESH_INTERVAL = 30  # Seconds between background tip refreshes
+
+def close_map(block_map):
+    """Close a mapping unless arrays handed out by as_array still reference it."""
+    try:
+        block_map.close()
+    except BufferError:
+        # Released by the garbage collector once the last array view is gone
+        pass
+
+class BlockHashStore:
+    """Fixed-size block hash records indexed by height, read through mmap."""
+
+    def __init__(self, path, fetch_block_count, fetch_block_hashes):
+        # fetch_block_count() returns the node's tip height and
+        # fetch_block_hashes(heights) returns the hex hashes for a list of heights
+        self.path = path
+        self.fetch_block_count = fetch_block_count
+        self.fetch_block_hashes = fetch_block_hashes
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        self.map = None
+        self.count = 0
+        self.stop_event = threading.Event()
+        self.tip_event = threading.Event()  # Set by notify_tip to sync before the interval is up
+        self.thread = None
+
+        # Drop a partially written record left behind by an interrupted sync
+        self._truncate(os.fstat(self.file.fileno()).st_size // RECORD_SIZE)
+
+        # Until the node is asked, assume the stored tip is the chain tip
+        self.chain_height = self.count - 1
+
+    def _remap(self):
+        """Map the current file contents, replacing the previous mapping."""
+        self.file.flush()
+        count = os.fstat(self.file.fileno()).st_size // RECORD_SIZE
+        new_map = None
+        if count:
+            new_map = mmap.mmap(self.file.fileno(), count * RECORD_SIZE, access=mmap.ACCESS_READ)
+        with self.lock:
+            old_map = self.map
+            self.map = new_map
+            self.count = count
+        if old_map is not None:
+            close_map(old_map)
+
+    def _truncate(self, count):
+        """Drop every record from height count onwards."""
+        # The mapping has to be released first, Windows refuses to shrink a mapped file
+        with self.lock:
+            if self.map is not None:
+                close_map(self.map)
+                self.map = None
+            self.count = 0
+        self.file.truncate(count * RECORD_SIZE)
+        self._remap()
+
+    @property
+    def tip_height(self):
+        """Highest stored height, or -1 when the store is empty."""
+        return self.count - 1
+
+    def is_synced(self):
+        """Return True when every block up to the known chain tip is stored."""
+        return self.count > 0 and self.tip_height >= self.chain_height
+
+    def get_bytes(self, height):
+        """Return the raw 32-byte hash for a height, or None if it is not stored."""
+        with self.lock:
+            if height < 0 or height >= self.count:
+                return None
+            offset = height * RECORD_SIZE
+            return self.map[offset:offset + RECORD_SIZE]
+
+    def get(self, height):
+        """Return the hex block hash for a height, or None if it is not stored."""
+        record = self.get_bytes(height)
+        return record.hex() if record is not None else None
+
+    def as_array(self):
+        """Return the stored hashes as a read-only (count, 32) uint8 NumPy array backed by the mmap."""
+        import numpy as np
+        with self.lock:
+            if not self.count:
+                return np.empty((0, RECORD_SIZE), dtype=np.uint8)
+            return np.frombuffer(self.map, dtype=np.uint8).reshape(self.count, RECORD_SIZE)
+
+    def _rewind_reorged_blocks(self):
+        """Truncate stored blocks that are no longer on the node's best chain."""
+        start = max(0, self.count - REORG_CHECK_DEPTH)
+        heights = list(range(start, self.count))
+        if not heights:
+            return
+        node_hashes = self.fetch_block_hashes(heights)
+        for height, node_hash in zip(heights, node_hashes):
+            if self.get(height) != node_hash:
+                print(f"Block hash store: chain reorganised at height {height}, rewinding")
+                self._truncate(height)
+                return
+
+    def sync(self):
+        """Append the hashes from the last stored height up to the node's current tip."""
+        with self.sync_lock:
+            self.chain_height = self.fetch_block_count()
+            self._rewind_reorged_blocks()
+            while self.count <= self.chain_height and not self.stop_event.is_set():
+                end = min(self.count + SYNC_CHUNK_SIZE, self.chain_height + 1)
+                heights = list(range(self.count, end))
+                hashes = self.fetch_block_hashes(heights)
+                self.file.write(b''.join(bytes.fromhex(block_hash) for block_hash in hashes))
+                self._remap()
+            return self.tip_height
+
+    def _refresh_loop(self, interval):
+        while not self.stop_event.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Block hash store sync failed: {e}")
+            self.tip_event.wait(interval)
+            self.tip_event.clear()
+
+    def notify_tip(self, height):
+        """Learn of a new chain tip (see chainEvents) and wake the background sync."""
+        self.chain_height = height
+        self.tip_event.set()
+
+    def start_background_sync(self, interval=TIP_REFRESH_INTERVAL):
+        """Keep the store synced to the chain tip from a daemon thread."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._refresh_loop, args=(interval,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the background sync thread."""
+        self.stop_event.set()
+        self.tip_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        """Stop syncing and release the mapping and file."""
+        self.stop()
+        with self.lock:
+            if self.map is not None:
+                close_map(self.map)
+                self.map = None
+            self.count = 0
+        self.file.close()
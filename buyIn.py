@@ -1,23 +1,13 @@
-import configparser
-from bitcoinrpc.authproxy import AuthServiceProxy
-
-# Load RPC credentials from RPC.conf
-config = configparser.ConfigParser()
-config.read('RPC.conf')
-
-rpc_user = config['rpcconfig']['rpcuser']
-rpc_password = config['rpcconfig']['rpcpassword']
-rpc_host = config['rpcconfig']['rpchost']
-rpc_port = config['rpcconfig']['rpcport']
-
-# Create a connection to the luckycoin RPC server
-rpc_connection = AuthServiceProxy(f"http://{rpc_user}:{rpc_password}@{rpc_host}:{rpc_port}")
+from rpcClient import get_rpc_client
+from getBalances import invalidate_addresses
 
 # Define the recipient address
 recipient_address = "<Pool Address>"
 
 # Create and send the transaction
 def send_lucky(sending_address, recipient_address, amount):
+    rpc_connection = get_rpc_client()
+
     # Get UTXOs for the sending address
     utxos = rpc_connection.listunspent(1, 9999999, [sending_address])
     
@@ -35,6 +25,8 @@ def send_lucky(sending_address, recipient_address, amount):
     # Create a transaction using only UTXOs from the sending address
     txid = rpc_connection.sendtoaddress(recipient_address, amount, "", "", False)
     print(f"Transaction sent with txid: {txid}")
+    # Both balances changed, the next balance lookup has to ask the node
+    invalidate_addresses(sending_address, recipient_address)
     return txid
 
 # Example usage
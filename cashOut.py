@@ -8,27 +8,102 @@ without importing the address into the luckycoin Core wallet.
 """
 
 from decimal import Decimal
-from bitcoinrpc.authproxy import AuthServiceProxy, JSONRPCException
+from functools import lru_cache
 from ecdsa import SigningKey, SECP256k1, util
 import hashlib
+import os
 import struct
+import threading
 import base58
-import configparser
-
-# Load RPC configuration from RPC.conf
-config = configparser.ConfigParser()
-config.read('RPC.conf')
-
-rpc_user = config['rpcconfig']['rpcuser']
-rpc_password = config['rpcconfig']['rpcpassword']
-rpc_host = config['rpcconfig']['rpchost']
-rpc_port = int(config['rpcconfig']['rpcport'])
+from rpcClient import JSONRPCException, get_config_path, get_rpc_client
+from coinSelection import DEFAULT_FEE_PER_KB, InsufficientFunds, get_fee_per_kb, select_coins
+from getBalances import apply_received_utxo, apply_spent_utxos, invalidate_addresses
 
 # Wallet information
 dev_fee_address = "<dev_fee_address>"
 from_address = "<Pool Address>"
 privkey_hex = "<PoolPrivate Key>"
 
+SIGHASH_ALL = 1
+SEQUENCE_FINAL = struct.pack("<I", 0xffffffff)
+BLANK_INPUT_SIZE = 32 + 4 + 1 + 4  # Outpoint, empty scriptSig and sequence
+SATOSHIS_PER_LUCKY = Decimal('1e8')
+OUTPOINT = struct.Struct("<32sI")  # txid and output index
+BROADCAST_ATTEMPTS = 2  # A payout rejected by the node is rebuilt from its UTXOs and sent once more
+
+# Overrides the default pool lock file next to RPC.conf when set
+pool_lock_path = None
+
+def get_pool_lock_path():
+    if pool_lock_path is not None:
+        return pool_lock_path
+    return os.path.join(os.path.dirname(get_config_path()), 'pool.lock')
+
+def lock_file(path):
+    """Open path and block until this process holds its exclusive OS lock."""
+    f = open(path, 'a+b')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after 10 seconds, keep waiting
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+def unlock_file(f):
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    f.close()  # Releases the flock
+
+class PoolLock:
+    """
+    Re-entrant lock of the threads of a process that also holds the pool lock file
+    while taken, so payouts and consolidations of every process on this machine
+    paying from the pool are serialized.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.depth = 0  # Nested acquisitions by the owning thread
+        self.file = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        if self.depth == 0:
+            try:
+                self.file = lock_file(get_pool_lock_path())
+            except BaseException:
+                self.lock.release()
+                raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0:
+            file, self.file = self.file, None
+            unlock_file(file)
+        self.lock.release()
+
+# Held while choosing and spending pool UTXOs, so concurrent payouts and
+# consolidations (see poolConsolidation) never spend the same UTXO twice
+pool_lock = PoolLock()
+
+# Private key hex -> (SigningKey, pushed compressed public key), loaded once per process
+signing_keys = {}
+
 def varint(n):
     if n < 0xfd:
         return struct.pack('<B', n)
@@ -39,37 +114,147 @@ def varint(n):
     else:
         return b'\xff' + struct.pack('<Q', n)
 
+def varint_size(n):
+    return 1 if n < 0xfd else 3 if n <= 0xffff else 5 if n <= 0xffffffff else 9
+
+def write_varint(view, offset, n):
+    """Write n as a varint into view at offset and return the offset after it."""
+    if n < 0xfd:
+        view[offset] = n
+        return offset + 1
+    encoded = varint(n)
+    view[offset:offset + len(encoded)] = encoded
+    return offset + len(encoded)
+
+class TxIn:
+    """An input spending a UTXO, with the txid in serialized (little-endian) byte order."""
+    __slots__ = ('txid', 'vout', 'amount', 'script_pubkey', 'script_sig')
+
+    def __init__(self, txid, vout, amount, script_pubkey, script_sig=b''):
+        self.txid = txid
+        self.vout = vout
+        self.amount = amount  # Satoshis of the UTXO being spent
+        self.script_pubkey = script_pubkey  # Needed for signing
+        self.script_sig = script_sig
+
+    @classmethod
+    def from_utxo(cls, utxo):
+        """Build an input from a listunspent entry."""
+        amount = utxo['amount']
+        if not isinstance(amount, Decimal):
+            amount = Decimal(str(amount))
+        return cls(
+            bytes.fromhex(utxo['txid'])[::-1],
+            utxo['vout'],
+            int(amount * SATOSHIS_PER_LUCKY),  # Convert lucky to satoshis
+            bytes.fromhex(utxo['scriptPubKey']),
+        )
+
+    @property
+    def txid_hex(self):
+        return self.txid[::-1].hex()
+
+    def outpoint(self):
+        return OUTPOINT.pack(self.txid, self.vout)
+
+    def __repr__(self):
+        return f"TxIn({self.txid_hex}:{self.vout}, {self.amount})"
+
+class TxOut:
+    """An output paying amount satoshis to address."""
+    __slots__ = ('address', 'amount', 'script_pubkey')
+
+    def __init__(self, address, amount):
+        self.address = address
+        self.amount = amount
+        self.script_pubkey = script_pubkey_for_address(address)
+
+    def __repr__(self):
+        return f"TxOut({self.address}, {self.amount})"
+
+class Transaction:
+    """Legacy transaction serialized straight into one preallocated buffer."""
+    __slots__ = ('version', 'locktime', 'inputs', 'outputs')
+
+    def __init__(self, inputs, outputs, version=1, locktime=0):
+        self.version = version
+        self.locktime = locktime
+        self.inputs = inputs
+        self.outputs = outputs
+
+    def outputs_size(self):
+        return varint_size(len(self.outputs)) + sum(
+            8 + varint_size(len(txout.script_pubkey)) + len(txout.script_pubkey) for txout in self.outputs)
+
+    def size(self):
+        """Serialized size in bytes with the current scriptSigs."""
+        inputs_size = sum(32 + 4 + varint_size(len(txin.script_sig)) + len(txin.script_sig) + 4
+                          for txin in self.inputs)
+        return 4 + varint_size(len(self.inputs)) + inputs_size + self.outputs_size() + 4
+
+    def write_outputs(self, view, offset):
+        offset = write_varint(view, offset, len(self.outputs))
+        for txout in self.outputs:
+            struct.pack_into("<Q", view, offset, txout.amount)  # amount in satoshis
+            offset = write_varint(view, offset + 8, len(txout.script_pubkey))
+            view[offset:offset + len(txout.script_pubkey)] = txout.script_pubkey
+            offset += len(txout.script_pubkey)
+        return offset
+
+    def serialize_outputs(self):
+        buffer = bytearray(self.outputs_size())
+        self.write_outputs(memoryview(buffer), 0)
+        return buffer
+
+    def serialize(self):
+        buffer = bytearray(self.size())
+        view = memoryview(buffer)
+        struct.pack_into("<I", view, 0, self.version)
+        offset = write_varint(view, 4, len(self.inputs))
+        pack_outpoint = OUTPOINT.pack_into
+        for txin in self.inputs:
+            pack_outpoint(view, offset, txin.txid, txin.vout)
+            script_sig = txin.script_sig
+            offset = write_varint(view, offset + 36, len(script_sig))
+            end = offset + len(script_sig)
+            view[offset:end] = script_sig
+            view[end:end + 4] = SEQUENCE_FINAL
+            offset = end + 4
+        offset = self.write_outputs(view, offset)
+        struct.pack_into("<I", view, offset, self.locktime)
+        return buffer
+
+    def txid(self):
+        return hashlib.sha256(hashlib.sha256(self.serialize()).digest()).digest()[::-1].hex()
+
 def get_utxos(address):
     """
-    Retrieve UTXOs for the given address using luckycoin Core RPC.
+    Retrieve UTXOs for the given address using luckycoin Core RPC, as unsigned inputs.
     """
-    rpc_connection = AuthServiceProxy(f"http://{rpc_user}:{rpc_password}@{rpc_host}:{rpc_port}")
+    rpc_connection = get_rpc_client()
     utxos = []
 
     try:
         # Get the list of unspent transaction outputs for the address
         utxos_list = rpc_connection.listunspent(1, 9999999, [address])
         for utxo in utxos_list:
-            utxo_info = {
-                'transaction_hash': utxo['txid'],
-                'index': utxo['vout'],
-                'value': int(Decimal(str(utxo['amount'])) * Decimal('1e8')),  # Convert lucky to satoshis
-                'scriptPubKey': utxo['scriptPubKey'],
-            }
-            utxos.append(utxo_info)
-            print(f"UTXO: {utxo_info}")  # Print UTXO details
+            txin = TxIn.from_utxo(utxo)
+            utxos.append(txin)
+            print(f"UTXO: {txin}")  # Print UTXO details
     except JSONRPCException as e:
         print(f"An error occurred while retrieving UTXOs: {e.error['message']}")
 
     return utxos
 
-def create_script_pubkey(address):
+@lru_cache(maxsize=4096)
+def script_pubkey_for_address(address):
+    """Return the P2PKH scriptPubKey bytes for an address, decoding each address once."""
     # Decode the address (assuming it's a base58check encoded address)
     address_bytes = base58.b58decode_check(address)
     # The first byte is the version, the rest is the pubkey hash
     pubkey_hash = address_bytes[1:]
     # Build the scriptPubKey
-    script_pubkey = (
+    return (
         b'\x76' +  # OP_DUP
         b'\xa9' +  # OP_HASH160
         bytes([len(pubkey_hash)]) +
@@ -77,136 +262,104 @@ def create_script_pubkey(address):
         b'\x88' +  # OP_EQUALVERIFY
         b'\xac'    # OP_CHECKSIG
     )
-    return script_pubkey.hex()
 
-def create_raw_transaction(utxos, to_address, amount_satoshis, fee_satoshis):
-    inputs = []
+def create_script_pubkey(address):
+    return script_pubkey_for_address(address).hex()
+
+def create_payout_transaction(utxos, payouts, fee_per_kb=DEFAULT_FEE_PER_KB, strategy=None):
+    """
+    Build one transaction paying every (address, amount_satoshis) payout, less its 1%
+    dev fee, with the dev fees of all payouts in a single output.
+    """
     outputs = []
-    total_input = 0
-
-    # Calculate dev fee (1% of the amount)
-    dev_fee_satoshis = int(amount_satoshis * 0.01)
-    
-    # Calculate the actual amount to send (original amount minus dev fee)
-    actual_send_amount = amount_satoshis - dev_fee_satoshis
-
-    # Select UTXOs to cover the amount + fees
-    for utxo in utxos:
-        inputs.append({
-            'txid': utxo['transaction_hash'],
-            'vout': utxo['index'],
-            'scriptPubKey': utxo['scriptPubKey'],  # Needed for signing
-            'amount': utxo['value'],  # in satoshis
-        })
-        total_input += utxo['value']
-        if total_input >= amount_satoshis + fee_satoshis:
-            break
-
-    if total_input < amount_satoshis + fee_satoshis:
-        raise Exception("Insufficient funds")
+    recipient_amounts = {}
+    dev_fee_satoshis = 0
+    for address, amount_satoshis in payouts:
+        # Calculate dev fee (1% of the amount)
+        payout_dev_fee = int(amount_satoshis * 0.01)
+        dev_fee_satoshis += payout_dev_fee
+        # The recipient gets the original amount minus the dev fee, one output per address
+        recipient_amounts[address] = recipient_amounts.get(address, 0) + amount_satoshis - payout_dev_fee
+    total_satoshis = sum(amount_satoshis for _, amount_satoshis in payouts)
+
+    # Select UTXOs to cover the amount and the fee for the transaction's size,
+    # raises InsufficientFunds when the pool cannot pay
+    selection = select_coins(utxos, total_satoshis, output_count=len(recipient_amounts) + 1,
+                             fee_per_kb=fee_per_kb, strategy=strategy)
+    print(f"Coin selection: {selection}")
 
     # Outputs
-    # Recipient output (original amount minus dev fee)
-    outputs.append({
-        'address': to_address,
-        'amount': actual_send_amount,
-    })
+    # Recipient outputs
+    for address, amount_satoshis in recipient_amounts.items():
+        outputs.append(TxOut(address, amount_satoshis))
 
     # Dev fee output
-    outputs.append({
-        'address': dev_fee_address,
-        'amount': dev_fee_satoshis,
-    })
+    outputs.append(TxOut(dev_fee_address, dev_fee_satoshis))
 
     # Change output (if any)
-    change_satoshis = total_input - amount_satoshis - fee_satoshis
-    if change_satoshis > 0:
-        outputs.append({
-            'address': from_address,
-            'amount': change_satoshis,
-        })
-
-    # Build the transaction object
-    tx = {
-        'version': 1,
-        'locktime': 0,
-        'inputs': inputs,
-        'outputs': outputs,
-    }
-
-    return tx
+    if selection.change > 0:
+        outputs.append(TxOut(from_address, selection.change))
 
-def serialize_transaction(tx, for_signing=False, input_index=None, script_code=None):
-    # Start with the version
-    result = struct.pack("<I", tx['version'])  # version
-
-    # Serialize inputs
-    result += varint(len(tx['inputs']))  # Number of inputs
-
-    for i, txin in enumerate(tx['inputs']):
-        result += bytes.fromhex(txin['txid'])[::-1]  # txid (little-endian)
-        result += struct.pack("<I", txin['vout'])  # vout
-
-        if for_signing:
-            if i == input_index:
-                # Use script_code for the input being signed
-                script_sig = bytes.fromhex(script_code)
-                result += varint(len(script_sig)) + script_sig
-            else:
-                # Empty scriptSig
-                result += varint(0)
-        else:
-            # Include scriptSig
-            script_sig = bytes.fromhex(txin.get('scriptSig', ''))
-            result += varint(len(script_sig)) + script_sig
+    return Transaction(selection.inputs, outputs)
 
-        result += struct.pack("<I", 0xffffffff)  # sequence
+def create_raw_transaction(utxos, to_address, amount_satoshis, fee_per_kb=DEFAULT_FEE_PER_KB, strategy=None):
+    return create_payout_transaction(utxos, [(to_address, amount_satoshis)], fee_per_kb, strategy)
 
-    # Serialize outputs
-    result += varint(len(tx['outputs']))  # Number of outputs
-    for txout in tx['outputs']:
-        result += struct.pack("<Q", txout['amount'])  # amount in satoshis
-        script_pubkey = bytes.fromhex(create_script_pubkey(txout['address']))
-        result += varint(len(script_pubkey)) + script_pubkey
+def serialize_transaction(tx):
+    return tx.serialize()
 
-    # Locktime
-    result += struct.pack("<I", tx['locktime'])  # locktime
+def get_signing_key(privkey_hex):
+    """Return the SigningKey and the pushed compressed public key for a private key, loading them once."""
+    if privkey_hex not in signing_keys:
+        privkey = SigningKey.from_string(bytes.fromhex(privkey_hex), curve=SECP256k1)
+        public_key_bytes = privkey.get_verifying_key().to_string("compressed")  # Compressed public key
+        signing_keys[privkey_hex] = (privkey, varint(len(public_key_bytes)) + public_key_bytes)
+    return signing_keys[privkey_hex]
 
-    return result
+def signature_hashes(tx, script_codes):
+    """
+    Return the legacy SIGHASH_ALL digest of every input. The transaction is serialized
+    once with empty scriptSigs, and each digest only splices in its own script code:
+    the hash state of the inputs before it is carried forward and the bytes after it
+    are fed from a memoryview. Each digest still hashes the whole transaction, as
+    the legacy sighash requires, but no per-input re-serialization happens.
+    """
+    blank = bytearray(len(tx.inputs) * BLANK_INPUT_SIZE)
+    for index, txin in enumerate(tx.inputs):
+        offset = index * BLANK_INPUT_SIZE
+        OUTPOINT.pack_into(blank, offset, txin.txid, txin.vout)
+        blank[offset + 37:offset + BLANK_INPUT_SIZE] = SEQUENCE_FINAL
+    blank += tx.serialize_outputs() + struct.pack("<II", tx.locktime, SIGHASH_ALL)
+    body = memoryview(blank)
+
+    # Hash state of the version, input count and blank inputs before the current input
+    prefix_hash = hashlib.sha256(struct.pack("<I", tx.version) + varint(len(tx.inputs)))
+    digests = []
+    offset = 0
+    for txin, script_code in zip(tx.inputs, script_codes):
+        input_hash = prefix_hash.copy()
+        input_hash.update(body[offset:offset + 36])
+        input_hash.update(varint(len(script_code)) + script_code + SEQUENCE_FINAL)
+        input_hash.update(body[offset + BLANK_INPUT_SIZE:])
+        digests.append(hashlib.sha256(input_hash.digest()).digest())
+        prefix_hash.update(body[offset:offset + BLANK_INPUT_SIZE])
+        offset += BLANK_INPUT_SIZE
+    return digests
 
 def sign_transaction(tx, privkey_hex):
-    # Get the private key in bytes
-    privkey_bytes = bytes.fromhex(privkey_hex)
-    privkey = SigningKey.from_string(privkey_bytes, curve=SECP256k1)
-    vk = privkey.get_verifying_key()
-    public_key_bytes = vk.to_string("compressed")  # Compressed public key
+    privkey, public_key_push = get_signing_key(privkey_hex)
 
-    # Sign each input
-    for index, txin in enumerate(tx['inputs']):
-        # Get the scriptPubKey of the UTXO being spent
-        script_pubkey = txin['scriptPubKey']
-        # For P2PKH, the script code is the scriptPubKey
-        script_code = script_pubkey
-        # Create the serialization of the transaction for signing
-        tx_serialized = serialize_transaction(tx, for_signing=True, input_index=index, script_code=script_code)
-        # Append SIGHASH_ALL
-        tx_serialized += struct.pack("<I", 1)  # SIGHASH_ALL
-
-        # Compute the double SHA256 hash
-        message_hash = hashlib.sha256(hashlib.sha256(tx_serialized).digest()).digest()
+    # For P2PKH, the script code is the scriptPubKey of the UTXO being spent
+    script_codes = [txin.script_pubkey for txin in tx.inputs]
 
+    # Sign each input
+    for txin, message_hash in zip(tx.inputs, signature_hashes(tx, script_codes)):
         # Sign the hash
         signature = privkey.sign_digest(message_hash, sigencode=util.sigencode_der_canonize)
         signature += b'\x01'  # Append SIGHASH_ALL
 
         # Build the scriptSig
-        script_sig = (
-            varint(len(signature)) + signature +
-            varint(len(public_key_bytes)) + public_key_bytes
-        )
-
-        # Update the transaction input's scriptSig
-        txin['scriptSig'] = script_sig.hex()
+        txin.script_sig = varint(len(signature)) + signature + public_key_push
 
     return tx
 
@@ -214,7 +367,7 @@ def broadcast_transaction(raw_tx_hex):
     """
     Broadcast the transaction to the network via luckycoin Core RPC.
     """
-    rpc_connection = AuthServiceProxy(f"http://{rpc_user}:{rpc_password}@{rpc_host}:{rpc_port}")
+    rpc_connection = get_rpc_client()
 
     try:
         txid = rpc_connection.sendrawtransaction(raw_tx_hex)
@@ -224,28 +377,76 @@ def broadcast_transaction(raw_tx_hex):
         print(f"An error occurred: {e.error['message']}")
         return None
 
-def send_lucky(to_address, amount_lucky):
-    amount_satoshis = int(amount_lucky * 1e8)
-    fee_lucky = 0.0225  # Define the transaction fee in lucky (adjust as needed)
-    fee_satoshis = int(fee_lucky * 1e8)  # Convert fee to satoshis
-
-    utxos = get_utxos(from_address)
-
-    # Create the raw transaction
-    tx = create_raw_transaction(utxos, to_address, amount_satoshis, fee_satoshis)
-
-    # Sign the transaction
-    tx_signed = sign_transaction(tx, privkey_hex)
-
-    # Serialize the signed transaction
-    raw_tx = serialize_transaction(tx_signed)
-    raw_tx_hex = raw_tx.hex()
-
-    # Print the raw transaction hex
-    print(f"Raw transaction hex: {raw_tx_hex}")
-
-    # Broadcast the transaction
-    return broadcast_transaction(raw_tx_hex)
+def send_lucky(to_address, amount_lucky, fee_per_kb=None):
+    return send_payouts([(to_address, amount_lucky)], fee_per_kb)
+
+def send_payouts(payouts, fee_per_kb=None):
+    """Pay every (address, amount_lucky) payout in one transaction and return its txid."""
+    if fee_per_kb is None:
+        fee_per_kb = get_fee_per_kb()
+    payouts_satoshis = [(address, int(amount_lucky * 1e8)) for address, amount_lucky in payouts]
+
+    with pool_lock:
+        tracker = get_pool_tracker()
+        if tracker is None:
+            return None
+
+        for _ in range(BROADCAST_ATTEMPTS):
+            # Create the raw transaction, its fee follows from its size at fee_per_kb.
+            # Confirmed UTXOs are preferred, our unconfirmed change is spent when they are not enough
+            try:
+                tx = create_payout_transaction(tracker.available(confirmed_only=True), payouts_satoshis, fee_per_kb)
+            except InsufficientFunds:
+                tx = create_payout_transaction(tracker.available(), payouts_satoshis, fee_per_kb)
+
+            # Sign the transaction
+            tx_signed = sign_transaction(tx, privkey_hex)
+
+            # Serialize the signed transaction
+            raw_tx = serialize_transaction(tx_signed)
+            raw_tx_hex = raw_tx.hex()
+
+            # Print the raw transaction hex
+            print(f"Raw transaction hex: {raw_tx_hex}")
+
+            # Broadcast the transaction
+            txid = broadcast_transaction(raw_tx_hex)
+            if txid:
+                tracker.record(tx_signed, txid)
+                update_balance_cache(tx_signed, txid)
+                return txid
+
+            # The node may know of spends we do not (another process paying from the
+            # pool), start over from its view before trying again
+            if not tracker.reload():
+                tracker.invalidate()
+                break
+    return None
+
+def get_pool_tracker():
+    """
+    Return the in-process UTXO tracker of the pool address (see poolUtxos), reloaded
+    after new blocks, or None when the node could not be asked for its state.
+    """
+    from poolUtxos import get_pool_tracker
+    tracker = get_pool_tracker(from_address)
+    if not tracker.refresh():
+        return None
+    return tracker
+
+def update_balance_cache(tx, txid):
+    """Apply a broadcast cash-out to the cached pool UTXOs instead of refetching them."""
+    apply_spent_utxos(from_address, [(txin.txid_hex, txin.vout) for txin in tx.inputs])
+    for vout, txout in enumerate(tx.outputs):
+        if txout.address == from_address:
+            apply_received_utxo(from_address, {
+                'txid': txid,
+                'vout': vout,
+                'amount': Decimal(txout.amount) / Decimal('1e8'),
+                'confirmations': 0,
+            })
+        else:
+            invalidate_addresses(txout.address)
 
 def public_key_to_address(public_key_bytes):
     # Perform SHA256 hashing on the public key
@@ -0,0 +1,117 @@
+"""
+cashOutQueue.py
+
+Collects cash-outs from many players and pays them together. A flush sends one
+transaction with an output per recipient and a single dev-fee output (see
+cashOut.send_payouts), so a batch of n cash-outs costs one UTXO fetch, one signing
+pass and one broadcast instead of n.
+
+The queue flushes when it holds max_batch payouts or when the oldest payout has
+waited max_wait seconds. submit returns a Future that resolves to the txid of the
+transaction that paid it (None if the broadcast was rejected, like send_lucky).
+
+    queue = get_cash_out_queue()
+    txid = queue.submit(player_address, 25).result()
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+from coinSelection import InsufficientFunds
+
+MAX_BATCH = 50  # Payouts per transaction
+MAX_WAIT = 2.0  # Seconds a payout may wait for others to join its batch
+
+class CashOutQueue:
+    """Batches cash-outs into multi-recipient transactions on a background thread."""
+
+    def __init__(self, max_batch=MAX_BATCH, max_wait=MAX_WAIT, send_payouts=None):
+        # send_payouts(payouts) pays a list of (address, amount_lucky) and returns the txid
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.send_payouts = send_payouts
+        self.pending = []  # (address, amount, future, submitted at)
+        self.condition = threading.Condition()
+        self.thread = None
+        self.closed = False
+
+    def submit(self, address, amount):
+        """Queue a payout of amount lucky to address and return a Future for its txid."""
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Cash-out queue is closed")
+            self.pending.append((address, amount, future, time.monotonic()))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="cash-out-queue", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return future
+
+    def _next_batch(self):
+        """Wait until a batch is due and take it off the queue, or return None once closed and empty."""
+        with self.condition:
+            while True:
+                if self.pending:
+                    waited = time.monotonic() - self.pending[0][3]
+                    if len(self.pending) >= self.max_batch or waited >= self.max_wait or self.closed:
+                        batch = self.pending[:self.max_batch]
+                        del self.pending[:self.max_batch]
+                        return batch
+                    self.condition.wait(self.max_wait - waited)
+                elif self.closed:
+                    return None
+                else:
+                    self.condition.wait()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self.flush(batch)
+
+    def flush(self, batch):
+        """Pay a batch in one transaction and resolve its futures with the txid."""
+        send_payouts = self.send_payouts
+        if send_payouts is None:
+            from cashOut import send_payouts
+        try:
+            txid = send_payouts([(address, amount) for address, amount, _, _ in batch])
+        except InsufficientFunds:
+            if len(batch) == 1:
+                batch[0][2].set_exception(InsufficientFunds("Pool cannot pay this cash-out"))
+                return
+            # The pool cannot pay everyone at once, pay whoever it can one by one
+            print(f"Cash-out batch of {len(batch)} exceeds the pool, paying individually")
+            for payout in batch:
+                self.flush([payout])
+            return
+        except Exception as e:
+            print(f"Cash-out batch of {len(batch)} failed: {e}")
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        print(f"Cash-out batch of {len(batch)} paid in {txid}")
+        for _, _, future, _ in batch:
+            future.set_result(txid)
+
+    def close(self):
+        """Flush everything still queued and stop the background thread."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+cash_out_queue = None
+cash_out_queue_lock = threading.Lock()
+
+def get_cash_out_queue():
+    """Return the process-wide cash-out queue."""
+    global cash_out_queue
+    with cash_out_queue_lock:
+        if cash_out_queue is None:
+            cash_out_queue = CashOutQueue()
+        return cash_out_queue
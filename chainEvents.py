@@ -0,0 +1,283 @@
+"""
+chainEvents.py
+
+Pushes new blocks and transactions from luckycoind to the parts of the game that
+cache chain state, instead of each of them polling the node:
+
+- getBalances: a transaction is applied to the cached UTXOs of the addresses it
+  spends from or pays to, and a block invalidates the cache (confirmations changed).
+  While events arrive cached entries no longer expire on their own.
+- dealCard: deals draw from the new tip at once and the block hash store syncs to it
+- poolUtxos: the pool UTXO trackers reload before the next payout, without asking
+  the node for its best block on every payout
+- watch_transaction callbacks (pending buy-ins) fire once a transaction confirms, or
+  once it is dropped: conflicted, unknown to the node, or unconfirmed after
+  WATCH_TIMEOUT seconds
+- add_listener callbacks get every event, e.g. the pygame client redrawing balances
+
+Two sources feed the subscriber:
+
+- ZmqSource: the node's -zmqpubhashblock and -zmqpubrawtx notifications (needs pyzmq)
+- LongPollSource: waitfornewblock long-polls over the RPC connection for blocks.
+  It still polls for transactions: the mempool is listed and diffed every
+  MEMPOOL_POLL_INTERVAL seconds, so they arrive up to that late. Use ZmqSource where
+  the node publishes rawtx. Works with any node that has waitfornewblock, including
+  fakeLuckycoind.
+
+Events are (kind, data) pairs: ('block', {'hash', 'height'}) and ('tx', {'txid',
+'inputs': [(txid, vout)], 'outputs': [(address, amount)], 'addresses'}), where
+addresses are the cached addresses the transaction changed.
+
+Example:
+    subscriber = start_chain_subscriber("longpoll")  # or "tcp://127.0.0.1:28332"
+"""
+
+import hashlib
+import queue
+import struct
+import threading
+import time
+from decimal import Decimal
+
+import base58
+
+import dealCard
+import getBalances
+import poolUtxos
+from rpcClient import JSONRPCException, get_rpc_client
+
+LONG_POLL_TIMEOUT = 60.0  # Seconds a waitfornewblock call waits before it is repeated
+MEMPOOL_POLL_INTERVAL = 10.0  # Seconds between mempool diffs of LongPollSource
+RECONNECT_DELAY = 5.0  # Seconds before a failed source is tried again
+WATCH_TIMEOUT = 24 * 60 * 60  # Seconds a watched transaction may stay unconfirmed before it counts as dropped
+RPC_INVALID_ADDRESS_OR_KEY = -5  # gettransaction error for a transaction the wallet does not know
+ADDRESS_VERSION = b'\x1E'  # luckycoin mainnet P2PKH, see cashOut.public_key_to_address
+
+def read_varint(data, offset):
+    """Return (value, offset after it) of the varint at offset."""
+    first = data[offset]
+    if first < 0xfd:
+        return first, offset + 1
+    size = {0xfd: 2, 0xfe: 4, 0xff: 8}[first]
+    return int.from_bytes(data[offset + 1:offset + 1 + size], 'little'), offset + 1 + size
+
+def address_for_script(script):
+    """Return the address of a P2PKH scriptPubKey, or None for any other script."""
+    if len(script) == 25 and script[:3] == b'\x76\xa9\x14' and script[23:] == b'\x88\xac':
+        return base58.b58encode_check(ADDRESS_VERSION + bytes(script[3:23])).decode('utf-8')
+    return None
+
+def decode_transaction(raw):
+    """Return the txid, spent (txid, vout) outpoints and (address, amount) outputs of a legacy raw transaction."""
+    data = memoryview(raw)
+    count, offset = read_varint(data, 4)
+    inputs = []
+    for _ in range(count):
+        txid = bytes(data[offset:offset + 32])[::-1].hex()
+        vout, = struct.unpack_from('<I', data, offset + 32)
+        script_size, offset = read_varint(data, offset + 36)
+        offset += script_size + 4  # scriptSig and sequence
+        inputs.append((txid, vout))
+    count, offset = read_varint(data, offset)
+    outputs = []
+    for _ in range(count):
+        amount, = struct.unpack_from('<Q', data, offset)
+        script_size, offset = read_varint(data, offset + 8)
+        outputs.append((address_for_script(data[offset:offset + script_size]), Decimal(amount) / Decimal('1e8')))
+        offset += script_size
+    txid = hashlib.sha256(hashlib.sha256(raw).digest()).digest()[::-1].hex()
+    return {'txid': txid, 'inputs': inputs, 'outputs': outputs}
+
+class LongPollSource:
+    """
+    New blocks from waitfornewblock on a thread of their own, new transactions from a
+    mempool diff every mempool_interval seconds.
+    """
+
+    def __init__(self, timeout=LONG_POLL_TIMEOUT, mempool_interval=MEMPOOL_POLL_INTERVAL):
+        self.timeout = timeout
+        self.mempool_interval = mempool_interval
+
+    def wait_for_blocks(self, tip, blocks, done):
+        rpc_connection = get_rpc_client()
+        try:
+            while not done.is_set():
+                block = rpc_connection.call("waitfornewblock", int(self.timeout * 1000), timeout=self.timeout + 30)
+                if block['hash'] != tip:
+                    tip = block['hash']
+                    blocks.put({'hash': block['hash'], 'height': block['height']})
+        except Exception as e:
+            blocks.put(e)
+
+    def events(self, stopped):
+        rpc_connection = get_rpc_client()
+        tip = rpc_connection.getbestblockhash()
+        mempool = set(rpc_connection.getrawmempool())
+        blocks = queue.Queue()
+        done = threading.Event()
+        threading.Thread(target=self.wait_for_blocks, args=(tip, blocks, done), name="chain-blocks", daemon=True).start()
+        try:
+            yield 'connected', None
+            next_diff = time.monotonic() + self.mempool_interval
+            while not stopped.is_set():
+                try:
+                    # Wake up at least every second to check for stop
+                    block = blocks.get(timeout=min(1.0, max(0.0, next_diff - time.monotonic())))
+                except queue.Empty:
+                    block = None
+                if isinstance(block, Exception):
+                    raise block
+                if block is not None:
+                    yield 'block', block
+                if time.monotonic() < next_diff:
+                    continue
+                next_diff = time.monotonic() + self.mempool_interval
+                current = set(rpc_connection.getrawmempool())
+                new = [txid for txid in current if txid not in mempool]
+                mempool = current
+                if new:
+                    raws = rpc_connection.gather([("getrawtransaction", [txid]) for txid in new], return_exceptions=True)
+                    for raw in raws:
+                        # A transaction mined or replaced since the mempool was listed is skipped
+                        if isinstance(raw, str):
+                            yield 'tx', decode_transaction(bytes.fromhex(raw))
+        finally:
+            done.set()  # The block thread exits once its pending call returns
+
+class ZmqSource:
+    """hashblock and rawtx notifications from the node's ZMQ publisher."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    def events(self, stopped):
+        import zmq
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        socket.setsockopt(zmq.RCVTIMEO, 1000)  # Wake up every second to check for stop
+        socket.setsockopt(zmq.SUBSCRIBE, b'hashblock')
+        socket.setsockopt(zmq.SUBSCRIBE, b'rawtx')
+        socket.connect(self.endpoint)
+        try:
+            yield 'connected', None
+            while not stopped.is_set():
+                try:
+                    topic, body, _ = socket.recv_multipart()
+                except zmq.Again:
+                    continue
+                if topic == b'hashblock':
+                    block_hash = body.hex()
+                    height = get_rpc_client().getblockheader(block_hash)['height']
+                    yield 'block', {'hash': block_hash, 'height': height}
+                elif topic == b'rawtx':
+                    yield 'tx', decode_transaction(body)
+        finally:
+            socket.close(0)
+
+class ChainSubscriber:
+    """Reads events from a source on a background thread and applies them to the game's caches."""
+
+    def __init__(self, source):
+        self.source = source
+        self.listeners = []  # callback(kind, data) for every event
+        self.watched = {}  # txid -> callbacks waiting for its first confirmation
+        self.watch_deadlines = {}  # txid -> time.monotonic() after which it counts as dropped
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def watch_transaction(self, txid, callback, timeout=WATCH_TIMEOUT):
+        """
+        Call callback(txid, True) from the subscriber thread once txid has a
+        confirmation, or callback(txid, False) once it was dropped instead.
+        """
+        with self.lock:
+            self.watched.setdefault(txid, []).append(callback)
+            self.watch_deadlines.setdefault(txid, time.monotonic() + timeout)
+
+    def set_push_updates(self, enabled):
+        # Caches only skip their own refreshes while events are actually arriving
+        getBalances.push_updates = enabled
+        poolUtxos.push_updates = enabled
+        if enabled:
+            # Events missed while disconnected are covered by one refetch
+            getBalances.invalidate_all()
+            poolUtxos.invalidate_all()
+
+    def handle(self, kind, data):
+        if kind == 'connected':
+            self.set_push_updates(True)
+            return
+        if kind == 'block':
+            getBalances.invalidate_all()
+            poolUtxos.invalidate_all()
+            dealCard.on_new_block(data['height'])
+            self.check_watched()
+        elif kind == 'tx':
+            data['addresses'] = getBalances.apply_transaction(data['txid'], data['inputs'], data['outputs'])
+        for listener in self.listeners:
+            try:
+                listener(kind, data)
+            except Exception as e:
+                print(f"Chain event listener failed: {e}")
+
+    def check_watched(self):
+        """Fire the callbacks of watched transactions that confirmed or were dropped."""
+        with self.lock:
+            txids = list(self.watched)
+        if not txids:
+            return
+        replies = get_rpc_client().gather([("gettransaction", [txid]) for txid in txids], return_exceptions=True)
+        now = time.monotonic()
+        for txid, reply in zip(txids, replies):
+            if isinstance(reply, JSONRPCException) and reply.error.get('code') == RPC_INVALID_ADDRESS_OR_KEY:
+                confirmed = False  # Evicted from the mempool and forgotten by the wallet
+            elif isinstance(reply, JSONRPCException):
+                print(f"Error checking transaction {txid}: {reply}")
+                continue
+            elif isinstance(reply, dict) and reply.get('confirmations', 0) > 0:
+                confirmed = True
+            elif isinstance(reply, dict) and (reply.get('confirmations', 0) < 0 or now > self.watch_deadlines[txid]):
+                confirmed = False  # Conflicted by a double spend, or stuck unconfirmed
+            else:
+                continue
+            with self.lock:
+                callbacks = self.watched.pop(txid, [])
+                self.watch_deadlines.pop(txid, None)
+            for callback in callbacks:
+                callback(txid, confirmed)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                for kind, data in self.source.events(self.stopped):
+                    self.handle(kind, data)
+            except Exception as e:
+                print(f"Chain event source failed: {e}")
+            self.set_push_updates(False)
+            self.stopped.wait(RECONNECT_DELAY)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="chain-events", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+chain_subscriber = None
+
+def get_chain_subscriber():
+    """Return the running subscriber, or None when chain events are not enabled."""
+    return chain_subscriber
+
+def start_chain_subscriber(source="longpoll"):
+    """Start the process-wide subscriber on "longpoll" or a ZMQ endpoint such as tcp://127.0.0.1:28332."""
+    global chain_subscriber
+    if chain_subscriber is None:
+        chain_subscriber = ChainSubscriber(LongPollSource() if source == "longpoll" else ZmqSource(source)).start()
+    return chain_subscriber
@@ -0,0 +1,232 @@
+"""
+coinSelection.py
+
+Chooses which pool UTXOs pay for a cash-out and what fee it pays. Fees come from the
+estimated serialized size of the signed transaction at a fee rate per kB, so a
+payout spending hundreds of inputs pays for its size and a one-input payout does
+not overpay.
+
+Strategies work on effective values (a UTXO's amount minus the fee its input adds):
+
+- branch_and_bound: searches for a set of inputs that pays the target with no change
+  output, within the cost of making change (the approach of Bitcoin Core's BnB)
+- minimize_inputs: the fewest inputs that cover the target, choosing the last input
+  so the change is as small as possible
+- largest_first: the biggest UTXOs until the target is covered
+
+select_coins tries branch_and_bound first and falls back to minimize_inputs, so a
+payout either avoids change entirely or uses few inputs and makes one small change
+output instead of splitting the pool further. Change below the dust threshold is
+left to the fee.
+
+The fee rate of cash-outs and consolidations is the feeperkb key of RPC.conf (lucky
+per 1000 bytes), DEFAULT_FEE_PER_KB when it is not set (see get_fee_per_kb).
+
+UTXOs can be any objects with an amount attribute in satoshis (cashOut.TxIn).
+"""
+
+from bisect import bisect_left
+from decimal import Decimal, InvalidOperation
+
+SATOSHIS_PER_LUCKY = 100_000_000
+# Lucky per 1000 bytes. The old fixed fee of 0.0225 lucky on a 1-input payout (226 to
+# 260 bytes) paid 0.087 to 0.1 lucky per kB, so this rate never pays less than it did
+DEFAULT_FEE_PER_KB = Decimal('0.1')
+DUST_THRESHOLD = 100_000  # Satoshis, smaller change is given to the fee (getBalances.DUST_AMOUNT)
+BNB_MAX_TRIES = 100_000  # Search steps before branch_and_bound gives up
+
+# Serialized sizes of a P2PKH transaction
+TX_OVERHEAD_SIZE = 4 + 4  # Version and locktime
+INPUT_SIZE = 32 + 4 + 1 + 1 + 72 + 1 + 33 + 4  # Outpoint, scriptSig (DER signature, compressed key), sequence
+OUTPUT_SIZE = 8 + 1 + 25  # Amount and P2PKH scriptPubKey
+
+class InsufficientFunds(Exception):
+    """The UTXOs cannot pay the target plus the fee."""
+
+class Selection:
+    """Inputs chosen for a payment, with the fee they pay and the change left over (both in satoshis)."""
+    __slots__ = ('inputs', 'fee', 'change', 'strategy')
+
+    def __init__(self, inputs, fee, change, strategy):
+        self.inputs = inputs
+        self.fee = fee
+        self.change = change
+        self.strategy = strategy
+
+    @property
+    def total(self):
+        return sum(utxo.amount for utxo in self.inputs)
+
+    def __repr__(self):
+        return f"Selection({self.strategy}: {len(self.inputs)} inputs, fee {self.fee}, change {self.change})"
+
+def get_fee_per_kb():
+    """Fee rate in lucky per kB: feeperkb from RPC.conf, or DEFAULT_FEE_PER_KB."""
+    from rpcClient import load_rpc_config
+    try:
+        value = load_rpc_config().get('feeperkb')
+    except (FileNotFoundError, ValueError):
+        return DEFAULT_FEE_PER_KB
+    if not value:
+        return DEFAULT_FEE_PER_KB
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"Invalid feeperkb in RPC.conf: {value}")
+
+def varint_size(n):
+    return 1 if n < 0xfd else 3 if n <= 0xffff else 5 if n <= 0xffffffff else 9
+
+def estimate_size(input_count, output_count):
+    """Upper estimate of the signed size in bytes of a P2PKH transaction."""
+    return (TX_OVERHEAD_SIZE + varint_size(input_count) + input_count * INPUT_SIZE
+            + varint_size(output_count) + output_count * OUTPUT_SIZE)
+
+def fee_for_size(size, fee_per_kb=DEFAULT_FEE_PER_KB):
+    """Fee in satoshis for size bytes, rounded up."""
+    rate = int(fee_per_kb * SATOSHIS_PER_LUCKY)
+    return -(-size * rate // 1000)
+
+def estimate_fee(input_count, output_count, fee_per_kb=DEFAULT_FEE_PER_KB):
+    return fee_for_size(estimate_size(input_count, output_count), fee_per_kb)
+
+def finish_selection(inputs, target, output_count, fee_per_kb, strategy):
+    """Work out the fee and change of a chosen input set, dropping change that would be dust."""
+    total = sum(utxo.amount for utxo in inputs)
+    fee = estimate_fee(len(inputs), output_count, fee_per_kb)
+    if total < target + fee:
+        raise InsufficientFunds(f"Inputs pay {total}, need {target + fee}")
+    change_fee = estimate_fee(len(inputs), output_count + 1, fee_per_kb) - fee
+    change = total - target - fee - change_fee
+    if change < DUST_THRESHOLD:
+        # Not worth an output, the excess goes to the fee
+        return Selection(inputs, total - target, 0, strategy)
+    return Selection(inputs, fee + change_fee, change, strategy)
+
+def effective_values(utxos, fee_per_kb):
+    """(effective value, utxo) pairs, largest first, skipping UTXOs worth less than their input fee."""
+    input_fee = fee_for_size(INPUT_SIZE, fee_per_kb)
+    pairs = [(utxo.amount - input_fee, utxo) for utxo in utxos if utxo.amount > input_fee]
+    pairs.sort(key=lambda pair: -pair[0])
+    return pairs
+
+def base_fee(output_count, fee_per_kb, max_inputs):
+    """Fee of everything but the inputs, with the input count varint sized for max_inputs."""
+    return fee_for_size(estimate_size(0, output_count) - 1 + varint_size(max_inputs), fee_per_kb)
+
+def branch_and_bound(utxos, target, output_count=2, fee_per_kb=DEFAULT_FEE_PER_KB):
+    """
+    Depth-first search over the UTXOs, largest first, for a set whose effective value
+    lies in [target + fees, target + fees + cost of change], so the payment needs no
+    change output. Among the matches found it keeps the one wasting the least.
+    Returns None when no match is found within BNB_MAX_TRIES steps.
+    """
+    pairs = effective_values(utxos, fee_per_kb)
+    values = [value for value, _ in pairs]
+    low = target + base_fee(output_count, fee_per_kb, len(pairs))
+    # Making change costs its output now and spending it later
+    cost_of_change = fee_for_size(OUTPUT_SIZE + INPUT_SIZE, fee_per_kb)
+    high = low + cost_of_change
+
+    available = sum(values)  # Effective value of the UTXOs not decided yet
+    if available < low:
+        return None
+
+    best = None
+    best_excess = None
+    included = []  # Include (True) or omit (False) decision for each UTXO, largest first
+    total = 0
+    for _ in range(BNB_MAX_TRIES):
+        backtrack = False
+        if total + available < low or total > high:
+            # The target cannot be reached from here, or the window was overshot
+            backtrack = True
+        elif total >= low:
+            excess = total - low
+            if best_excess is None or excess < best_excess:
+                best, best_excess = [i for i, include in enumerate(included) if include], excess
+                if excess == 0:
+                    break
+            backtrack = True
+
+        if backtrack:
+            # Walk back to the last included UTXO and try the branch that omits it
+            while included and not included[-1]:
+                included.pop()
+                available += values[len(included)]
+            if not included:
+                break
+            included[-1] = False
+            total -= values[len(included) - 1]
+            continue
+
+        value = values[len(included)]
+        available -= value
+        if included and not included[-1] and value == values[len(included) - 1]:
+            # Including a UTXO equal to the one just omitted repeats a branch already searched
+            included.append(False)
+        else:
+            included.append(True)
+            total += value
+
+    if best is None:
+        return None
+    inputs = [pairs[i][1] for i in best]
+    fee = sum(utxo.amount for utxo in inputs) - target
+    return Selection(inputs, fee, 0, 'branch_and_bound')
+
+def largest_first(utxos, target, output_count=2, fee_per_kb=DEFAULT_FEE_PER_KB):
+    """Spend the largest UTXOs until the target and the fee are covered."""
+    pairs = effective_values(utxos, fee_per_kb)
+    needed = target + base_fee(output_count + 1, fee_per_kb, len(pairs))
+    inputs = []
+    total = 0
+    for value, utxo in pairs:
+        inputs.append(utxo)
+        total += value
+        if total >= needed:
+            return finish_selection(inputs, target, output_count, fee_per_kb, 'largest_first')
+    raise InsufficientFunds(f"UTXOs worth {total} cannot pay {needed}")
+
+def minimize_inputs(utxos, target, output_count=2, fee_per_kb=DEFAULT_FEE_PER_KB):
+    """
+    Use the fewest inputs that cover the target: the largest UTXOs but the last, then
+    the smallest UTXO that completes the payment, which keeps the change small.
+    """
+    pairs = effective_values(utxos, fee_per_kb)
+    needed = target + base_fee(output_count + 1, fee_per_kb, len(pairs))
+    total = 0
+    for count, (value, _) in enumerate(pairs, 1):
+        total += value
+        if total >= needed:
+            break
+    else:
+        raise InsufficientFunds(f"UTXOs worth {total} cannot pay {needed}")
+
+    # The largest count - 1 UTXOs, then the smallest of the rest that still covers needed
+    head = [utxo for _, utxo in pairs[:count - 1]]
+    missing = needed - (total - pairs[count - 1][0])
+    ascending = [value for value, _ in reversed(pairs[count - 1:])]
+    position = bisect_left(ascending, missing)
+    last = pairs[len(pairs) - 1 - position][1]
+    return finish_selection(head + [last], target, output_count, fee_per_kb, 'minimize_inputs')
+
+STRATEGIES = {
+    'branch_and_bound': branch_and_bound,
+    'minimize_inputs': minimize_inputs,
+    'largest_first': largest_first,
+}
+
+def select_coins(utxos, target, output_count=2, fee_per_kb=DEFAULT_FEE_PER_KB, strategy=None):
+    """
+    Choose the inputs paying target satoshis to output_count outputs (change not
+    counted). With no strategy, a changeless branch_and_bound match is preferred and
+    minimize_inputs is the fallback.
+    """
+    if strategy is not None:
+        selection = STRATEGIES[strategy](utxos, target, output_count, fee_per_kb)
+        if selection is None:
+            raise InsufficientFunds(f"{strategy} found no match for {target}")
+        return selection
+    return (branch_and_bound(utxos, target, output_count, fee_per_kb)
+            or minimize_inputs(utxos, target, output_count, fee_per_kb))
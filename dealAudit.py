@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+"""
+dealAudit.py
+
+Append-only audit log of every draw made for a deal, and a verifier that re-checks
+the log against the block hashes, so any deal can be proven fair afterwards.
+
+A deal draws (height, offset) pairs: a block height and the start of a 3-hex-digit
+window in its block hash. dealCard.deal_card may reject draws and draw again, and
+the suit sampler finds an accepted draw at once; either way every draw is logged,
+rejected ones included, as a fixed RECORD of
+
+    time (ms), deal id, height, offset, outcome, block hash prefix, session, wager
+
+where outcome is the deck card index (0-51), a jackpot (52-55) or REJECTED. Draws of
+one deal share its deal id, the last one is the card that was dealt. The file starts
+with a HEADER holding the format version and record size.
+
+The game server, the clients and the verifier's self-test may append to the same log
+at once, so their records interleave. Deal ids are therefore unique across processes:
+the upper 32 bits are a random prefix drawn when a process opens the log and the lower
+32 bits count its deals. The verifier groups the draws by deal id.
+
+Records are written to the file as soon as a deal finishes, and fsynced in batches
+every fsync_interval seconds, so a crash of the process loses nothing and a power
+failure at most the last interval.
+
+The verifier memory-maps the log and the block hash store (see blockStore) and
+recomputes every outcome from the hashes, spread over all cores in chunks of
+VERIFY_CHUNK_SIZE records. A record whose hash prefix differs from the stored hash
+was dealt from a block that was since replaced (a reorg) or was altered.
+
+Example:
+    python dealAudit.py                       # verify the log next to RPC.conf
+    python dealAudit.py dealaudit.dat --sync  # sync the block store first
+"""
+
+import argparse
+import atexit
+import hashlib
+import os
+import struct
+import sys
+import threading
+import time
+import uuid
+
+from rpcClient import get_config_path
+
+AUDIT_MAGIC = b'LSDA'
+AUDIT_VERSION = 1
+HEADER = struct.Struct("<4sHH8x")  # magic, version, record size
+RECORD = struct.Struct("<QQIBB8s16sI")  # time ms, deal id, height, offset, outcome, hash prefix, session, wager
+HASH_PREFIX_SIZE = 8  # Bytes of the block hash kept per record
+REJECTED = 0xFF  # Outcome of a draw whose window value deals no card
+ACCEPTED_LIMIT = 4056  # Window values below this deal deck cards, see dealCard.deal_card
+JACKPOT_VALUES = (4057, 4060)  # Window values dealing the jackpot cards
+MAX_OFFSET = 61  # Last window start in a 64 hex digit block hash
+FSYNC_INTERVAL = 1.0  # Seconds between batched fsyncs
+DEAL_COUNTER_BITS = 32  # Low bits of a deal id counting the deals of one process
+VERIFY_CHUNK_SIZE = 1_000_000  # Records per verifier task
+MAX_REPORTED = 20  # Failing records listed per kind of failure
+
+def outcome_for_value(value):
+    """Outcome code of a window value: deck card index, jackpot (52-55) or REJECTED."""
+    if value < ACCEPTED_LIMIT:
+        return value % 52
+    if JACKPOT_VALUES[0] <= value <= JACKPOT_VALUES[1]:
+        return 52 + value - JACKPOT_VALUES[0]
+    return REJECTED
+
+def session_bytes(session_id):
+    """16 bytes identifying a session: the UUID of gameEngine session ids, a hash of any other id."""
+    if not session_id:
+        return bytes(16)
+    try:
+        return uuid.UUID(hex=session_id).bytes
+    except ValueError:
+        return hashlib.sha256(session_id.encode()).digest()[:16]
+
+def draw_record(deal_id, height, offset, value, block_hash, session_id=None, wager=0):
+    """Record tuple of one draw, block_hash as hex or raw bytes."""
+    if isinstance(block_hash, str):
+        block_hash = bytes.fromhex(block_hash[:HASH_PREFIX_SIZE * 2])
+    return (int(time.time() * 1000), deal_id, height, offset, outcome_for_value(value),
+            bytes(block_hash[:HASH_PREFIX_SIZE]), session_bytes(session_id), min(int(wager), 0xFFFFFFFF))
+
+def new_deal_prefix():
+    """Random upper bits for the deal ids of one process."""
+    return int.from_bytes(os.urandom(8), 'little') >> DEAL_COUNTER_BITS
+
+class DealAuditLog:
+    """Appends draw records to the log file, fsyncing them in batches from a background thread."""
+
+    def __init__(self, path, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        self.deal_prefix = new_deal_prefix()
+        self.next_deal = 0
+        self.dirty = False
+        size = os.fstat(self.fd).st_size
+        if size < HEADER.size:
+            os.ftruncate(self.fd, 0)
+            os.write(self.fd, HEADER.pack(AUDIT_MAGIC, AUDIT_VERSION, RECORD.size))
+            os.fsync(self.fd)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            magic, version, record_size = HEADER.unpack(os.read(self.fd, HEADER.size))
+            if magic != AUDIT_MAGIC or version != AUDIT_VERSION or record_size != RECORD.size:
+                os.close(self.fd)
+                raise ValueError(f"{path} is not a version {AUDIT_VERSION} deal audit log")
+            # Drop a partially written record left behind by a crash
+            count = (size - HEADER.size) // RECORD.size
+            os.ftruncate(self.fd, HEADER.size + count * RECORD.size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(fsync_interval,), name="deal-audit", daemon=True)
+        self.thread.start()
+
+    def new_deal(self):
+        """Return the id for the draws of a new deal, unique among the processes sharing the log."""
+        with self.lock:
+            if self.next_deal >> DEAL_COUNTER_BITS:
+                self.deal_prefix = new_deal_prefix()
+                self.next_deal = 0
+            deal_id = self.deal_prefix << DEAL_COUNTER_BITS | self.next_deal
+            self.next_deal += 1
+            return deal_id
+
+    def append(self, records):
+        """Write record tuples (see draw_record) with one write, durable after the next fsync."""
+        if not records:
+            return
+        data = b''.join(RECORD.pack(*record) for record in records)
+        with self.lock:
+            os.write(self.fd, data)
+            self.dirty = True
+
+    def sync(self):
+        with self.lock:
+            if not self.dirty or self.fd is None:
+                return
+            self.dirty = False
+            fd = self.fd
+        os.fsync(fd)
+
+    def _run(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.sync()
+            except OSError as e:
+                print(f"Could not sync the deal audit log: {e}")
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.sync()
+        with self.lock:
+            os.close(self.fd)
+            self.fd = None
+
+audit_log = None
+audit_log_lock = threading.Lock()
+# Overrides the default log location next to RPC.conf when set
+audit_log_path = None
+
+def get_audit_log_path():
+    if audit_log_path is not None:
+        return audit_log_path
+    return os.path.join(os.path.dirname(get_config_path()), 'dealaudit.dat')
+
+def get_audit_log():
+    """Open the process-wide audit log on first use."""
+    global audit_log
+    with audit_log_lock:
+        if audit_log is None:
+            audit_log = DealAuditLog(get_audit_log_path())
+            atexit.register(audit_log.sync)
+        return audit_log
+
+def close_audit_log():
+    global audit_log
+    with audit_log_lock:
+        if audit_log is not None:
+            audit_log.close()
+            audit_log = None
+
+def record_dtype():
+    """NumPy dtype of RECORD, for memory-mapping the log."""
+    import numpy as np
+    return np.dtype([
+        ('time', '<u8'), ('deal', '<u8'), ('height', '<u4'), ('offset', 'u1'), ('outcome', 'u1'),
+        ('prefix', 'u1', (HASH_PREFIX_SIZE,)), ('session', 'u1', (16,)), ('wager', '<u4'),
+    ])
+
+def read_records(path):
+    """Memory-map the records of a log as a structured array."""
+    import numpy as np
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size or HEADER.unpack(header) != (AUDIT_MAGIC, AUDIT_VERSION, RECORD.size):
+        raise ValueError(f"{path} is not a version {AUDIT_VERSION} deal audit log")
+    count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+    if not count:
+        return np.empty(0, dtype=record_dtype())
+    return np.memmap(path, dtype=record_dtype(), mode='r', offset=HEADER.size, shape=(count,))
+
+def verify_chunk(task):
+    """Verify records [start, end) of a log against a block hash store, returning counts and failing indices."""
+    import numpy as np
+    from blockStore import RECORD_SIZE
+    from dealCard import window_digits
+    log_path, store_path, start, end = task
+    records = read_records(log_path)[start:end]
+    stored_count = os.path.getsize(store_path) // RECORD_SIZE if os.path.exists(store_path) else 0
+    if stored_count:
+        hashes = np.memmap(store_path, dtype=np.uint8, mode='r', shape=(stored_count, RECORD_SIZE))
+    else:
+        hashes = np.empty((0, RECORD_SIZE), dtype=np.uint8)
+
+    heights = records['height'].astype(np.int64)
+    offsets = records['offset'].astype(np.int64)
+    known = np.flatnonzero(heights < stored_count)
+    rows = hashes[heights[known]]
+    bad_offset = offsets[known] > MAX_OFFSET
+    values = window_digits(rows, np.minimum(offsets[known], MAX_OFFSET))
+    expected = np.full(len(known), REJECTED, dtype=np.uint8)
+    regular = values < ACCEPTED_LIMIT
+    jackpot = (values >= JACKPOT_VALUES[0]) & (values <= JACKPOT_VALUES[1])
+    expected[regular] = values[regular] % 52
+    expected[jackpot] = 52 + values[jackpot] - JACKPOT_VALUES[0]
+    outcome_bad = bad_offset | (expected != records['outcome'][known])
+    prefix_bad = (rows[:, :HASH_PREFIX_SIZE] != records['prefix'][known]).any(axis=1)
+    return {
+        'records': len(records),
+        'unverified': len(records) - len(known),
+        'outcome_mismatches': (start + known[outcome_bad][:MAX_REPORTED]).tolist(),
+        'outcome_mismatch_count': int(outcome_bad.sum()),
+        'hash_mismatches': (start + known[prefix_bad][:MAX_REPORTED]).tolist(),
+        'hash_mismatch_count': int(prefix_bad.sum()),
+        'outcomes': np.bincount(records['outcome'], minlength=256),
+    }
+
+def verify_log(log_path, store_path, workers=None):
+    """Verify a whole log in parallel, returning the merged verify_chunk results."""
+    import numpy as np
+    from multiprocessing import Pool
+    count = len(read_records(log_path))
+    tasks = [(log_path, store_path, start, min(start + VERIFY_CHUNK_SIZE, count))
+             for start in range(0, count, VERIFY_CHUNK_SIZE)]
+    totals = {
+        'records': 0, 'unverified': 0, 'outcome_mismatches': [], 'outcome_mismatch_count': 0,
+        'hash_mismatches': [], 'hash_mismatch_count': 0, 'outcomes': np.zeros(256, dtype=np.int64),
+    }
+    with Pool(workers or os.cpu_count()) as pool:
+        for result in pool.imap_unordered(verify_chunk, tasks):
+            for key, value in result.items():
+                totals[key] = totals[key] + value
+    totals['outcome_mismatches'] = sorted(totals['outcome_mismatches'])[:MAX_REPORTED]
+    totals['hash_mismatches'] = sorted(totals['hash_mismatches'])[:MAX_REPORTED]
+    totals.update(group_deals(read_records(log_path)[:count]))
+    return totals
+
+def group_deals(records):
+    """
+    Group the draws of interleaved processes by deal id. The last draw of a deal is the
+    card dealt; a deal ending in a rejected draw was cut short by an error.
+    """
+    import numpy as np
+    order = np.argsort(records['deal'], kind='stable')
+    deals = records['deal'][order]
+    last = np.flatnonzero(np.append(deals[1:] != deals[:-1], True)) if len(deals) else np.empty(0, dtype=np.int64)
+    dealt = records['outcome'][order[last]]
+    unfinished = deals[last][dealt == REJECTED]
+    return {
+        'deals': len(last),
+        'dealt': np.bincount(dealt, minlength=256),
+        'unfinished': [int(deal) for deal in unfinished[:MAX_REPORTED]],
+        'unfinished_count': len(unfinished),
+    }
+
+def print_report(totals, elapsed):
+    from dealCard import suits
+    outcomes = totals['outcomes']
+    print(f"Verified {totals['records'] - totals['unverified']} of {totals['records']} draws "
+          f"in {elapsed:.1f} s")
+    if totals['unverified']:
+        print(f"{totals['unverified']} draws are above the block store's tip, sync it with --sync")
+    drawn = outcomes[:52].reshape(4, 13).sum(axis=1)
+    print("Draws by suit: " + ", ".join(f"{suit} {count}" for suit, count in zip(suits, drawn)))
+    print(f"Jackpot draws: {int(outcomes[52:56].sum())}  Rejected draws: {int(outcomes[REJECTED])}")
+    dealt = totals['dealt'][:52].reshape(4, 13).sum(axis=1)
+    print(f"Deals: {totals['deals']}  Cards dealt by suit: "
+          + ", ".join(f"{suit} {count}" for suit, count in zip(suits, dealt))
+          + f"  Jackpots dealt: {int(totals['dealt'][52:56].sum())}")
+    print(f"Unfinished deals (last draw rejected): {totals['unfinished_count']}")
+    for deal in totals['unfinished']:
+        print(f"    deal {deal:016x}")
+    print(f"Outcome mismatches: {totals['outcome_mismatch_count']}")
+    for index in totals['outcome_mismatches']:
+        print(f"    record {index}")
+    print(f"Block hash mismatches (reorged or altered): {totals['hash_mismatch_count']}")
+    for index in totals['hash_mismatches']:
+        print(f"    record {index}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify the deal audit log against the block hashes")
+    parser.add_argument('log', nargs='?', help="Audit log to verify (default: dealaudit.dat next to RPC.conf)")
+    parser.add_argument('--store', help="Block hash store (default: blockhashes.dat next to RPC.conf)")
+    parser.add_argument('--workers', type=int, help="Processes to verify with (default: all cores)")
+    parser.add_argument('--sync', action='store_true', help="Sync the block hash store with the node first")
+    args = parser.parse_args()
+
+    import dealCard
+    if args.store:
+        dealCard.block_store_path = args.store
+    if args.sync:
+        dealCard.get_block_store().sync()
+    start = time.perf_counter()
+    totals = verify_log(args.log or get_audit_log_path(), dealCard.get_block_store_path(), args.workers)
+    print_report(totals, time.perf_counter() - start)
+    if totals['outcome_mismatch_count'] or totals['hash_mismatch_count']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,9 @@
 import random
-import requests
-from requests.auth import HTTPBasicAuth
-import configparser
-from functools import lru_cache
+from collections import OrderedDict, deque
 import os
-import sys
-
-def get_config_path():
-    if getattr(sys, 'frozen', False):
-        # Running as compiled executable
-        return os.path.join(os.path.dirname(sys.executable), 'RPC.conf')
-    else:
-        # Running as script
-        return os.path.join(os.path.dirname(__file__), 'RPC.conf')
-
-# Read RPC configuration
-config = configparser.ConfigParser()
-config_path = get_config_path()
-if not os.path.exists(config_path):
-    raise FileNotFoundError(f"Config file not found: {config_path}")
-config.read(config_path)
-
-rpc_user = config['rpcconfig']['rpcuser']
-rpc_password = config['rpcconfig']['rpcpassword']
-rpc_host = config['rpcconfig']['rpchost']
-rpc_port = config['rpcconfig']['rpcport']
+from blockStore import BlockHashStore
+from dealAudit import draw_record, get_audit_log
+from rpcClient import get_config_path, get_rpc_client
 
 # Define the deck of cards
 suits = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
@@ -34,59 +13,222 @@ deck = [f"{rank} of {suit}" for suit in suits for rank in ranks]
 # Define jackpot cards
 jackpot_cards = [f"Jackpot of {suit}" for suit in suits]
 
-# Prepare RPC request
-url = f"http://{rpc_host}:{rpc_port}"
-headers = {'content-type': 'application/json'}
-auth = HTTPBasicAuth(rpc_user, rpc_password)
+# Card indices returned by deal_cards: deck cards first, then jackpot cards
+cards = deck + jackpot_cards
+
+# Maximum number of calls sent in a single JSON-RPC batch request
+RPC_BATCH_SIZE = 500
+# Number of random heights drawn and fetched together by deal_card
+DEAL_PREFETCH_SIZE = 32
+# Maximum number of block hashes kept in memory
+BLOCK_HASH_CACHE_SIZE = 10000
+
+# Block hash cache (height -> hash), oldest entries evicted first
+block_hash_cache = OrderedDict()
+# Random heights already drawn and prefetched for upcoming deals
+pending_heights = deque()
+# Chain height the pending heights were drawn for
+pending_heights_max = None
+
+# On-disk block hash store, opened on first use
+block_store = None
+# Overrides the default store location next to RPC.conf when set
+block_store_path = None
+# Chain height pushed by chainEvents, spares the getblockcount call of every deal
+pushed_block_count = None
 
-# Use a session for connection pooling
-session = requests.Session()
-session.auth = HTTPBasicAuth(rpc_user, rpc_password)
-session.headers.update({'content-type': 'application/json'})
+def rpc_batch(method, params_list):
+    """Call an RPC method once per params entry, batching the calls into JSON-RPC array payloads."""
+    results = []
+    for start in range(0, len(params_list), RPC_BATCH_SIZE):
+        chunk = params_list[start:start + RPC_BATCH_SIZE]
+        results.extend(get_rpc_client().batch([(method, params) for params in chunk]))
+    return results
+
+def cache_block_hash(height, block_hash):
+    """Store a block hash in the cache, evicting the oldest entry when full."""
+    block_hash_cache[height] = block_hash
+    block_hash_cache.move_to_end(height)
+    if len(block_hash_cache) > BLOCK_HASH_CACHE_SIZE:
+        block_hash_cache.popitem(last=False)
+
+def prefetch_block_hashes(heights):
+    """Fetch the hashes for the given heights in bulk, fill the hash cache and return {height: hash}."""
+    store = get_block_store()
+    hashes = {}
+    missing = []
+    for height in dict.fromkeys(heights):
+        block_hash = store.get(height) or block_hash_cache.get(height)
+        if block_hash is None:
+            missing.append(height)
+        else:
+            hashes[height] = block_hash
+    if missing:
+        fetched = rpc_batch("getblockhash", [[height] for height in missing])
+        for height, block_hash in zip(missing, fetched):
+            cache_block_hash(height, block_hash)
+            # Returned from here, not the cache: more heights than it holds would evict the first ones
+            hashes[height] = block_hash
+    return hashes
+
+def get_block_store_path():
+    if block_store_path is not None:
+        return block_store_path
+    return os.path.join(os.path.dirname(get_config_path()), 'blockhashes.dat')
+
+def get_block_store():
+    """Open the on-disk block hash store on first use."""
+    global block_store
+    if block_store is None:
+        block_store = BlockHashStore(
+            get_block_store_path(),
+            get_node_block_count,
+            lambda heights: rpc_batch("getblockhash", [[height] for height in heights]),
+        )
+    return block_store
+
+def start_block_sync():
+    """Sync the block hash store to the chain tip and keep it refreshed in the background."""
+    get_block_store().start_background_sync()
+
+def get_node_block_count():
+    return get_rpc_client().getblockcount()
 
-@lru_cache(maxsize=1)
 def get_block_count():
-    payload = {
-        "method": "getblockcount",
-        "params": [],
-        "jsonrpc": "2.0",
-        "id": 0,
-    }
-    response = session.post(url, json=payload)
-    return response.json()['result']
-
-@lru_cache(maxsize=10000)
+    """Return the chain height deals are drawn from, without RPC once the store holds the chain."""
+    store = get_block_store()
+    if store.count:
+        # While the store is catching up, heights it lacks are fetched over RPC
+        return max(store.tip_height, store.chain_height)
+    if pushed_block_count is not None:
+        return pushed_block_count
+    return get_node_block_count()
+
+def on_new_block(height):
+    """Called by chainEvents for every new tip: deals draw from it at once and the store syncs up to it."""
+    global pushed_block_count
+    pushed_block_count = height
+    get_block_store().notify_tip(height)
+
 def get_block_hash(height):
-    payload = {
-        "method": "getblockhash",
-        "params": [height],
-        "jsonrpc": "2.0",
-        "id": 0,
-    }
-    response = session.post(url, json=payload)
-    return response.json()['result']
+    block_hash = get_block_store().get(height)
+    if block_hash is not None:
+        return block_hash
+    if height in block_hash_cache:
+        block_hash_cache.move_to_end(height)
+        return block_hash_cache[height]
+    block_hash = get_rpc_client().getblockhash(height)
+    cache_block_hash(height, block_hash)
+    return block_hash
 
-def extract_random_digits(hash_data):
+def next_random_height(max_height):
+    """Return the next random height, prefetching a batch of heights in one request when none are pending."""
+    global pending_heights_max
+    if pending_heights_max != max_height:
+        # New blocks arrived, heights drawn from the old range are discarded
+        pending_heights.clear()
+        pending_heights_max = max_height
+    if not pending_heights:
+        heights = [random.randint(0, max_height) for _ in range(DEAL_PREFETCH_SIZE)]
+        prefetch_block_hashes(heights)
+        pending_heights.extend(heights)
+    return pending_heights.popleft()
+
+def random_window(hash_data):
+    """Return (offset, value) of a random 3-hex-digit window of a hex hash."""
     if len(hash_data) < 3:
         raise ValueError("Hash data too short")
     start = random.randint(0, len(hash_data) - 3)
-    return int(hash_data[start:start+3], 16)
+    return start, int(hash_data[start:start+3], 16)
 
-def deal_card():
+def extract_random_digits(hash_data):
+    return random_window(hash_data)[1]
+
+def deal_card(session_id=None, wager=0, deal_id=None):
+    """Deal a card, writing every draw (rejected ones too) to the deal audit log under deal_id."""
+    audit_log = get_audit_log()
+    if deal_id is None:
+        deal_id = audit_log.new_deal()
     max_height = get_block_count()
-    while True:
-        random_height = random.randint(0, max_height)
-        block_hash = get_block_hash(random_height)
-        
-        try:
-            digits = extract_random_digits(block_hash)
-        except ValueError:
-            continue
-        
-        if 4057 <= digits <= 4060:
-            return jackpot_cards[digits - 4057]
-        elif digits < 4056:
-            return deck[digits % 52]
+    draws = []
+    try:
+        while True:
+            random_height = next_random_height(max_height)
+            block_hash = get_block_hash(random_height)
+
+            try:
+                offset, digits = random_window(block_hash)
+            except ValueError:
+                continue
+            draws.append(draw_record(deal_id, random_height, offset, digits, block_hash, session_id, wager))
+
+            if 4057 <= digits <= 4060:
+                return jackpot_cards[digits - 4057]
+            elif digits < 4056:
+                return deck[digits % 52]
+    finally:
+        audit_log.append(draws)
+
+def hash_matrix(heights):
+    """Return a (len(heights), 32) uint8 array with the block hash of each height."""
+    import numpy as np
+    store_array = get_block_store().as_array()
+    rows = np.empty((len(heights), 32), dtype=np.uint8)
+    stored = heights < len(store_array)
+    rows[stored] = store_array[heights[stored]]
+    if not stored.all():
+        # Heights the store has not synced yet are fetched in one batch
+        missing = heights[~stored]
+        hashes = prefetch_block_hashes(np.unique(missing).tolist())
+        rows[~stored] = np.array(
+            [bytearray.fromhex(hashes[height]) for height in missing.tolist()], dtype=np.uint8
+        )
+    return rows
+
+def window_digits(rows, offsets):
+    """Value of the 3-hex-digit window starting at hex digit offsets[i] of each (n, 32) hash row."""
+    import numpy as np
+    index = np.arange(len(rows))
+    byte_index = offsets >> 1
+    first = rows[index, byte_index].astype(np.int16)
+    second = rows[index, byte_index + 1].astype(np.int16)
+    # Windows starting on a byte boundary take 1.5 bytes from the left,
+    # windows starting mid-byte take the low nibble and the next byte
+    return np.where(
+        offsets & 1,
+        ((first & 0xF) << 8) | second,
+        (first << 4) | (second >> 4),
+    )
+
+def deal_cards(n, rng=None):
+    """
+    Deal n cards in one vectorized pass and return their indices into cards.
+
+    Each card follows deal_card exactly: a uniform height, a uniform 3-hex-digit
+    window of its block hash, and redraws for the values deal_card rejects.
+    """
+    import numpy as np
+    if rng is None:
+        rng = np.random.default_rng()
+    max_height = get_block_count()
+    result = np.empty(n, dtype=np.int8)
+    remaining = np.arange(n)
+    while len(remaining):
+        count = len(remaining)
+        heights = rng.integers(0, max_height, size=count, endpoint=True)
+        # 64 hex digits per hash give 62 possible 3-digit windows
+        offsets = rng.integers(0, 62, size=count)
+        digits = window_digits(hash_matrix(heights), offsets)
+        jackpot = (digits >= 4057) & (digits <= 4060)
+        regular = digits < 4056
+        result[remaining[regular]] = digits[regular] % 52
+        result[remaining[jackpot]] = len(deck) + digits[jackpot] - 4057
+        remaining = remaining[~(regular | jackpot)]
+    return result
+
+def card_names(indices):
+    """Convert card indices from deal_cards into card names."""
+    return [cards[index] for index in indices]
 
 if __name__ == "__main__":
     result = deal_card()
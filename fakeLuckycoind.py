@@ -0,0 +1,733 @@
+#!/usr/bin/env python3
+
+"""
+fakeLuckycoind.py
+
+Synthetic luckycoind for offline testing and benchmarking. It serves the JSON-RPC
+calls the game makes (block hashes, wallet UTXOs, buy-in sends and cash-out
+broadcasts) over HTTP/1.1 keep-alive, including JSON-RPC batches, from state that is
+generated from a seed:
+
+- a chain of any height whose block hashes are computed on demand, so a 5M block
+  chain costs no memory; mining and reorgs can be triggered for tests
+- a wallet of player addresses with a configurable number of UTXOs each, some of
+  them watch-only, plus extra funded addresses (for example the pool address)
+- a mempool: sendrawtransaction decodes the raw transaction cashOut builds, checks
+  its inputs, amounts, P2PKH scripts and (optionally) ECDSA signatures, then spends
+  the inputs and adds the outputs as unconfirmed UTXOs
+- waitfornewblock long-polling and getrawtransaction/gettransaction lookups, so
+  chainEvents can subscribe to the stand-in like to a node
+
+Every HTTP request can be delayed by a fixed latency plus random jitter to mimic a
+remote node. The server reads rpcuser, rpcpassword and rpcport from RPC.conf by
+default, so the game talks to it without any change.
+
+Example:
+    python fakeLuckycoind.py --height 5000000 --addresses 200 --utxos 50 \\
+        --fund DPoolAddress:500 --latency 2 --jitter 1
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import inspect
+import json
+import random
+import struct
+import threading
+import time
+from decimal import Decimal
+
+import base58
+from ecdsa import BadSignatureError, SECP256k1, VerifyingKey, util
+from ecdsa.errors import MalformedPointError
+
+from rpcClient import load_rpc_config
+
+DEFAULT_HEIGHT = 5_000_000
+DEFAULT_PORT = 22555
+ADDRESS_VERSION = 0x1E  # luckycoin mainnet P2PKH, see cashOut.public_key_to_address
+COIN = 100_000_000  # Satoshis per lucky
+MAX_MONEY = 100_000_000_000 * COIN
+WALLET_FEE = 2_250_000  # Fee paid by sendtoaddress, in satoshis
+SIGHASH_ALL = 1
+
+class RPCError(Exception):
+    """Error returned to the client as a JSON-RPC error object."""
+
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+        super().__init__(f"{code}: {message}")
+
+def sha256d(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+def hash160(data):
+    return hashlib.new('ripemd160', hashlib.sha256(data).digest()).digest()
+
+def address_from_hash160(pubkey_hash):
+    return base58.b58encode_check(bytes([ADDRESS_VERSION]) + pubkey_hash).decode()
+
+def script_for_address(address):
+    """Return the P2PKH scriptPubKey for an address, raising RPCError if it is invalid."""
+    try:
+        decoded = base58.b58decode_check(address)
+    except ValueError:
+        raise RPCError(-5, f"Invalid luckycoin address: {address}")
+    if len(decoded) != 21 or decoded[0] != ADDRESS_VERSION:
+        raise RPCError(-5, f"Invalid luckycoin address: {address}")
+    return b'\x76\xa9\x14' + decoded[1:] + b'\x88\xac'
+
+def address_for_script(script):
+    """Return the address paid by a P2PKH scriptPubKey, or None for any other script."""
+    if len(script) == 25 and script[:3] == b'\x76\xa9\x14' and script[23:] == b'\x88\xac':
+        return address_from_hash160(script[3:23])
+    return None
+
+def to_lucky(satoshis):
+    return Decimal(satoshis) / COIN
+
+def to_satoshis(amount):
+    return int(Decimal(str(amount)) * COIN)
+
+class TransactionReader:
+    """Cursor over a raw transaction, raising RPCError(-22) on truncated data."""
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, size):
+        if self.offset + size > len(self.data):
+            raise RPCError(-22, "TX decode failed")
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def read_int(self, fmt):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def read_varint(self):
+        prefix = self.read(1)[0]
+        if prefix < 0xfd:
+            return prefix
+        return self.read_int({0xfd: '<H', 0xfe: '<I', 0xff: '<Q'}[prefix])
+
+def parse_transaction(raw):
+    """Decode a legacy (non-segwit) raw transaction into a dict."""
+    reader = TransactionReader(raw)
+    tx = {'version': reader.read_int('<I'), 'inputs': [], 'outputs': []}
+    for _ in range(reader.read_varint()):
+        tx['inputs'].append({
+            'txid': reader.read(32)[::-1].hex(),
+            'vout': reader.read_int('<I'),
+            'scriptSig': reader.read(reader.read_varint()),
+            'sequence': reader.read_int('<I'),
+        })
+    for _ in range(reader.read_varint()):
+        tx['outputs'].append({
+            'amount': reader.read_int('<Q'),
+            'scriptPubKey': reader.read(reader.read_varint()),
+        })
+    tx['locktime'] = reader.read_int('<I')
+    if reader.offset != len(raw):
+        raise RPCError(-22, "TX decode failed")
+    return tx
+
+def varint(n):
+    if n < 0xfd:
+        return struct.pack('<B', n)
+    elif n <= 0xffff:
+        return b'\xfd' + struct.pack('<H', n)
+    elif n <= 0xffffffff:
+        return b'\xfe' + struct.pack('<I', n)
+    else:
+        return b'\xff' + struct.pack('<Q', n)
+
+def serialize_transaction(outpoints, outputs):
+    """Serialize an unsigned legacy transaction spending outpoints to (scriptPubKey, amount) outputs."""
+    raw = struct.pack('<I', 1) + varint(len(outpoints))
+    for txid, vout in outpoints:
+        raw += bytes.fromhex(txid)[::-1] + struct.pack('<I', vout) + b'\x00' + struct.pack('<I', 0xffffffff)
+    raw += varint(len(outputs))
+    for script, amount in outputs:
+        raw += struct.pack('<Q', amount) + varint(len(script)) + script
+    return raw + struct.pack('<I', 0)
+
+def signature_hash(tx, input_index, script_code, hash_type):
+    """Legacy sighash: the transaction with only input_index carrying script_code."""
+    parts = [struct.pack('<I', tx['version']), varint(len(tx['inputs']))]
+    for index, txin in enumerate(tx['inputs']):
+        script = script_code if index == input_index else b''
+        parts += [bytes.fromhex(txin['txid'])[::-1], struct.pack('<I', txin['vout']),
+                  varint(len(script)), script, struct.pack('<I', txin['sequence'])]
+    parts.append(varint(len(tx['outputs'])))
+    for txout in tx['outputs']:
+        parts += [struct.pack('<Q', txout['amount']), varint(len(txout['scriptPubKey'])), txout['scriptPubKey']]
+    parts += [struct.pack('<I', tx['locktime']), struct.pack('<I', hash_type)]
+    return sha256d(b''.join(parts))
+
+def parse_script_sig(script_sig):
+    """Split a P2PKH scriptSig into its signature and public key pushes."""
+    pushes = []
+    offset = 0
+    while offset < len(script_sig):
+        size = script_sig[offset]
+        if size > 75 or offset + 1 + size > len(script_sig):
+            return None
+        pushes.append(script_sig[offset + 1:offset + 1 + size])
+        offset += 1 + size
+    return pushes if len(pushes) == 2 else None
+
+class SyntheticChain:
+    """Block hashes derived from the seed and the height, so any height costs nothing to store."""
+
+    def __init__(self, seed, height, leading_zero_digits=0):
+        self.seed = str(seed).encode()
+        self.height = height
+        self.zero_bytes = bytes(leading_zero_digits // 2)
+        self.zero_mask = 0x0F if leading_zero_digits % 2 else 0xFF
+        self.fork_heights = []  # First replaced height of every reorg
+
+    def block_hash(self, height):
+        if not 0 <= height <= self.height:
+            raise RPCError(-8, "Block height out of range")
+        # Every reorg covering this height gives it a new hash
+        fork = sum(1 for fork_height in self.fork_heights if fork_height <= height)
+        digest = sha256d(self.seed + struct.pack('<QI', height, fork))
+        digest = self.zero_bytes + bytes([digest[len(self.zero_bytes)] & self.zero_mask]) + digest[len(self.zero_bytes) + 1:]
+        return digest.hex()
+
+    def mine(self, blocks):
+        self.height += blocks
+        return [self.block_hash(height) for height in range(self.height - blocks + 1, self.height + 1)]
+
+    def reorg(self, depth):
+        """Replace the last depth blocks with different ones at the same heights."""
+        self.fork_heights.append(self.height - depth + 1)
+        return self.block_hash(self.height)
+
+class SyntheticWallet:
+    """UTXO set and mempool of the node's wallet and of any funded address."""
+
+    def __init__(self, chain, seed):
+        self.chain = chain
+        self.rng = random.Random(seed)
+        self.seed = str(seed).encode()
+        self.next_txid = 0
+        self.addresses = {}  # address -> {'ismine': ..., 'iswatchonly': ...}
+        self.utxos = {}  # (txid, vout) -> utxo dict, spent outputs are removed
+        self.by_address = {}  # address -> set of outpoints
+        self.received = {}  # address -> satoshis ever received
+        self.mempool = {}  # txid -> {'size', 'fee', 'time', 'outputs', 'raw'}
+        self.confirmed = {}  # txid -> height of the block that confirmed it
+
+    def new_txid(self):
+        self.next_txid += 1
+        return sha256d(self.seed + b'tx' + struct.pack('<Q', self.next_txid))[::-1].hex()
+
+    def new_address(self):
+        return address_from_hash160(hash160(self.seed + b'address' + struct.pack('<Q', len(self.addresses))))
+
+    def add_utxo(self, txid, vout, address, amount, height):
+        utxo = {
+            'txid': txid,
+            'vout': vout,
+            'address': address,
+            'scriptPubKey': script_for_address(address).hex(),
+            'amount': amount,
+            'height': height,  # None while the transaction is in the mempool
+        }
+        self.utxos[(txid, vout)] = utxo
+        self.by_address.setdefault(address, set()).add((txid, vout))
+        self.received[address] = self.received.get(address, 0) + amount
+        return utxo
+
+    def spend_utxo(self, outpoint):
+        utxo = self.utxos.pop(outpoint)
+        self.by_address[utxo['address']].discard(outpoint)
+        return utxo
+
+    def fund(self, address, count, amount=None, ismine=True, iswatchonly=False):
+        """Give address count confirmed UTXOs, of amount satoshis each or random amounts."""
+        script_for_address(address)
+        self.addresses.setdefault(address, {'ismine': ismine, 'iswatchonly': iswatchonly})
+        for _ in range(count):
+            value = amount or self.rng.randrange(COIN // 100, 100 * COIN)
+            self.add_utxo(self.new_txid(), self.rng.randrange(4), address, value,
+                          self.rng.randrange(1, max(2, self.chain.height)))
+
+    def populate(self, addresses, utxos_per_address, watch_only_fraction=0.0):
+        """Create the player addresses of the wallet, a fraction of them watch-only."""
+        for _ in range(addresses):
+            watch_only = self.rng.random() < watch_only_fraction
+            self.fund(self.new_address(), utxos_per_address, ismine=not watch_only, iswatchonly=watch_only)
+
+    def confirmations(self, utxo):
+        return 0 if utxo['height'] is None else self.chain.height - utxo['height'] + 1
+
+    def list_unspent(self, minconf, maxconf, addresses=None):
+        if addresses is None:
+            outpoints = [outpoint for address, info in self.addresses.items()
+                         if info['ismine'] or info['iswatchonly']
+                         for outpoint in self.by_address.get(address, ())]
+        else:
+            outpoints = []
+            for address in dict.fromkeys(addresses):
+                script_for_address(address)
+                outpoints.extend(self.by_address.get(address, ()))
+        result = []
+        for outpoint in outpoints:
+            utxo = self.utxos[outpoint]
+            confirmations = self.confirmations(utxo)
+            if minconf <= confirmations <= maxconf:
+                info = self.addresses.get(utxo['address'], {})
+                result.append({
+                    'txid': utxo['txid'],
+                    'vout': utxo['vout'],
+                    'address': utxo['address'],
+                    'scriptPubKey': utxo['scriptPubKey'],
+                    'amount': to_lucky(utxo['amount']),
+                    'confirmations': confirmations,
+                    'spendable': info.get('ismine', False),
+                    'solvable': info.get('ismine', False),
+                })
+        return result
+
+    def add_to_mempool(self, txid, raw, fee, outputs):
+        """Record an accepted transaction and add its outputs as unconfirmed UTXOs."""
+        for vout, (address, amount) in enumerate(outputs):
+            if address is not None:
+                self.add_utxo(txid, vout, address, amount, None)
+        self.mempool[txid] = {'size': len(raw), 'fee': fee, 'time': int(time.time()), 'outputs': len(outputs),
+                              'raw': raw.hex()}
+
+    def confirm_mempool(self, height):
+        """Put every mempool transaction into the block at height."""
+        for txid, entry in self.mempool.items():
+            for vout in range(entry['outputs']):
+                utxo = self.utxos.get((txid, vout))
+                if utxo is not None:
+                    utxo['height'] = height
+            self.confirmed[txid] = height
+        self.mempool.clear()
+
+class FakeLuckycoind:
+    """JSON-RPC server backed by a SyntheticChain and a SyntheticWallet."""
+
+    def __init__(self, height=DEFAULT_HEIGHT, seed=0, rpcuser=None, rpcpassword=None, latency=0.0, jitter=0.0,
+                 verify_signatures=True, min_relay_fee=Decimal('0.001'), leading_zero_digits=0, block_interval=0):
+        # latency and jitter are in milliseconds, min_relay_fee in lucky per kB
+        self.chain = SyntheticChain(seed, height, leading_zero_digits)
+        self.wallet = SyntheticWallet(self.chain, seed)
+        self.credentials = None
+        if rpcuser is not None:
+            self.credentials = base64.b64encode(f"{rpcuser}:{rpcpassword}".encode()).decode()
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.latency_rng = random.Random(seed)
+        self.verify_signatures = verify_signatures
+        self.min_relay_fee = to_satoshis(min_relay_fee)
+        self.block_interval = block_interval
+        self.lock = threading.Lock()  # Held while a call reads or changes the chain and wallet
+        self.confirmed_txids = set()
+        self.loop = None
+        self.listener = None
+        self.connections = set()  # Tasks serving open keep-alive connections
+        self.thread = None
+        self.stats = {'requests': 0, 'calls': 0}
+        self.block_waiters = set()  # Futures of waitfornewblock calls, resolved when the tip changes
+
+    # Server
+
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                headers, body = request
+                status, reply = await self.handle_request(headers, body)
+                payload = json.dumps(reply, default=float).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        return headers, await reader.readexactly(length)
+
+    async def handle_request(self, headers, body):
+        """Answer one HTTP request, returning (status, reply)."""
+        self.stats['requests'] += 1
+        delay = self.latency + self.latency_rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.credentials and headers.get('authorization') != f"Basic {self.credentials}":
+            return 401, None
+        try:
+            request = json.loads(body, parse_float=Decimal)
+        except ValueError:
+            return 500, {'result': None, 'error': {'code': -32700, 'message': "Parse error"}, 'id': None}
+        if isinstance(request, list):
+            # Batches always answer 200, each reply carries its own error
+            return 200, [await self.handle_call(call) for call in request]
+        reply = await self.handle_call(request)
+        if reply['error'] is None:
+            return 200, reply
+        return 404 if reply['error']['code'] == -32601 else 500, reply
+
+    async def handle_call(self, call):
+        self.stats['calls'] += 1
+        method = call.get('method', '')
+        params = call.get('params') or []
+        args, kwargs = (params, {}) if isinstance(params, list) else ([], params)
+        try:
+            func = getattr(self, 'rpc_' + method, None)
+            if func is None:
+                raise RPCError(-32601, "Method not found")
+            try:
+                inspect.signature(func).bind(*args, **kwargs)
+            except TypeError as e:
+                raise RPCError(-1, f"{method}: {e}")
+            if inspect.iscoroutinefunction(func):
+                # Long-polling calls wait on the event loop without holding the lock
+                result = await func(*args, **kwargs)
+            else:
+                with self.lock:
+                    result = func(*args, **kwargs)
+            return {'result': result, 'error': None, 'id': call.get('id')}
+        except RPCError as e:
+            return {'result': None, 'error': {'code': e.code, 'message': e.message}, 'id': call.get('id')}
+
+    def notify_block(self):
+        """Wake the waitfornewblock calls, callable from any thread."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wake_block_waiters)
+
+    def wake_block_waiters(self):
+        for waiter in self.block_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.block_waiters.clear()
+
+    async def mine_periodically(self):
+        while True:
+            await asyncio.sleep(self.block_interval)
+            with self.lock:
+                self.rpc_generate(1)
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.listener = await asyncio.start_server(self.handle_connection, host, port)
+        if self.block_interval:
+            asyncio.get_running_loop().create_task(self.mine_periodically())
+        return self.listener.sockets[0].getsockname()[1]
+
+    def start_in_thread(self, host='127.0.0.1', port=0):
+        """Serve from a daemon thread and return the listening port (port 0 picks a free one)."""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="fake-luckycoind", daemon=True)
+        self.thread.start()
+        return asyncio.run_coroutine_threadsafe(self.start(host, port), self.loop).result()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        async def close():
+            self.listener.close()
+            for task in list(self.connections):
+                task.cancel()
+            await self.listener.wait_closed()
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop = None
+
+    # Chain
+
+    def rpc_getblockcount(self):
+        return self.chain.height
+
+    def rpc_getblockhash(self, height):
+        return self.chain.block_hash(height)
+
+    def rpc_getbestblockhash(self):
+        return self.chain.block_hash(self.chain.height)
+
+    def rpc_getblockchaininfo(self):
+        return {'chain': 'main', 'blocks': self.chain.height, 'headers': self.chain.height,
+                'bestblockhash': self.chain.block_hash(self.chain.height)}
+
+    def rpc_generate(self, blocks):
+        """Mine blocks, confirming the mempool in the first one."""
+        first_height = self.chain.height + 1
+        hashes = self.chain.mine(blocks)
+        self.confirmed_txids.update(self.wallet.mempool)
+        self.wallet.confirm_mempool(first_height)
+        self.notify_block()
+        return hashes
+
+    def rpc_reorg(self, depth):
+        """Test helper: replace the last depth blocks, returning the new tip hash."""
+        tip = self.chain.reorg(depth)
+        self.notify_block()
+        return tip
+
+    async def rpc_waitfornewblock(self, timeout=0):
+        """Wait until the tip changes or timeout milliseconds passed (0 waits forever), then return the tip."""
+        tip = self.rpc_getbestblockhash()
+        while self.rpc_getbestblockhash() == tip:
+            waiter = asyncio.get_running_loop().create_future()
+            self.block_waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout / 1000 if timeout else None)
+            except asyncio.TimeoutError:
+                break
+        with self.lock:
+            return {'hash': self.rpc_getbestblockhash(), 'height': self.chain.height}
+
+    # Wallet
+
+    def rpc_importaddress(self, address, label="", rescan=True):
+        script_for_address(address)
+        info = self.wallet.addresses.setdefault(address, {'ismine': False, 'iswatchonly': True})
+        if not info['ismine']:
+            info['iswatchonly'] = True
+        return None
+
+    def rpc_validateaddress(self, address):
+        try:
+            script = script_for_address(address)
+        except RPCError:
+            return {'isvalid': False}
+        info = self.wallet.addresses.get(address, {})
+        return {
+            'isvalid': True,
+            'address': address,
+            'scriptPubKey': script.hex(),
+            'ismine': info.get('ismine', False),
+            'iswatchonly': info.get('iswatchonly', False),
+            'isscript': False,
+        }
+
+    def rpc_listunspent(self, minconf=1, maxconf=9999999, addresses=None):
+        return self.wallet.list_unspent(minconf, maxconf, addresses)
+
+    def rpc_getreceivedbyaddress(self, address, minconf=1):
+        script_for_address(address)
+        return to_lucky(self.wallet.received.get(address, 0))
+
+    def rpc_getbalance(self, account="*", minconf=1):
+        return sum((utxo['amount'] for utxo in self.wallet.list_unspent(minconf, 9999999) if utxo['spendable']),
+                   Decimal(0))
+
+    def rpc_sendtoaddress(self, address, amount, comment="", comment_to="", subtractfeefromamount=False):
+        """Pay address from the wallet's spendable UTXOs, largest first."""
+        recipient_script = script_for_address(address)
+        amount = to_satoshis(amount)
+        if amount <= 0:
+            raise RPCError(-3, "Invalid amount for send")
+        needed = amount if subtractfeefromamount else amount + WALLET_FEE
+        spendable = sorted(
+            (utxo for utxo in self.wallet.utxos.values()
+             if self.wallet.addresses.get(utxo['address'], {}).get('ismine') and utxo['height'] is not None),
+            key=lambda utxo: -utxo['amount'],
+        )
+        selected, total = [], 0
+        for utxo in spendable:
+            if total >= needed:
+                break
+            selected.append(utxo)
+            total += utxo['amount']
+        if total < needed:
+            raise RPCError(-6, "Insufficient funds")
+        for utxo in selected:
+            self.wallet.spend_utxo((utxo['txid'], utxo['vout']))
+        sent = amount - WALLET_FEE if subtractfeefromamount else amount
+        outputs = [(address_for_script(recipient_script), sent)]
+        if total - needed:
+            outputs.append((selected[0]['address'], total - needed))
+        raw = serialize_transaction([(utxo['txid'], utxo['vout']) for utxo in selected],
+                                    [(script_for_address(address), value) for address, value in outputs])
+        txid = sha256d(raw)[::-1].hex()
+        self.wallet.add_to_mempool(txid, raw, WALLET_FEE, outputs)
+        return txid
+
+    def rpc_gettransaction(self, txid):
+        """Confirmations of a transaction this node accepted (reorgs are not tracked)."""
+        if txid in self.wallet.mempool:
+            return {'txid': txid, 'confirmations': 0}
+        if txid in self.wallet.confirmed:
+            return {'txid': txid, 'confirmations': self.chain.height - self.wallet.confirmed[txid] + 1}
+        raise RPCError(-5, "Invalid or non-wallet transaction id")
+
+    # Mempool
+
+    def rpc_getrawmempool(self, verbose=False):
+        if verbose:
+            return {txid: {'size': entry['size'], 'fee': to_lucky(entry['fee']), 'time': entry['time']}
+                    for txid, entry in self.wallet.mempool.items()}
+        return list(self.wallet.mempool)
+
+    def rpc_getrawtransaction(self, txid, verbose=False):
+        """Raw hex of a mempool transaction, like a node without -txindex."""
+        entry = self.wallet.mempool.get(txid)
+        if entry is None:
+            raise RPCError(-5, "No such mempool transaction. Use -txindex to enable blockchain transaction queries.")
+        if verbose:
+            return {'txid': txid, 'hex': entry['raw'], 'size': entry['size']}
+        return entry['raw']
+
+    def rpc_getmempoolinfo(self):
+        return {'size': len(self.wallet.mempool),
+                'bytes': sum(entry['size'] for entry in self.wallet.mempool.values())}
+
+    def rpc_sendrawtransaction(self, hex_string, allowhighfees=False):
+        """Validate a raw transaction like luckycoind's mempool acceptance and broadcast it."""
+        try:
+            raw = bytes.fromhex(hex_string)
+        except ValueError:
+            raise RPCError(-22, "TX decode failed")
+        tx = parse_transaction(raw)
+        txid = sha256d(raw)[::-1].hex()
+        if txid in self.confirmed_txids:
+            raise RPCError(-27, "transaction already in block chain")
+        if txid in self.wallet.mempool:
+            raise RPCError(-26, "txn-already-in-mempool")
+        if not tx['inputs']:
+            raise RPCError(-26, "bad-txns-vin-empty")
+        if not tx['outputs']:
+            raise RPCError(-26, "bad-txns-vout-empty")
+
+        outpoints = [(txin['txid'], txin['vout']) for txin in tx['inputs']]
+        if len(set(outpoints)) != len(outpoints):
+            raise RPCError(-26, "bad-txns-inputs-duplicate")
+        spent = []
+        for outpoint in outpoints:
+            utxo = self.wallet.utxos.get(outpoint)
+            if utxo is None:
+                raise RPCError(-25, "Missing inputs")
+            spent.append(utxo)
+        output_total = 0
+        for txout in tx['outputs']:
+            if not 0 <= txout['amount'] <= MAX_MONEY:
+                raise RPCError(-26, "bad-txns-vout-toolarge")
+            output_total += txout['amount']
+        input_total = sum(utxo['amount'] for utxo in spent)
+        if output_total > input_total:
+            raise RPCError(-26, "bad-txns-in-belowout")
+        fee = input_total - output_total
+        if fee < self.min_relay_fee * len(raw) // 1000:
+            raise RPCError(-26, f"min relay fee not met, {fee} < {self.min_relay_fee * len(raw) // 1000}")
+
+        for index, (txin, utxo) in enumerate(zip(tx['inputs'], spent)):
+            self.check_input_script(tx, index, txin, bytes.fromhex(utxo['scriptPubKey']))
+
+        for outpoint in outpoints:
+            self.wallet.spend_utxo(outpoint)
+        outputs = [(address_for_script(txout['scriptPubKey']), txout['amount']) for txout in tx['outputs']]
+        self.wallet.add_to_mempool(txid, raw, fee, outputs)
+        return txid
+
+    def check_input_script(self, tx, index, txin, script_pubkey):
+        """Check a P2PKH scriptSig against the output it spends."""
+        pushes = parse_script_sig(txin['scriptSig'])
+        if pushes is None:
+            raise RPCError(-26, "mandatory-script-verify-flag-failed (Operation not valid with the current stack size)")
+        signature, public_key = pushes
+        if hash160(public_key) != script_pubkey[3:23]:
+            raise RPCError(-26, "mandatory-script-verify-flag-failed (Script failed an OP_EQUALVERIFY operation)")
+        if not self.verify_signatures:
+            return
+        if not signature or signature[-1] != SIGHASH_ALL:
+            raise RPCError(-26, "mandatory-script-verify-flag-failed (Signature hash type missing or not understood)")
+        digest = signature_hash(tx, index, script_pubkey, SIGHASH_ALL)
+        try:
+            key = VerifyingKey.from_string(public_key, curve=SECP256k1)
+            key.verify_digest(signature[:-1], digest, sigdecode=util.sigdecode_der)
+        except (BadSignatureError, MalformedPointError, util.UnexpectedDER):
+            raise RPCError(-26, "mandatory-script-verify-flag-failed (Signature must be zero for failed CHECK(MULTI)SIG operation)")
+
+    def rpc_stop(self):
+        self.loop.call_soon_threadsafe(self.listener.close)
+        return "Fake luckycoind stopping"
+
+def parse_fund(spec):
+    """Parse --fund address:count[:amount in lucky]."""
+    parts = spec.split(':')
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError(f"Invalid fund spec {spec}, expected address:count[:amount]")
+    amount = to_satoshis(parts[2]) if len(parts) == 3 else None
+    return parts[0], int(parts[1]), amount
+
+async def serve(node, host, port):
+    port = await node.start(host, port)
+    node.loop = asyncio.get_running_loop()
+    print(f"Fake luckycoind at height {node.chain.height} listening on {host}:{port}")
+    async with node.listener:
+        try:
+            await node.listener.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+def main():
+    try:
+        rpc_config = load_rpc_config()
+    except (FileNotFoundError, ValueError):
+        rpc_config = {'rpcuser': None, 'rpcpassword': None, 'rpcport': DEFAULT_PORT}
+
+    parser = argparse.ArgumentParser(description="Synthetic luckycoind for offline testing and benchmarking")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(rpc_config['rpcport']), help="Defaults to rpcport in RPC.conf")
+    parser.add_argument('--height', type=int, default=DEFAULT_HEIGHT, help="Chain height")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the chain and wallet")
+    parser.add_argument('--addresses', type=int, default=100, help="Player addresses in the wallet")
+    parser.add_argument('--utxos', type=int, default=10, help="UTXOs per player address")
+    parser.add_argument('--watch-only', type=float, default=0.1, help="Fraction of player addresses that are watch-only")
+    parser.add_argument('--fund', action='append', type=parse_fund, default=[],
+                        help="Give an address count UTXOs: address:count[:amount], may be repeated")
+    parser.add_argument('--latency', type=float, default=0.0, help="Milliseconds added to every request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random +/- milliseconds added to the latency")
+    parser.add_argument('--min-relay-fee', type=Decimal, default=Decimal('0.001'), help="Lucky per kB")
+    parser.add_argument('--no-verify-signatures', action='store_true', help="Skip ECDSA checks of broadcast inputs")
+    parser.add_argument('--leading-zero-digits', type=int, default=0, help="Zero hex digits at the start of every block hash")
+    parser.add_argument('--block-interval', type=float, default=0, help="Mine a block every N seconds (0 disables)")
+    args = parser.parse_args()
+
+    node = FakeLuckycoind(
+        height=args.height, seed=args.seed, rpcuser=rpc_config['rpcuser'], rpcpassword=rpc_config['rpcpassword'],
+        latency=args.latency, jitter=args.jitter, verify_signatures=not args.no_verify_signatures,
+        min_relay_fee=args.min_relay_fee, leading_zero_digits=args.leading_zero_digits,
+        block_interval=args.block_interval,
+    )
+    node.wallet.populate(args.addresses, args.utxos, args.watch_only)
+    for address, count, amount in args.fund:
+        # Funded addresses are not wallet keys, like the pool address the game signs for itself
+        node.wallet.fund(address, count, amount, ismine=False)
+    asyncio.run(serve(node, args.host, args.port))
+
+if __name__ == "__main__":
+    main()
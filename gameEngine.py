@@ -0,0 +1,210 @@
+"""
+gameEngine.py
+
+UI-free suits game engine. Each GameSession holds the state of one table (player
+address, credits, last result) so one process can run many tables at once. Deals go
+through the shared block hash store and suit sampler, and balance lookups through
+the shared getBalances cache, so tables do not multiply RPC load.
+
+The pygame client uses a GameSession directly, or a RemoteSession (see gameServer)
+that has the same methods and talks to a game server.
+"""
+
+import threading
+import time
+import uuid
+
+from gameRules import BETS, MIN_WAGER, calculate_max_wager, calculate_winnings
+from getBalances import get_filtered_balances_and_utxos, iter_player_addresses
+
+POOL_ADDRESS = "<Pool Address>"  # Pool address
+SESSION_IDLE_TIMEOUT = 30 * 60  # Seconds without an action before SessionManager.expire_idle drops a table
+
+class GameError(Exception):
+    """An action the rules do not allow, the message is shown to the player."""
+
+class GameSession:
+    """State and actions of one table."""
+
+    def __init__(self, player_address, pool_address=POOL_ADDRESS, credits=0, session_id=None, cash_out_queue=None):
+        # With a cash_out_queue (see cashOutQueue) cash-outs are paid in batches with other tables
+        self.cash_out_queue = cash_out_queue
+        self.session_id = session_id or uuid.uuid4().hex
+        self.player_address = player_address
+        self.pool_address = pool_address
+        self.credits = credits
+        self.player_balance = None
+        self.pool_balance = 0.0
+        self.last_card = None
+        self.last_suit = None
+        self.last_winnings = 0
+        self.last_txid = None
+        self.pending_buy_ins = {}  # txid -> amount of buy-ins waiting for a confirmation (with chainEvents)
+        self.last_active = time.monotonic()  # Updated by SessionManager.get
+        self.result = ""
+        self.lock = threading.Lock()  # One action at a time per table
+
+    def max_wager(self):
+        return calculate_max_wager(self.credits, self.pool_balance)
+
+    def state(self):
+        """Return the table state as a JSON-friendly dict."""
+        return {
+            'session_id': self.session_id,
+            'player_address': self.player_address,
+            'pool_address': self.pool_address,
+            'credits': self.credits,
+            'max_wager': self.max_wager(),
+            'player_balance': self.player_balance,
+            'pool_balance': self.pool_balance,
+            'last_card': self.last_card,
+            'last_suit': self.last_suit,
+            'last_winnings': self.last_winnings,
+            'last_txid': self.last_txid,
+            'pending_buy_in': sum(self.pending_buy_ins.values()),
+            'result': self.result,
+        }
+
+    def refresh_balances(self):
+        """Update the player and pool balances from the shared balance cache."""
+        balances = get_filtered_balances_and_utxos(self.player_address, self.pool_address)
+        self.pool_balance = balances['player_pool_wallet']['balance'] or 0.0
+        self.player_balance = balances['player_wallet']['balance']
+        return self.state()
+
+    def deal(self, selected_bet, wager):
+        """Take the wager, deal a card and settle the bet."""
+        with self.lock:
+            if selected_bet not in BETS:
+                raise GameError("Select a suit or color first.")
+            if isinstance(wager, bool) or not isinstance(wager, int) or wager < MIN_WAGER:
+                raise GameError("Invalid bet.")
+            if wager > self.credits:
+                raise GameError("Not enough credits.")
+            if wager > self.max_wager():
+                raise GameError(f"Bet is above the {self.max_wager()} max bet.")
+
+            # Imported on the first deal, numpy is most of the client's import time
+            from suitSampler import draw_card
+            self.credits -= wager
+            try:
+                drawn_card = draw_card(self.session_id, wager)
+            except Exception:
+                self.credits += wager  # Return the stake of a deal that never happened
+                raise
+            drawn_suit = drawn_card.split(" of ")[1]
+            winnings = calculate_winnings(selected_bet, drawn_suit, wager)
+            self.credits += winnings
+
+            self.last_card = drawn_card
+            self.last_suit = drawn_suit
+            self.last_winnings = winnings
+            if winnings:
+                self.result = f"You won {winnings}! Card: {drawn_card}."
+            else:
+                self.result = f"You Won 0. Card: {drawn_card}"
+        return self.refresh_balances()
+
+    def buy_in(self, amount):
+        """Send amount from the player address to the pool and add it to the credits."""
+        from buyIn import send_lucky
+        from chainEvents import get_chain_subscriber
+        if isinstance(amount, bool) or not isinstance(amount, int) or amount <= 0:
+            raise GameError("Invalid buy-in amount.")
+        with self.lock:
+            print(f"Attempting to buy in with amount: {amount} to address: {self.pool_address}")
+            txid = send_lucky(self.player_address, self.pool_address, amount)
+            if not txid:
+                raise GameError("Buy-in failed.")
+            self.credits += amount
+            self.last_txid = txid
+            self.result = f"Bought in {amount} lucky."
+            subscriber = get_chain_subscriber()
+            if subscriber is not None:
+                self.pending_buy_ins[txid] = amount
+                subscriber.watch_transaction(txid, self.buy_in_confirmed)
+        return self.refresh_balances()
+
+    def buy_in_confirmed(self, txid, confirmed):
+        """Called by the chain subscriber once a buy-in transaction confirmed or was dropped."""
+        with self.lock:
+            amount = self.pending_buy_ins.pop(txid, None)
+        if not confirmed and amount is not None:
+            print(f"Buy-in {txid} of {amount} lucky to session {self.session_id} was dropped before it confirmed")
+
+    def cash_out(self):
+        """Pay the credits from the pool back to the player address."""
+        with self.lock:
+            if self.credits <= 0:
+                raise GameError("No credits to cash out.")
+            amount = self.credits
+            if self.cash_out_queue is not None:
+                txid = self.cash_out_queue.submit(self.player_address, amount).result()
+            else:
+                from cashOut import send_lucky
+                txid = send_lucky(self.player_address, amount)
+            if not txid:
+                raise GameError("Cash out failed. Please try again.")
+            self.credits -= amount
+            self.last_txid = txid
+            self.result = f"Cashed out {amount} lucky. TXID: {txid}"
+        return self.refresh_balances()
+
+class SessionManager:
+    """All tables hosted by one process."""
+
+    def __init__(self, pool_address=POOL_ADDRESS, cash_out_queue=None, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.pool_address = pool_address
+        self.cash_out_queue = cash_out_queue  # Shared by every table so their cash-outs are batched
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create(self, player_address):
+        session = GameSession(player_address, self.pool_address, cash_out_queue=self.cash_out_queue)
+        with self.lock:
+            self.sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is None:
+            raise GameError(f"Unknown session {session_id}")
+        session.last_active = time.monotonic()
+        return session
+
+    def close(self, session_id):
+        """Forget a table, refusing while it still holds credits."""
+        session = self.get(session_id)
+        if session.credits:
+            raise GameError("Cash out before leaving the table.")
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def expire_idle(self):
+        """Drop the tables idle for longer than idle_timeout, returning their ids.
+
+        Credits left on an idle table are cashed out to its player address first, a
+        table whose cash-out fails is kept and tried again on the next call.
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        with self.lock:
+            idle = [session for session in self.sessions.values() if session.last_active < cutoff]
+        expired = []
+        for session in idle:
+            if session.credits > 0:
+                try:
+                    session.cash_out()
+                except Exception as e:
+                    print(f"Could not cash out idle session {session.session_id}: {e}")
+                    continue
+            with self.lock:
+                if session.last_active < cutoff:  # Not picked up again while cashing out
+                    self.sessions.pop(session.session_id, None)
+                    expired.append(session.session_id)
+        return expired
+
+def list_player_addresses():
+    """Return every spendable wallet address with its balance."""
+    return [item for batch in iter_player_addresses() for item in batch]
@@ -0,0 +1,38 @@
+"""
+gameRules.py
+
+Payout and betting rules of the suits game, kept free of pygame and RPC so the game,
+the simulator and other tools all apply the same rules.
+"""
+
+from decimal import Decimal
+
+SUIT_PAYOUT = 4  # Multiplier paid when the selected suit is drawn
+COLOR_PAYOUT = 2  # Multiplier paid when the selected color is drawn
+MAX_WAGER_POOL_FRACTION = Decimal('0.1')  # Share of the pool (minus credits) a single bet may risk
+MIN_WAGER = 1
+
+SUITS = ["Hearts", "Diamonds", "Clubs", "Spades"]
+COLORS = {
+    "Red": ["Hearts", "Diamonds"],
+    "Black": ["Clubs", "Spades"],
+}
+BETS = SUITS + list(COLORS)
+
+def calculate_max_wager(credits, player_pool_balance):
+    """Calculate the maximum wager based on credits and pool balance."""
+    pool_minus_credits = max(0, Decimal(player_pool_balance) - Decimal(credits))
+    max_wager = min(credits, int(pool_minus_credits * MAX_WAGER_POOL_FRACTION))
+    return max(MIN_WAGER, max_wager)  # Ensure minimum wager is 1
+
+def payout_multiplier(selected_bet, drawn_suit):
+    """Return how many times the wager is paid back for a bet and the drawn suit (0 for a loss)."""
+    if selected_bet == drawn_suit:
+        return SUIT_PAYOUT
+    if drawn_suit in COLORS.get(selected_bet, []):
+        return COLOR_PAYOUT
+    return 0
+
+def calculate_winnings(selected_bet, drawn_suit, wager):
+    """Return the amount credited back to the player for a settled bet."""
+    return wager * payout_multiplier(selected_bet, drawn_suit)
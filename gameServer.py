@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+
+"""
+gameServer.py
+
+Asyncio HTTP and WebSocket server hosting many suits game tables in one process. The
+game logic is gameEngine; blocking actions (deals, buy-ins, cash-outs, balance
+lookups) run on a thread pool so a slow table never stalls the others, and the
+cash-outs of all tables are paid together in batches (see cashOutQueue). With
+--consolidate, small pool UTXOs are merged while no table is active (see
+poolConsolidation). With --chain-events, new blocks and transactions are pushed
+into the balance caches instead of being polled (see chainEvents). With
+--metrics-port or --metrics-file, per-method luckycoind call metrics are exported
+in the Prometheus text format (see rpcMetrics).
+
+Every HTTP request and WebSocket upgrade must carry the server's shared token, as
+"Authorization: Bearer <token>" or a ?token= query parameter, when one is set with
+--token or the SUITS_SERVER_TOKEN environment variable. The server refuses to
+listen on anything but a loopback address without a token, since any client that
+reaches the port can buy in from and cash out to the wallet's addresses.
+
+HTTP API (JSON bodies and replies):
+    GET    /addresses                   spendable wallet addresses and balances
+    POST   /sessions                    {"player_address": ...} opens a table
+    GET    /sessions/<id>               table state
+    POST   /sessions/<id>/refresh       refresh balances
+    POST   /sessions/<id>/deal          {"bet": "Red", "wager": 5}
+    POST   /sessions/<id>/buy_in        {"amount": 10}
+    POST   /sessions/<id>/cash_out
+    DELETE /sessions/<id>               close a table without credits
+
+A table without an action for --session-timeout seconds (30 minutes by default) is
+cashed out to its player address and dropped.
+
+WebSocket API on /ws: every text message is {"action": ..., "session_id": ..., ...}
+with the same actions and fields (plus "create" and "addresses"), and the reply is
+the table state or {"error": ...}.
+
+Example:
+    python gameServer.py --port 8080                                # loopback only
+    SUITS_SERVER_TOKEN=<secret> python gameServer.py --host 0.0.0.0 --port 8080
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
+
+from cashOutQueue import MAX_BATCH, MAX_WAIT, CashOutQueue
+from chainEvents import start_chain_subscriber
+from gameEngine import SESSION_IDLE_TIMEOUT, GameError, SessionManager, list_player_addresses
+from poolConsolidation import Consolidator, record_activity
+from rpcMetrics import start_metrics_file_writer, start_metrics_server
+
+DEFAULT_PORT = 8080
+WORKER_THREADS = 64  # Blocking game actions running at the same time
+MAX_BODY_SIZE = 64 * 1024
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+SESSION_ACTIONS = ("refresh", "deal", "buy_in", "cash_out")  # Actions posted to /sessions/<id>/<action>
+SESSION_SWEEP_INTERVAL = 60  # Seconds between checks for idle sessions
+TOKEN_ENV = "SUITS_SERVER_TOKEN"  # Environment variable holding the shared token of server and clients
+
+def json_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"{obj!r} is not JSON serializable")
+
+class GameServer:
+    """Routes HTTP and WebSocket requests to the tables of a SessionManager."""
+
+    def __init__(self, sessions=None, workers=WORKER_THREADS, token=None):
+        self.sessions = sessions or SessionManager()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.token = token  # Shared secret every request must carry, None accepts any request
+
+    def is_authorized(self, headers, query):
+        if self.token is None:
+            return True
+        scheme, _, supplied = headers.get('authorization', '').partition(' ')
+        if scheme.lower() != 'bearer':
+            supplied = (query.get('token') or [''])[0]
+        return hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    async def run_blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def expire_sessions(self, interval=SESSION_SWEEP_INTERVAL):
+        """Drop idle tables every interval seconds, so a long-running server does not keep every table."""
+        while True:
+            await asyncio.sleep(interval)
+            expired = await self.run_blocking(self.sessions.expire_idle)
+            if expired:
+                print(f"Expired {len(expired)} idle session(s)")
+
+    async def dispatch(self, action, session_id=None, params=None):
+        """Run one action and return its JSON reply."""
+        params = params or {}
+        record_activity()
+        if action == "addresses":
+            addresses = await self.run_blocking(list_player_addresses)
+            return {'addresses': [[address, balance] for address, balance in addresses]}
+        if action == "create":
+            if not params.get('player_address'):
+                raise GameError("player_address is required")
+            session = self.sessions.create(params['player_address'])
+            return await self.run_blocking(session.refresh_balances)
+
+        session = self.sessions.get(session_id)
+        if action == "state":
+            return session.state()
+        if action == "refresh":
+            return await self.run_blocking(session.refresh_balances)
+        if action == "deal":
+            return await self.run_blocking(session.deal, params.get('bet'), params.get('wager'))
+        if action == "buy_in":
+            return await self.run_blocking(session.buy_in, params.get('amount'))
+        if action == "cash_out":
+            return await self.run_blocking(session.cash_out)
+        if action == "close":
+            self.sessions.close(session_id)
+            return {'closed': session_id}
+        raise GameError(f"Unknown action {action}")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except ValueError as e:
+                    await self.write_response(writer, 400, {'error': f"Bad request: {e}"}, False)
+                    break
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if not self.is_authorized(headers, query):
+                    await self.write_response(writer, 401, {'error': "Missing or wrong token"}, keep_alive)
+                    if not keep_alive:
+                        break
+                    continue
+                if path == "/ws" and headers.get('upgrade', '').lower() == 'websocket':
+                    await self.handle_websocket(reader, writer, headers)
+                    break
+                status, reply = await self.handle_http(method, path, body)
+                await self.write_response(writer, status, reply, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def write_response(self, writer, status, reply, keep_alive):
+        payload = json.dumps(reply, default=json_default).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {http.client.responses.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+
+    async def read_request(self, reader):
+        """Read one request as (method, path, query, headers, body), raising ValueError when it is malformed."""
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise ValueError("malformed request line")
+        method, target, _ = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise ValueError("invalid Content-Length") from None
+        if length < 0:
+            raise ValueError("invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise ConnectionError("Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        url = urlparse(target)
+        return method, url.path, parse_qs(url.query), headers, body
+
+    async def handle_http(self, method, path, body):
+        """Map an HTTP request onto dispatch, returning (status, reply)."""
+        parts = [part for part in path.split('/') if part]
+        try:
+            params = json.loads(body) if body else {}
+            if method == "GET" and parts == ["addresses"]:
+                return 200, await self.dispatch("addresses")
+            if parts[:1] == ["sessions"]:
+                if method == "POST" and len(parts) == 1:
+                    return 200, await self.dispatch("create", params=params)
+                if method == "GET" and len(parts) == 2:
+                    return 200, await self.dispatch("state", parts[1])
+                if method == "DELETE" and len(parts) == 2:
+                    return 200, await self.dispatch("close", parts[1])
+                if method == "POST" and len(parts) == 3 and parts[2] in SESSION_ACTIONS:
+                    return 200, await self.dispatch(parts[2], parts[1], params)
+            return 404, {'error': f"No route for {method} {path}"}
+        except (GameError, ValueError) as e:
+            return 400, {'error': str(e)}
+        except Exception as e:
+            print(f"Request {method} {path} failed: {e}")
+            return 500, {'error': str(e)}
+
+    async def handle_websocket(self, reader, writer, headers):
+        key = headers.get('sec-websocket-key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        await writer.drain()
+        while True:
+            opcode, payload = await read_websocket_message(reader)
+            if opcode == 0x8:  # Close
+                writer.write(websocket_frame(0x8, payload[:2]))
+                await writer.drain()
+                return
+            if opcode == 0x9:  # Ping
+                writer.write(websocket_frame(0xA, payload))
+            elif opcode == 0x1:  # Text
+                try:
+                    message = json.loads(payload)
+                    reply = await self.dispatch(message.get('action'), message.get('session_id'), message)
+                except (GameError, ValueError) as e:
+                    reply = {'error': str(e)}
+                except Exception as e:
+                    print(f"WebSocket action failed: {e}")
+                    reply = {'error': str(e)}
+                writer.write(websocket_frame(0x1, json.dumps(reply, default=json_default).encode()))
+            await writer.drain()
+
+async def read_websocket_message(reader):
+    """Read one (possibly fragmented) client message, returning (opcode, payload)."""
+    message_opcode = None
+    payload = bytearray()
+    while True:
+        first, second = await reader.readexactly(2)
+        fin, opcode = first & 0x80, first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', await reader.readexactly(8))[0]
+        if length > MAX_BODY_SIZE:
+            raise ConnectionError("WebSocket message too large")
+        mask = await reader.readexactly(4) if second & 0x80 else b'\0\0\0\0'
+        data = await reader.readexactly(length)
+        data = bytes(byte ^ mask[i % 4] for i, byte in enumerate(data))
+        if opcode >= 0x8:
+            # Control frames may arrive between fragments and are never fragmented
+            return opcode, data
+        if opcode:
+            message_opcode = opcode
+        payload += data
+        if fin:
+            return message_opcode, bytes(payload)
+
+def websocket_frame(opcode, payload):
+    """Build one unmasked server frame."""
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 1 << 16:
+        header += bytes([126]) + struct.pack('>H', len(payload))
+    else:
+        header += bytes([127]) + struct.pack('>Q', len(payload))
+    return header + payload
+
+class RemoteSession:
+    """Client for one table on a game server, with the same methods as GameSession."""
+
+    def __init__(self, server_url, player_address, token=None):
+        url = urlparse(server_url)
+        self.connection = http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT)
+        self.headers = request_headers(token)
+        self.lock = threading.Lock()
+        self.player_address = player_address
+        self.session_id = self._request("POST", "/sessions", {'player_address': player_address})['session_id']
+
+    def _request(self, method, path, body=None):
+        with self.lock:
+            self.connection.request(method, path, body=json.dumps(body or {}), headers=self.headers)
+            response = self.connection.getresponse()
+            reply = json.loads(response.read(), parse_float=Decimal)
+        if response.status == 400:
+            raise GameError(reply['error'])
+        if response.status == 401:
+            raise PermissionError(f"Game server refused the token, set {TOKEN_ENV}")
+        if response.status != 200:
+            raise RuntimeError(f"Game server error {response.status}: {reply.get('error')}")
+        return reply
+
+    def state(self):
+        return self._request("GET", f"/sessions/{self.session_id}")
+
+    def refresh_balances(self):
+        return self._request("POST", f"/sessions/{self.session_id}/refresh")
+
+    def deal(self, selected_bet, wager):
+        return self._request("POST", f"/sessions/{self.session_id}/deal", {'bet': selected_bet, 'wager': wager})
+
+    def buy_in(self, amount):
+        return self._request("POST", f"/sessions/{self.session_id}/buy_in", {'amount': amount})
+
+    def cash_out(self):
+        return self._request("POST", f"/sessions/{self.session_id}/cash_out")
+
+def request_headers(token=None):
+    """Headers of client requests, carrying token or the SUITS_SERVER_TOKEN environment variable."""
+    headers = {'Content-Type': 'application/json'}
+    token = token or os.environ.get(TOKEN_ENV)
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
+    return headers
+
+def list_remote_player_addresses(server_url, token=None):
+    """Return the spendable wallet addresses known to a game server."""
+    url = urlparse(server_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT)
+    connection.request("GET", "/addresses", headers=request_headers(token))
+    response = connection.getresponse()
+    reply = json.loads(response.read(), parse_float=Decimal)
+    connection.close()
+    if response.status != 200:
+        raise RuntimeError(f"Game server error {response.status}: {reply.get('error')}")
+    return [(address, balance) for address, balance in reply['addresses']]
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # A host name could resolve to any interface
+
+async def serve(host, port, server=None):
+    server = server or GameServer()
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    print(f"Suits game server listening on {host}:{port}")
+    sweeper = asyncio.create_task(server.expire_sessions())
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        sweeper.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless multi-table suits game server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                        help=f"Shared token clients must send (default: ${TOKEN_ENV}), required off loopback")
+    parser.add_argument('--session-timeout', type=float, default=SESSION_IDLE_TIMEOUT,
+                        help="Seconds a table may stay idle before it is cashed out and dropped")
+    parser.add_argument('--workers', type=int, default=WORKER_THREADS, help="Threads for blocking game actions")
+    parser.add_argument('--cash-out-batch', type=int, default=MAX_BATCH, help="Cash-outs paid per transaction")
+    parser.add_argument('--cash-out-wait', type=float, default=MAX_WAIT,
+                        help="Seconds a cash-out waits for others to join its transaction (0 pays each at once)")
+    parser.add_argument('--consolidate', action='store_true', help="Merge small pool UTXOs while no table is active")
+    parser.add_argument('--consolidation-hours', type=int, nargs=2, metavar=('START', 'END'),
+                        help="Also consolidate during this daily low-traffic window (local hours)")
+    parser.add_argument('--chain-events', metavar='SOURCE',
+                        help="Subscribe to chain events: longpoll, or the node's ZMQ endpoint (tcp://host:port)")
+    parser.add_argument('--metrics-port', type=int, help="Serve RPC metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--metrics-file', help="Write RPC metrics in the Prometheus text format to this file")
+    args = parser.parse_args()
+    if not args.token and not is_loopback(args.host):
+        parser.error(f"--host {args.host} is reachable from other machines, set --token or {TOKEN_ENV}")
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    if args.metrics_file:
+        start_metrics_file_writer(args.metrics_file)
+    if args.chain_events:
+        start_chain_subscriber(args.chain_events)
+    if args.consolidate:
+        Consolidator(hours=args.consolidation_hours).start()
+    sessions = SessionManager(cash_out_queue=CashOutQueue(args.cash_out_batch, args.cash_out_wait),
+                              idle_timeout=args.session_timeout)
+    asyncio.run(serve(args.host, args.port, GameServer(sessions, workers=args.workers, token=args.token or None)))
+
+if __name__ == "__main__":
+    main()
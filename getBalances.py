@@ -1,7 +1,9 @@
 import json
+import bisect
+import threading
+import time
 from decimal import Decimal
-from bitcoinrpc.authproxy import AuthServiceProxy, JSONRPCException
-import configparser
+from rpcClient import JSONRPCException, get_rpc_client
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -9,83 +11,277 @@ class DecimalEncoder(json.JSONEncoder):
             return float(obj)
         return super(DecimalEncoder, self).default(obj)
 
+BALANCE_CACHE_TTL = 30  # Seconds a cached address is served without asking the node
+# True while chainEvents pushes new blocks and transactions into the cache,
+# entries then stay fresh until an event invalidates them
+push_updates = False
+DUST_AMOUNT = Decimal('0.001')  # UTXO amount hidden by the filtered views
+
+def utxo_sort_key(utxo):
+    # Sort UTXOs by confirmations (descending) and amount (descending)
+    return (-utxo['confirmations'], -utxo['amount'], utxo['txid'], utxo['vout'])
+
+class AddressCache:
+    """Cached balance and sorted UTXO lists for one address, updated incrementally."""
+
+    def __init__(self):
+        self.balance = Decimal('0')
+        self.utxos = []  # All UTXOs, kept sorted by utxo_sort_key
+        self.filtered_utxos = []  # Same order, without DUST_AMOUNT outputs
+        self.by_outpoint = {}  # (txid, vout) -> formatted UTXO
+        self.fetched_at = None  # time.monotonic() of the last refresh, None when invalid
+        self.version = 0  # Bumped by every change not coming from a refresh
+
+    def is_fresh(self, now):
+        return self.fetched_at is not None and (push_updates or now - self.fetched_at < BALANCE_CACHE_TTL)
+
+    def invalidate(self):
+        self.fetched_at = None
+        self.version += 1
+
+    def _insert(self, utxo):
+        self.by_outpoint[(utxo['txid'], utxo['vout'])] = utxo
+        self.balance += utxo['amount']
+        bisect.insort(self.utxos, utxo, key=utxo_sort_key)
+        if utxo['amount'] != DUST_AMOUNT:
+            bisect.insort(self.filtered_utxos, utxo, key=utxo_sort_key)
+
+    def _remove(self, outpoints):
+        """Drop the cached UTXOs among outpoints, returning how many there were."""
+        outpoints = {outpoint for outpoint in outpoints if outpoint in self.by_outpoint}
+        if not outpoints:
+            return 0
+        for outpoint in outpoints:
+            self.balance -= self.by_outpoint.pop(outpoint)['amount']
+        self.utxos = [u for u in self.utxos if (u['txid'], u['vout']) not in outpoints]
+        self.filtered_utxos = [u for u in self.filtered_utxos if (u['txid'], u['vout']) not in outpoints]
+        return len(outpoints)
+
+    def apply_spent(self, outpoints):
+        """Drop UTXOs we know were spent, without waiting for the next refresh."""
+        # Only a change of this entry makes an in-flight refresh stale
+        if self._remove(outpoints):
+            self.version += 1
+
+    def apply_received(self, utxo):
+        """Add a UTXO we know was created, without waiting for the next refresh."""
+        utxo = format_utxo(utxo)
+        if (utxo['txid'], utxo['vout']) not in self.by_outpoint:
+            self._insert(utxo)
+            self.version += 1
+
+    def merge(self, listunspent_result, now):
+        """Apply a fresh listunspent result as removals, insertions and confirmation updates."""
+        fresh = {(utxo['txid'], utxo['vout']): utxo for utxo in listunspent_result}
+        self._remove(set(self.by_outpoint) - set(fresh))
+        changed = False
+        for outpoint, utxo in fresh.items():
+            cached = self.by_outpoint.get(outpoint)
+            if cached is None:
+                self._insert(format_utxo(utxo))
+            elif cached['confirmations'] != utxo['confirmations']:
+                cached['confirmations'] = utxo['confirmations']
+                changed = True
+        if changed:
+            # A new block raises every confirmation count by one, which keeps the order,
+            # so this is a linear pass over an already (or nearly) sorted list
+            for utxo_list in (self.utxos, self.filtered_utxos):
+                if any(utxo_sort_key(a) > utxo_sort_key(b) for a, b in zip(utxo_list, utxo_list[1:])):
+                    utxo_list.sort(key=utxo_sort_key)
+        self.fetched_at = now
+
+balance_cache = {}  # address -> AddressCache
+imported_addresses = set()  # Addresses already imported as watch-only by this process
+cache_lock = threading.Lock()
+
+def invalidate_addresses(*addresses):
+    """Force the next lookup of these addresses to ask the node, e.g. after a buy-in or cash-out."""
+    with cache_lock:
+        for address in addresses:
+            if address in balance_cache:
+                balance_cache[address].invalidate()
+
+def invalidate_all():
+    with cache_lock:
+        for entry in balance_cache.values():
+            entry.invalidate()
+
+def apply_spent_utxos(address, outpoints):
+    """Remove (txid, vout) outpoints spent from address from its cached UTXO lists."""
+    with cache_lock:
+        if address in balance_cache:
+            balance_cache[address].apply_spent(outpoints)
+
+def apply_received_utxo(address, utxo):
+    """Add a UTXO paid to address to its cached UTXO lists."""
+    with cache_lock:
+        if address in balance_cache:
+            balance_cache[address].apply_received(utxo)
+
+def apply_transaction(txid, inputs, outputs):
+    """
+    Apply a transaction the node announced to the cached addresses it spends from or
+    pays to. inputs are (txid, vout) outpoints and outputs (address, amount) pairs.
+    Returns the cached addresses that changed.
+    """
+    changed = set()
+    with cache_lock:
+        for address, entry in balance_cache.items():
+            balance = entry.balance
+            entry.apply_spent(inputs)
+            if entry.balance != balance:
+                changed.add(address)
+        for vout, (address, amount) in enumerate(outputs):
+            if address in balance_cache:
+                balance_cache[address].apply_received({'txid': txid, 'vout': vout, 'amount': amount, 'confirmations': 0})
+                changed.add(address)
+    return changed
+
 def get_rpc_connection():
-    config = configparser.ConfigParser()
-    config.read('RPC.conf')
-    rpc_user = config['rpcconfig']['rpcuser']
-    rpc_password = config['rpcconfig']['rpcpassword']
-    rpc_host = config['rpcconfig']['rpchost']
-    rpc_port = config['rpcconfig']['rpcport']
-    rpc_url = f"http://{rpc_user}:{rpc_password}@{rpc_host}:{rpc_port}"
-    return AuthServiceProxy(rpc_url)
+    # Shared keep-alive client, see rpcClient
+    return get_rpc_client()
 
 def import_address(address):
+    if address in imported_addresses:
+        return
     rpc_connection = get_rpc_connection()
     try:
         rpc_connection.importaddress(address, "", False)
+        imported_addresses.add(address)
     except JSONRPCException as e:
         print(f"Error importing address {address}: {e}")
 
+def format_utxo(utxo):
+    return {
+        'txid': utxo['txid'],
+        'vout': utxo['vout'],
+        'amount': Decimal(utxo['amount']),
+        'confirmations': utxo['confirmations']
+    }
+
+def format_address_info(utxos):
+    """Return the balance and the sorted UTXO list for a listunspent result."""
+    balance = sum(Decimal(utxo['amount']) for utxo in utxos)
+    
+    formatted_utxos = [format_utxo(utxo) for utxo in utxos]
+    
+    formatted_utxos.sort(key=utxo_sort_key)
+    
+    return balance, formatted_utxos
+
 def get_address_info(address):
     rpc_connection = get_rpc_connection()
     try:
         utxos = rpc_connection.listunspent(0, 9999999, [address])
-        
-        balance = sum(Decimal(utxo['amount']) for utxo in utxos)
-        
-        formatted_utxos = [
-            {
-                'txid': utxo['txid'],
-                'vout': utxo['vout'],
-                'amount': Decimal(utxo['amount']),
-                'confirmations': utxo['confirmations']
-            }
-            for utxo in utxos
-        ]
-        
-        # Sort UTXOs by confirmations (descending) and amount (descending)
-        formatted_utxos.sort(key=lambda x: (-x['confirmations'], -x['amount']))
-        
-        return balance, formatted_utxos
+        return format_address_info(utxos)
     except JSONRPCException as e:
         print(f"Error fetching data for {address}: {e}")
         return None, None
 
-def get_balances_and_utxos(player_wallet, player_pool_wallet):
-    player_balance, player_utxos = get_address_info(player_wallet)
-    pool_balance, pool_utxos = get_address_info(player_pool_wallet)
+watch_only_addresses = {}  # address -> True when the wallet only watches it
+
+def iter_player_addresses(min_balance=Decimal('1.0'), batch_size=500):
+    """
+    Yield lists of (address, balance) for the wallet's spendable addresses as they are
+    confirmed. UTXOs are aggregated per address first, so ownership is looked up once
+    per distinct address (in JSON-RPC batches) instead of once per UTXO, and
+    watch-only status is remembered for the life of the process.
+    """
+    rpc_connection = get_rpc_connection()
+    address_balances = {}
+    for output in rpc_connection.listunspent():
+        address = output.get('address')
+        if address is not None:
+            address_balances[address] = address_balances.get(address, Decimal('0')) + Decimal(output['amount'])
+
+    # Only include addresses with a balance greater than min_balance, largest first
+    candidates = sorted(
+        ((address, balance) for address, balance in address_balances.items() if balance > min_balance),
+        key=lambda item: -item[1],
+    )
+    for start in range(0, len(candidates), batch_size):
+        batch = candidates[start:start + batch_size]
+        unknown = [address for address, _ in batch if address not in watch_only_addresses]
+        if unknown:
+            infos = rpc_connection.batch([("validateaddress", [address]) for address in unknown])
+            for address, info in zip(unknown, infos):
+                watch_only_addresses[address] = info.get('iswatchonly', False)
+        # Skip watch-only addresses
+        yield [(address, balance) for address, balance in batch if not watch_only_addresses[address]]
+
+def get_cached_addresses(addresses, filtered=False):
+    """
+    Return (balance, utxos) per address, asking the node only for addresses whose
+    cache entry is missing, invalidated or older than BALANCE_CACHE_TTL. The node is
+    asked without holding cache_lock, and the UTXO dicts returned are copies, so
+    callers never see them change under a later refresh.
+    """
+    with cache_lock:
+        now = time.monotonic()
+        stale = [address for address in dict.fromkeys(addresses)
+                 if address not in balance_cache or not balance_cache[address].is_fresh(now)]
+        versions = {address: balance_cache[address].version if address in balance_cache else None
+                    for address in stale}
+
+    if stale:
+        replies = get_rpc_connection().gather(
+            [("listunspent", [0, 9999999, [address]]) for address in stale],
+            return_exceptions=True,
+        )
+        with cache_lock:
+            for address, reply in zip(stale, replies):
+                entry = balance_cache.get(address)
+                if entry is not None and entry.version != versions[address]:
+                    # Changed by an event or invalidated while we asked, the reply may predate that
+                    continue
+                if isinstance(reply, JSONRPCException):
+                    print(f"Error fetching data for {address}: {reply}")
+                    balance_cache.pop(address, None)
+                elif isinstance(reply, BaseException):
+                    raise reply
+                else:
+                    balance_cache.setdefault(address, AddressCache()).merge(reply, now)
+
+    with cache_lock:
+        results = []
+        for address in addresses:
+            entry = balance_cache.get(address)
+            if entry is None:
+                results.append((None, None))
+            else:
+                utxos = entry.filtered_utxos if filtered else entry.utxos
+                results.append((entry.balance, [dict(utxo) for utxo in utxos]))
+        return results
+
+def wallet_result(address, balance, utxos):
+    return {
+        "address": address,
+        "balance": float(balance) if balance is not None else None,
+        "utxos": utxos if utxos is not None else []
+    }
+
+def get_balances_and_utxos(player_wallet, player_pool_wallet, filtered=False):
+    (player_balance, player_utxos), (pool_balance, pool_utxos) = get_cached_addresses(
+        [player_wallet, player_pool_wallet], filtered
+    )
     
     result = {
-        "player_wallet": {
-            "address": player_wallet,
-            "balance": float(player_balance) if player_balance is not None else None,
-            "utxos": player_utxos if player_utxos is not None else []
-        },
-        "player_pool_wallet": {
-            "address": player_pool_wallet,
-            "balance": float(pool_balance) if pool_balance is not None else None,
-            "utxos": pool_utxos if pool_utxos is not None else []
-        }
+        "player_wallet": wallet_result(player_wallet, player_balance, player_utxos),
+        "player_pool_wallet": wallet_result(player_pool_wallet, pool_balance, pool_utxos),
     }
     
     return result
 
 def filter_utxos(wallet):
-    wallet['utxos'] = [utxo for utxo in wallet['utxos'] if utxo['amount'] != Decimal('0.001')]
+    wallet['utxos'] = [utxo for utxo in wallet['utxos'] if utxo['amount'] != DUST_AMOUNT]
     return wallet
 
-# Modify the get_filtered_balances_and_utxos function
 def get_filtered_balances_and_utxos(player_wallet, player_pool_wallet):
-    # Import addresses as watch-only without rescanning
+    # Import addresses as watch-only without rescanning (once per process)
     import_address(player_pool_wallet)
     
-    result = get_balances_and_utxos(player_wallet, player_pool_wallet)
-    
-    # Filter out 0.001 UTXOs
-    result['player_wallet'] = filter_utxos(result['player_wallet'])
-    result['player_pool_wallet'] = filter_utxos(result['player_pool_wallet'])
-    
-    return result
+    # Cached lists already exclude the 0.001 UTXOs
+    return get_balances_and_utxos(player_wallet, player_pool_wallet, filtered=True)
 
 # Example usage
 if __name__ == "__main__":
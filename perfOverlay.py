@@ -0,0 +1,188 @@
+"""
+perfOverlay.py
+
+In-game performance overlay for the pygame client, toggled with F3, to diagnose
+stutter on site without a profiler. Every frame of the game and address screens is
+timed and split into sections:
+
+- events: handling input events (handle_game_events, pygame_gui)
+- logic: applying finished background work and UI state updates
+- draw: building and drawing the frame (game texts, Button.draw, pygame_gui)
+- rpc: waiting on luckycoind from the UI thread, taken out of the section it
+  happened in (see rpcClient.blocking_hook)
+
+The overlay shows frame-time percentiles over the last FRAME_HISTORY frames, the
+sections of the last and the slowest frame (with the RPC method that blocked it
+longest), the time the last deal (process_deal) took on the worker pool, and a
+rolling graph of the frame times stacked by section. A frame is timed from the
+moment its events arrive until it is on screen, time spent waiting for events is
+not counted.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pygame
+
+import rpcClient
+
+SECTIONS = ('events', 'logic', 'draw', 'rpc')
+SECTION_COLORS = {
+    'events': (80, 160, 255),
+    'logic': (255, 200, 60),
+    'draw': (90, 220, 120),
+    'rpc': (255, 80, 80),
+}
+FRAME_HISTORY = 240  # Frames in the percentiles and the graph, one pixel column each
+GRAPH_HEIGHT = 60  # Pixels
+GRAPH_SCALE_MS = 33.3  # Frame time at the top of the graph, longer frames are clipped
+FRAME_BUDGET_MS = 1000 / 60  # Drawn as a line in the graph
+REFRESH_MS = 250  # Milliseconds between overlay updates while the screen is idle
+TOGGLE_KEY = pygame.K_F3
+OVERLAY_POSITION = (10, 10)
+PADDING = 6
+
+class PerfOverlay:
+    """Frame timing of the UI thread and its on-screen display."""
+
+    def __init__(self, visible=False):
+        self.visible = visible
+        self.frames = deque(maxlen=FRAME_HISTORY)  # (frame seconds, {section: seconds}, (method, seconds) or None)
+        self.frame_start = None  # perf_counter() when the current frame started, None between frames
+        self.sections = None  # Section seconds of the current frame
+        self.current = None  # Section being timed, None outside sections
+        self.mark = None  # perf_counter() when the current section was entered
+        self.slowest_rpc = None  # (method, seconds) of the longest blocking call in the current frame
+        self.last_deal = None  # Seconds the last process_deal took on the worker pool
+        self.ui_thread = threading.current_thread()
+        self.version = 0  # Changes whenever the overlay contents change
+        self.font = None
+        rpcClient.blocking_hook = self.record_blocking
+
+    def handle_event(self, event):
+        """Toggle on the toggle key, returning True when the event was used."""
+        if event.type == pygame.KEYDOWN and event.key == TOGGLE_KEY:
+            self.visible = not self.visible
+            self.version += 1
+            return True
+        return False
+
+    def wait_timeout(self, timeout):
+        """Milliseconds to wait for events, waking up to refresh the overlay while it is shown."""
+        if not self.visible:
+            return timeout
+        return REFRESH_MS if timeout is None else min(timeout, REFRESH_MS)
+
+    def start_frame(self):
+        self.ui_thread = threading.current_thread()
+        self.frame_start = self.mark = time.perf_counter()
+        self.sections = dict.fromkeys(SECTIONS, 0.0)
+        self.current = None
+        self.slowest_rpc = None
+
+    def enter(self, name):
+        """Count the time from now on to section name, until the next enter or end_frame."""
+        if self.frame_start is None:
+            return
+        now = time.perf_counter()
+        if self.current is not None:
+            self.sections[self.current] += now - self.mark
+        self.current = name
+        self.mark = now
+
+    def record_blocking(self, method, seconds):
+        """rpcClient.blocking_hook: move RPC waits of the UI thread into the rpc section."""
+        if self.frame_start is None or threading.current_thread() is not self.ui_thread:
+            return
+        self.sections['rpc'] += seconds
+        if self.current is not None:
+            self.sections[self.current] -= seconds
+        if self.slowest_rpc is None or seconds > self.slowest_rpc[1]:
+            self.slowest_rpc = (method, seconds)
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        self.enter(None)
+        self.frames.append((time.perf_counter() - self.frame_start, self.sections, self.slowest_rpc))
+        self.frame_start = None
+        self.version += 1
+
+    def cancel_frame(self):
+        """Drop the current frame, e.g. when a modal screen runs its own loop inside it."""
+        self.frame_start = None
+
+    @contextmanager
+    def time_deal(self):
+        """Time a deal running on the worker pool, shown apart from the frame sections."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last_deal = time.perf_counter() - start
+
+    def percentiles(self):
+        """(p50, p95, p99, max) frame time in milliseconds over the recorded frames."""
+        times = sorted(frame[0] for frame in self.frames)
+        if not times:
+            return 0.0, 0.0, 0.0, 0.0
+        def at(percentile):
+            return times[min(len(times) - 1, int(len(times) * percentile / 100))] * 1000
+        return at(50), at(95), at(99), times[-1] * 1000
+
+    def describe(self, frame):
+        _, sections, slowest_rpc = frame
+        text = "  ".join(f"{name} {sections[name] * 1000:.1f}" for name in SECTIONS)
+        if slowest_rpc is not None:
+            text += f"  ({slowest_rpc[0]} {slowest_rpc[1] * 1000:.1f})"
+        return text
+
+    def render(self):
+        """Return the overlay as a translucent surface."""
+        if self.font is None:
+            self.font = pygame.font.Font(None, 20)
+        p50, p95, p99, slowest = self.percentiles()
+        lines = [f"Frame ms  p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}  max {slowest:.1f}  ({len(self.frames)} frames)"]
+        if self.frames:
+            lines.append("Last   " + self.describe(self.frames[-1]))
+            lines.append("Worst  " + self.describe(max(self.frames, key=lambda frame: frame[0])))
+        deal = "-" if self.last_deal is None else f"{self.last_deal * 1000:.1f} ms"
+        lines.append(f"Last deal (worker) {deal}    F3 hides")
+        texts = [self.font.render(line, True, (255, 255, 255)) for line in lines]
+
+        line_height = self.font.get_linesize()
+        width = max(FRAME_HISTORY, max(text.get_width() for text in texts)) + 2 * PADDING
+        height = line_height * len(texts) + GRAPH_HEIGHT + 3 * PADDING
+        surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 190))
+        for row, text in enumerate(texts):
+            surface.blit(text, (PADDING, PADDING + row * line_height))
+
+        # Rolling graph, newest frame on the right, each column stacked by section
+        bottom = height - PADDING
+        left = width - PADDING - FRAME_HISTORY
+        pixels_per_ms = GRAPH_HEIGHT / GRAPH_SCALE_MS
+        for column, (_, sections, _) in enumerate(self.frames, start=FRAME_HISTORY - len(self.frames)):
+            y = bottom
+            for name in SECTIONS:
+                size = min(y - (bottom - GRAPH_HEIGHT), round(sections[name] * 1000 * pixels_per_ms))
+                if size > 0:
+                    pygame.draw.line(surface, SECTION_COLORS[name], (left + column, y - 1), (left + column, y - size))
+                    y -= size
+        budget_y = bottom - round(FRAME_BUDGET_MS * pixels_per_ms)
+        pygame.draw.line(surface, (200, 200, 200), (left, budget_y), (left + FRAME_HISTORY - 1, budget_y))
+        return surface
+
+    def draw(self, screen):
+        if self.visible:
+            screen.blit(self.render(), OVERLAY_POSITION)
+
+    def item(self, screen):
+        """Renderer item of the overlay, redrawn whenever the timings change, or None while hidden."""
+        if not self.visible:
+            return None
+        surface = self.render()
+        rect = surface.get_rect(topleft=OVERLAY_POSITION)
+        return 'perf-overlay', self.version, rect, lambda: screen.blit(surface, rect)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+"""
+poolConsolidation.py
+
+Merges small pool UTXOs into larger ones while the tables are quiet. Every buy-in
+lands on the pool address as a new UTXO, and every cash-out fetches, selects from
+and signs over that set, so a pool holding thousands of small UTXOs makes cash-outs
+slower and bigger. A consolidation spends up to max_inputs of the smallest pool
+UTXOs back to the pool address in one transaction, built, signed and broadcast
+with the cashOut functions.
+
+A pass only runs when the pool holds at least min_utxos UTXOs below small_amount,
+when no game activity was recorded for idle_seconds (see record_activity) or the
+hour is inside the configured window, and while the fees of the last budget_period
+stay within fee_budget. Cash-outs and consolidations hold cashOut.pool_lock, which
+also locks the pool.lock file next to RPC.conf, so they never spend the same UTXOs,
+even when poolConsolidation runs on its own beside a game server or client on the
+same machine. Processes on other machines are not covered; their spends are only
+seen when the node rejects a payout (see poolUtxos).
+
+The idle check only works inside the game server, which records the activity. Run
+on its own, nothing is recorded, so the command line consolidates only inside the
+--hours window and requires it unless --once is given.
+
+Example:
+    python poolConsolidation.py --once      # one pass now
+    python poolConsolidation.py --hours 2 6 # keep consolidating between 02:00 and 06:00
+"""
+
+import argparse
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+
+import cashOut
+from coinSelection import (DEFAULT_FEE_PER_KB, DUST_THRESHOLD, INPUT_SIZE, SATOSHIS_PER_LUCKY, estimate_fee, fee_for_size,
+                           get_fee_per_kb)
+
+MIN_UTXOS = 200  # Small UTXOs the pool holds before consolidating is worth it
+SMALL_AMOUNT = 10 * SATOSHIS_PER_LUCKY  # UTXOs below this many satoshis are consolidated
+MAX_INPUTS = 250  # Inputs per consolidation transaction, keeps it well below the standard size limit
+FEE_BUDGET = Decimal('1')  # Lucky spent on consolidation fees per budget period
+BUDGET_PERIOD = 24 * 60 * 60  # Seconds
+IDLE_SECONDS = 300  # Seconds without game activity before the pool counts as quiet
+CHECK_INTERVAL = 60  # Seconds between checks of the background consolidator
+
+last_activity = time.monotonic()
+
+def record_activity():
+    """Note that a player did something, consolidation waits for idle_seconds after it."""
+    global last_activity
+    last_activity = time.monotonic()
+
+def consolidation_candidates(utxos, small_amount=SMALL_AMOUNT, fee_per_kb=DEFAULT_FEE_PER_KB):
+    """Pool UTXOs below small_amount that are worth more than the fee of spending them, smallest first."""
+    input_fee = fee_for_size(INPUT_SIZE, fee_per_kb)
+    return sorted((utxo for utxo in utxos if input_fee < utxo.amount < small_amount), key=lambda utxo: utxo.amount)
+
+def create_consolidation_transaction(utxos, fee_per_kb=DEFAULT_FEE_PER_KB):
+    """Build a transaction spending utxos to a single pool output, less the fee for its size."""
+    fee = estimate_fee(len(utxos), 1, fee_per_kb)
+    amount = sum(utxo.amount for utxo in utxos) - fee
+    if amount < DUST_THRESHOLD:
+        return None
+    return cashOut.Transaction(utxos, [cashOut.TxOut(cashOut.from_address, amount)])
+
+def consolidate(min_utxos=MIN_UTXOS, small_amount=SMALL_AMOUNT, max_inputs=MAX_INPUTS,
+                fee_per_kb=None, max_fee=None):
+    """
+    Run one consolidation if the pool holds enough small UTXOs. max_fee (satoshis)
+    limits the inputs so the fee stays within it. Returns (txid, fee in satoshis), or
+    None when nothing was broadcast.
+    """
+    if fee_per_kb is None:
+        fee_per_kb = get_fee_per_kb()
+    with cashOut.pool_lock:
+        tracker = cashOut.get_pool_tracker()
+        if tracker is None:
+            return None
+        utxos = consolidation_candidates(tracker.available(confirmed_only=True), small_amount, fee_per_kb)
+        if len(utxos) < min_utxos:
+            return None
+        utxos = utxos[:max_inputs]
+        while len(utxos) > 1 and max_fee is not None and estimate_fee(len(utxos), 1, fee_per_kb) > max_fee:
+            utxos = utxos[:len(utxos) * max_fee // estimate_fee(len(utxos), 1, fee_per_kb)]
+        if len(utxos) < 2:
+            return None  # The fee budget does not cover two inputs
+
+        tx = create_consolidation_transaction(utxos, fee_per_kb)
+        if tx is None:
+            return None
+        fee = sum(utxo.amount for utxo in utxos) - tx.outputs[0].amount
+        tx_signed = cashOut.sign_transaction(tx, cashOut.privkey_hex)
+        txid = cashOut.broadcast_transaction(cashOut.serialize_transaction(tx_signed).hex())
+        if not txid:
+            tracker.invalidate()
+            return None
+        tracker.record(tx_signed, txid)
+        cashOut.update_balance_cache(tx_signed, txid)
+        print(f"Consolidated {len(utxos)} pool UTXOs into {txid} for a fee of {fee} satoshis")
+        return txid, fee
+
+class Consolidator:
+    """Background thread consolidating the pool while it is quiet and the fee budget lasts."""
+
+    def __init__(self, min_utxos=MIN_UTXOS, small_amount=SMALL_AMOUNT, max_inputs=MAX_INPUTS,
+                 fee_per_kb=None, fee_budget=FEE_BUDGET, budget_period=BUDGET_PERIOD,
+                 idle_seconds=IDLE_SECONDS, hours=None, interval=CHECK_INTERVAL):
+        self.min_utxos = min_utxos
+        self.small_amount = small_amount
+        self.max_inputs = max_inputs
+        self.fee_per_kb = get_fee_per_kb() if fee_per_kb is None else fee_per_kb
+        self.fee_budget = int(fee_budget * SATOSHIS_PER_LUCKY)
+        self.budget_period = budget_period
+        self.idle_seconds = idle_seconds  # None only consolidates inside hours
+        self.hours = hours  # (start hour, end hour) of the daily low-traffic window, or None
+        self.interval = interval
+        self.fees = deque()  # (time, satoshis) of the consolidations inside the budget period
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def budget_left(self):
+        now = time.monotonic()
+        while self.fees and now - self.fees[0][0] > self.budget_period:
+            self.fees.popleft()
+        return self.fee_budget - sum(fee for _, fee in self.fees)
+
+    def is_quiet(self):
+        if self.idle_seconds is not None and time.monotonic() - last_activity >= self.idle_seconds:
+            return True
+        if self.hours is None:
+            return False
+        start, end = self.hours
+        hour = time.localtime().tm_hour
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def run_once(self):
+        """Consolidate once if the pool is quiet and budget is left, returning the consolidate result."""
+        if not self.is_quiet():
+            return None
+        budget = self.budget_left()
+        if budget <= 0:
+            return None
+        try:
+            result = consolidate(self.min_utxos, self.small_amount, self.max_inputs, self.fee_per_kb, budget)
+        except Exception as e:
+            print(f"Consolidation failed: {e}")
+            return None
+        if result:
+            self.fees.append((time.monotonic(), result[1]))
+        return result
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            # Keep going while there is work, a pass only merges max_inputs UTXOs
+            while self.run_once() and not self.stopped.is_set():
+                pass
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="pool-consolidation", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge small pool UTXOs into larger ones")
+    parser.add_argument('--once', action='store_true', help="Run one pass now and exit")
+    parser.add_argument('--min-utxos', type=int, default=MIN_UTXOS, help="Small UTXOs needed before consolidating")
+    parser.add_argument('--small-amount', type=Decimal, default=Decimal(SMALL_AMOUNT) / SATOSHIS_PER_LUCKY,
+                        help="Lucky below which a UTXO counts as small")
+    parser.add_argument('--max-inputs', type=int, default=MAX_INPUTS, help="Inputs per consolidation transaction")
+    parser.add_argument('--fee-per-kb', type=Decimal, help="Lucky per kB (default: feeperkb of RPC.conf)")
+    parser.add_argument('--fee-budget', type=Decimal, default=FEE_BUDGET, help="Lucky of fees per budget period")
+    parser.add_argument('--budget-period', type=float, default=BUDGET_PERIOD, help="Seconds")
+    parser.add_argument('--hours', type=int, nargs=2, metavar=('START', 'END'),
+                        help="Daily low-traffic window (local hours) in which to consolidate, required without --once")
+    parser.add_argument('--interval', type=float, default=CHECK_INTERVAL, help="Seconds between checks")
+    args = parser.parse_args()
+    if not args.once and args.hours is None:
+        parser.error("--hours is required unless --once is given, nothing records game activity outside the game server")
+
+    consolidator = Consolidator(
+        args.min_utxos, int(args.small_amount * SATOSHIS_PER_LUCKY), args.max_inputs, args.fee_per_kb,
+        args.fee_budget, args.budget_period, None, args.hours, args.interval,
+    )
+    if args.once:
+        if not consolidate(consolidator.min_utxos, consolidator.small_amount, consolidator.max_inputs,
+                           consolidator.fee_per_kb, consolidator.budget_left()):
+            print("Nothing consolidated")
+        return
+    consolidator.start()
+    try:
+        consolidator.thread.join()
+    except KeyboardInterrupt:
+        consolidator.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+poolUtxos.py
+
+In-process view of the pool address's UTXOs, so back-to-back payouts do not wait
+for blocks. Fetching listunspent with one confirmation before every payout left the
+change of a cash-out unspendable until it confirmed, and two payouts close together
+could pick the same inputs. The tracker records what every broadcast spends and the
+change it creates, so the next payout can spend that change straight away.
+
+Only our own unconfirmed change is chained on: unconfirmed buy-ins could still be
+double-spent by their sender, and a chain stops at MAX_CHAIN_DEPTH unconfirmed
+ancestors, the node's mempool limit.
+
+The node stays the source of truth. When the best block changes (or after a
+rejected broadcast) the tracker reloads listunspent, unconfirmed outputs included,
+and keeps its own spends of transactions still in the mempool on top of it. Callers
+hold cashOut.pool_lock while choosing and spending UTXOs.
+
+The tracker only knows the spends of its own process. Another process paying from
+the pool (a second server, or poolConsolidation run on its own) is only seen through
+the node: a payout that spends one of its inputs is rejected, and cashOut.send_payouts
+reloads the tracker and builds the payout again from the node's UTXOs.
+"""
+
+import threading
+
+from cashOut import TxIn
+from rpcClient import JSONRPCException, get_rpc_client
+
+MAX_CHAIN_DEPTH = 25  # Unconfirmed ancestors a transaction may have in the node's mempool
+# True while chainEvents reports new blocks (by invalidating the trackers), so
+# refresh no longer asks the node for its best block before every payout
+push_updates = False
+
+class PoolUtxoTracker:
+    """Spendable UTXOs of one address, updated by our broadcasts and reconciled on new blocks."""
+
+    def __init__(self, address):
+        self.address = address
+        self.utxos = {}  # (txid hex, vout) -> TxIn
+        self.depths = {}  # (txid hex, vout) of our unconfirmed change -> unconfirmed transactions in its chain
+        self.spent = {}  # (txid hex, vout) -> txid of our transaction spending it, while that is unconfirmed
+        self.tip = None  # Best block hash of the last reload, None forces a reload
+        self.lock = threading.RLock()
+
+    def reload(self):
+        """Replace the tracked UTXOs with the node's, keeping our spends still in its mempool."""
+        try:
+            tip, unspent, mempool = get_rpc_client().batch([
+                ("getbestblockhash", []),
+                ("listunspent", [0, 9999999, [self.address]]),
+                ("getrawmempool", []),
+            ])
+        except JSONRPCException as e:
+            print(f"An error occurred while reloading the pool UTXOs: {e.error['message']}")
+            return False
+        mempool = set(mempool)
+        with self.lock:
+            self.spent = {outpoint: txid for outpoint, txid in self.spent.items() if txid in mempool}
+            utxos = {}
+            depths = {}
+            for utxo in unspent:
+                outpoint = (utxo['txid'], utxo['vout'])
+                if outpoint in self.spent:
+                    continue
+                if utxo['confirmations'] <= 0:
+                    if outpoint not in self.depths:
+                        continue  # Unconfirmed but not our change
+                    depths[outpoint] = self.depths[outpoint]
+                utxos[outpoint] = self.utxos.get(outpoint) or TxIn.from_utxo(utxo)
+            self.utxos = utxos
+            self.depths = depths
+            self.tip = tip
+        return True
+
+    def refresh(self):
+        """Reload when a block arrived since the last reload (one getbestblockhash otherwise)."""
+        if self.tip is not None:
+            if push_updates:
+                return True
+            try:
+                if get_rpc_client().getbestblockhash() == self.tip:
+                    return True
+            except JSONRPCException as e:
+                print(f"An error occurred while checking the best block: {e.error['message']}")
+                return False
+        return self.reload()
+
+    def invalidate(self):
+        """Reload from the node before the next payout, e.g. after a rejected broadcast."""
+        self.tip = None
+
+    def available(self, confirmed_only=False):
+        """UTXOs a new transaction may spend: confirmed ones, and our change while its chain is short enough."""
+        with self.lock:
+            return [txin for outpoint, txin in self.utxos.items()
+                    if outpoint not in self.depths
+                    or not confirmed_only and self.depths[outpoint] < MAX_CHAIN_DEPTH]
+
+    def record(self, tx, txid):
+        """Apply a broadcast transaction: its inputs are spent and its outputs to the address are our change."""
+        with self.lock:
+            depth = 1
+            for txin in tx.inputs:
+                outpoint = (txin.txid_hex, txin.vout)
+                self.utxos.pop(outpoint, None)
+                depth = max(depth, self.depths.pop(outpoint, 0) + 1)
+                self.spent[outpoint] = txid
+            txid_bytes = bytes.fromhex(txid)[::-1]
+            for vout, txout in enumerate(tx.outputs):
+                if txout.address == self.address:
+                    self.utxos[(txid, vout)] = TxIn(txid_bytes, vout, txout.amount, txout.script_pubkey)
+                    self.depths[(txid, vout)] = depth
+
+pool_trackers = {}  # address -> PoolUtxoTracker
+pool_trackers_lock = threading.Lock()
+
+def invalidate_all():
+    with pool_trackers_lock:
+        for tracker in pool_trackers.values():
+            tracker.invalidate()
+
+def get_pool_tracker(address):
+    """Return the process-wide tracker of an address."""
+    with pool_trackers_lock:
+        if address not in pool_trackers:
+            pool_trackers[address] = PoolUtxoTracker(address)
+        return pool_trackers[address]
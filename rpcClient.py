@@ -0,0 +1,297 @@
+"""
+rpcClient.py
+
+Shared JSON-RPC client for luckycoind. Requests go over a bounded pool of HTTP/1.1
+keep-alive connections managed by asyncio, so independent calls can overlap and no
+call pays for TCP setup once the pool is warm. Numbers in replies are decoded as
+Decimal, like AuthServiceProxy does.
+
+Code that is not async uses RPCClient, a thin sync facade that runs the asyncio client
+on a background thread:
+
+    rpc = get_rpc_client()
+    utxos = rpc.listunspent(0, 9999999, [address])
+    count, best = rpc.gather([("getblockcount", []), ("getbestblockhash", [])])
+"""
+
+import asyncio
+import base64
+import configparser
+import json
+import os
+import sys
+import threading
+import time
+from decimal import Decimal
+
+DEFAULT_POOL_SIZE = 8  # Maximum open connections to the node
+DEFAULT_TIMEOUT = 30  # Seconds before a call is abandoned
+# Called as rpc_hook(method, seconds, bytes_sent, bytes_received, error) after every
+# call, e.g. by rpcMetrics. A batch reports each of its calls with the batch's latency
+# and an even share of its bytes.
+rpc_hook = None
+# Called as blocking_hook(method, seconds) by the thread that waited on a call through
+# the blocking RPCClient, e.g. by the pygame client's performance overlay to see RPC
+# stalling its UI thread. Batches report "batch", gathers "gather".
+blocking_hook = None
+
+class JSONRPCException(Exception):
+    """Error returned by the node, error holds the JSON-RPC error object."""
+
+    def __init__(self, rpc_error):
+        self.error = rpc_error
+        super().__init__(f"{rpc_error.get('code')}: {rpc_error.get('message')}")
+
+def get_config_path():
+    if getattr(sys, 'frozen', False):
+        # Running as compiled executable
+        return os.path.join(os.path.dirname(sys.executable), 'RPC.conf')
+    else:
+        # Running as script
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'RPC.conf')
+
+rpc_config = None  # Parsed RPC.conf, read once by load_rpc_config
+
+def load_rpc_config():
+    """Read the [rpcconfig] section of RPC.conf, parsing the file only on the first call."""
+    global rpc_config
+    if rpc_config is not None:
+        return dict(rpc_config)
+    config_path = get_config_path()
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"Config file not found: {config_path}")
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    if 'rpcconfig' not in config:
+        raise ValueError("'rpcconfig' section not found in RPC.conf")
+
+    parsed = {
+        'rpcuser': config['rpcconfig'].get('rpcuser'),
+        'rpcpassword': config['rpcconfig'].get('rpcpassword'),
+        'rpchost': config['rpcconfig'].get('rpchost', 'localhost'),
+        'rpcport': config['rpcconfig'].get('rpcport', '22555'),
+    }
+    missing_fields = [key for key, value in parsed.items() if value is None]
+    if missing_fields:
+        raise ValueError(f"Missing required fields in RPC.conf: {', '.join(missing_fields)}")
+    parsed['feeperkb'] = config['rpcconfig'].get('feeperkb')  # Optional, see coinSelection.get_fee_per_kb
+    rpc_config = parsed
+    return dict(rpc_config)
+
+def encode_decimal(obj):
+    if isinstance(obj, Decimal):
+        return float(round(obj, 8))
+    raise TypeError(f"{obj!r} is not JSON serializable")
+
+class AsyncRPCClient:
+    """Asyncio JSON-RPC client with a bounded pool of keep-alive connections."""
+
+    def __init__(self, host, port, user, password, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        credentials = base64.b64encode(f"{user}:{password}".encode()).decode()
+        self.header_template = (
+            f"POST / HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            f"Authorization: Basic {credentials}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Connection: keep-alive\r\n"
+        )
+        self.idle = []  # Open connections waiting for a request
+        self.slots = None  # Semaphore bounding open connections, created inside the loop
+        self.next_id = 0
+
+    async def _acquire(self):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.pool_size)
+        await self.slots.acquire()
+        if self.idle:
+            return self.idle.pop(), True
+        try:
+            return await asyncio.open_connection(self.host, self.port), False
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def _release(self, connection, reusable):
+        if reusable:
+            self.idle.append(connection)
+        else:
+            connection[1].close()
+        self.slots.release()
+
+    async def _read_response(self, reader):
+        """Read one HTTP response, returning (status, body, keep_alive)."""
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by luckycoind")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+            body = bytes(body)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            headers['connection'] = 'close'
+        return status, body, headers.get('connection', '').lower() != 'close'
+
+    async def _post(self, body):
+        """Send one request body and return the raw response body."""
+        request = (self.header_template + f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+        for attempt in range(2):
+            (reader, writer), reused = await self._acquire()
+            keep_alive = False
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, response, keep_alive = await self._read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The node drops idle keep-alive connections, retry once on a fresh one
+                if reused and attempt == 0:
+                    continue
+                raise
+            finally:
+                self._release((reader, writer), keep_alive)
+            if status == 401:
+                raise JSONRPCException({'code': -342, 'message': "Authorization failed: incorrect rpcuser or rpcpassword"})
+            if not response:
+                raise JSONRPCException({'code': -342, 'message': f"Empty reply from luckycoind (HTTP {status})"})
+            return response
+
+    def _payload(self, method, params):
+        self.next_id += 1
+        return {"jsonrpc": "2.0", "id": self.next_id, "method": method, "params": list(params)}
+
+    async def call(self, method, *params, timeout=None):
+        """Call one RPC method and return its result."""
+        start = time.perf_counter()
+        body = json.dumps(self._payload(method, params), default=encode_decimal).encode()
+        response = b''
+        error = True
+        try:
+            response = await asyncio.wait_for(self._post(body), timeout or self.timeout)
+            reply = json.loads(response, parse_float=Decimal)
+            if reply.get('error'):
+                raise JSONRPCException(reply['error'])
+            error = False
+            return reply['result']
+        finally:
+            if rpc_hook is not None:
+                rpc_hook(method, time.perf_counter() - start, len(body), len(response), error)
+
+    async def batch(self, calls, timeout=None):
+        """Send (method, params) calls as one JSON-RPC array payload and return their results in order."""
+        if not calls:
+            return []
+        start = time.perf_counter()
+        payloads = [self._payload(method, params) for method, params in calls]
+        body = json.dumps(payloads, default=encode_decimal).encode()
+        response = b''
+        replies = {}
+        try:
+            response = await asyncio.wait_for(self._post(body), timeout or self.timeout)
+            replies = {reply['id']: reply for reply in json.loads(response, parse_float=Decimal)}
+        finally:
+            if rpc_hook is not None:
+                seconds = time.perf_counter() - start
+                for payload in payloads:
+                    reply = replies.get(payload['id'])
+                    rpc_hook(payload['method'], seconds, len(body) // len(payloads), len(response) // len(payloads),
+                             reply is None or bool(reply.get('error')))
+        results = []
+        for payload in payloads:
+            reply = replies[payload['id']]
+            if reply.get('error'):
+                raise JSONRPCException(reply['error'])
+            results.append(reply['result'])
+        return results
+
+    async def gather(self, calls, timeout=None, return_exceptions=False):
+        """Run independent (method, params) calls concurrently on separate connections."""
+        return await asyncio.gather(
+            *(self.call(method, *params, timeout=timeout) for method, params in calls),
+            return_exceptions=return_exceptions,
+        )
+
+    async def close(self):
+        while self.idle:
+            self.idle.pop()[1].close()
+
+class RPCClient:
+    """Blocking facade over AsyncRPCClient, usable like AuthServiceProxy."""
+
+    def __init__(self, *args, **kwargs):
+        self.client = AsyncRPCClient(*args, **kwargs)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="rpc-client", daemon=True)
+        self.thread.start()
+
+    def _run(self, coroutine, method):
+        if blocking_hook is None:
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+        start = time.perf_counter()
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+        finally:
+            blocking_hook(method, time.perf_counter() - start)
+
+    def call(self, method, *params, timeout=None):
+        return self._run(self.client.call(method, *params, timeout=timeout), method)
+
+    def batch(self, calls, timeout=None):
+        return self._run(self.client.batch(calls, timeout=timeout), "batch")
+
+    def gather(self, calls, timeout=None, return_exceptions=False):
+        return self._run(self.client.gather(calls, timeout=timeout, return_exceptions=return_exceptions), "gather")
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        return lambda *params, timeout=None: self.call(method, *params, timeout=timeout)
+
+    def close(self):
+        self._run(self.client.close(), "close")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+rpc_client = None
+rpc_client_lock = threading.Lock()
+
+def get_rpc_client():
+    """Return the process-wide RPC client, reading RPC.conf on first use."""
+    global rpc_client
+    with rpc_client_lock:
+        if rpc_client is None:
+            config = load_rpc_config()
+            rpc_client = RPCClient(
+                config['rpchost'], config['rpcport'],
+                config['rpcuser'], config['rpcpassword'],
+            )
+        return rpc_client
+
+def configure_rpc_client(host, port, user, password, **kwargs):
+    """Point the process-wide RPC client at another node, for example fakeLuckycoind."""
+    global rpc_client
+    with rpc_client_lock:
+        if rpc_client is not None:
+            rpc_client.close()
+        rpc_client = RPCClient(host, port, user, password, **kwargs)
+        return rpc_client
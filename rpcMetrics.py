@@ -0,0 +1,240 @@
+"""
+rpcMetrics.py
+
+Per-method metrics of every luckycoind call, to find which node calls drive the slow
+deals and cash-outs. enable_metrics() installs the rpcClient.rpc_hook, so every call
+from dealCard, getBalances, cashOut, buyIn, the game client and the server is counted
+without touching the callers:
+
+- luckycoin_rpc_calls_total, luckycoin_rpc_errors_total: calls and failed calls
+  (JSON-RPC errors, connection failures and timeouts)
+- luckycoin_rpc_sent_bytes_total, luckycoin_rpc_received_bytes_total: request and
+  reply bodies
+- luckycoin_rpc_latency_seconds: latency histogram
+- luckycoin_rpc_latency_quantile_seconds: p50, p90, p99 and p99.9 latency
+
+Latencies are kept in HDR-style histograms (LatencyHistogram): exact to the
+microsecond below SUB_BUCKETS microseconds, and within 1% above it, in a few
+kilobytes per method however many calls are recorded.
+
+Metrics are exported in the Prometheus text format from a local HTTP endpoint
+(start_metrics_server, GET /metrics) or to a file rewritten every few seconds
+(start_metrics_file_writer, e.g. for the node exporter's textfile collector).
+
+Example:
+    metrics = enable_metrics()
+    start_metrics_server(9464)
+    print(metrics.export())
+"""
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rpcClient
+
+SUB_BUCKET_BITS = 8
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS  # Values below this many microseconds are recorded exactly
+HALF_BUCKETS = SUB_BUCKETS >> 1  # Buckets per power of two above SUB_BUCKETS
+# Upper bounds (seconds) of the exported histogram buckets
+EXPORT_BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+EXPORT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+FILE_INTERVAL = 10.0  # Seconds between rewrites of the metrics file
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def bucket_index(value):
+    """Bucket of a value in microseconds: exact below SUB_BUCKETS, HALF_BUCKETS buckets per power of two above."""
+    shift = max(0, value.bit_length() - SUB_BUCKET_BITS)
+    return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+def bucket_high(index):
+    """Highest value in microseconds that falls into bucket index."""
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    sub_bucket = index - (shift << (SUB_BUCKET_BITS - 1))
+    return ((sub_bucket + 1) << shift) - 1
+
+class LatencyHistogram:
+    """HDR-style latency histogram with a fixed relative precision."""
+
+    def __init__(self):
+        self.counts = []  # Bucket index -> values recorded in it
+        self.count = 0
+        self.total = 0.0  # Seconds
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = bucket_index(max(0, int(seconds * 1e6)))
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percentile):
+        """Latency in seconds below which percentile percent of the calls finished."""
+        if not self.count:
+            return 0.0
+        target = max(1, -(-self.count * percentile // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(bucket_high(index) / 1e6, self.max)
+        return self.max
+
+    def cumulative_counts(self, bounds):
+        """Calls at or below each bound (seconds), as exported in Prometheus histogram buckets."""
+        cumulative = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            while index < len(self.counts) and bucket_high(index) <= bound * 1e6:
+                seen += self.counts[index]
+                index += 1
+            cumulative.append(seen)
+        return cumulative
+
+class MethodMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = LatencyHistogram()
+
+class RPCMetrics:
+    """Call counts, errors, bytes and latency histograms per RPC method."""
+
+    def __init__(self):
+        self.methods = {}  # method -> MethodMetrics
+        self.lock = threading.Lock()
+
+    def record(self, method, seconds, bytes_sent, bytes_received, error):
+        """rpcClient.rpc_hook: record one finished call."""
+        with self.lock:
+            metrics = self.methods.get(method)
+            if metrics is None:
+                metrics = self.methods[method] = MethodMetrics()
+            metrics.calls += 1
+            metrics.errors += bool(error)
+            metrics.bytes_sent += bytes_sent
+            metrics.bytes_received += bytes_received
+            metrics.latency.record(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.methods = {}
+
+    def summary(self):
+        """{method: {calls, errors, p50_ms, p99_ms, ...}}, e.g. for benchmark reports."""
+        with self.lock:
+            return {
+                method: {
+                    'calls': metrics.calls,
+                    'errors': metrics.errors,
+                    'bytes_sent': metrics.bytes_sent,
+                    'bytes_received': metrics.bytes_received,
+                    'total_ms': metrics.latency.total * 1000,
+                    **{f"p{quantile * 100:g}_ms": metrics.latency.percentile(quantile * 100) * 1000
+                       for quantile in EXPORT_QUANTILES},
+                    'max_ms': metrics.latency.max * 1000,
+                }
+                for method, metrics in sorted(self.methods.items())
+            }
+
+    def export(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            methods = sorted(self.methods.items())
+
+            def counter(name, help_text, attribute):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for method, metrics in methods:
+                    lines.append(f'{name}{{method="{method}"}} {getattr(metrics, attribute)}')
+
+            counter("luckycoin_rpc_calls_total", "RPC calls made to luckycoind.", "calls")
+            counter("luckycoin_rpc_errors_total", "RPC calls that failed or timed out.", "errors")
+            counter("luckycoin_rpc_sent_bytes_total", "Request body bytes sent to luckycoind.", "bytes_sent")
+            counter("luckycoin_rpc_received_bytes_total", "Reply body bytes received from luckycoind.", "bytes_received")
+
+            name = "luckycoin_rpc_latency_seconds"
+            lines.append(f"# HELP {name} RPC call latency.")
+            lines.append(f"# TYPE {name} histogram")
+            for method, metrics in methods:
+                histogram = metrics.latency
+                for bound, count in zip(EXPORT_BOUNDS, histogram.cumulative_counts(EXPORT_BOUNDS)):
+                    lines.append(f'{name}_bucket{{method="{method}",le="{bound:g}"}} {count}')
+                lines.append(f'{name}_bucket{{method="{method}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{method="{method}"}} {histogram.total:.6f}')
+                lines.append(f'{name}_count{{method="{method}"}} {histogram.count}')
+
+            name = "luckycoin_rpc_latency_quantile_seconds"
+            lines.append(f"# HELP {name} RPC call latency percentiles from the HDR histogram.")
+            lines.append(f"# TYPE {name} gauge")
+            for method, metrics in methods:
+                for quantile in EXPORT_QUANTILES:
+                    value = metrics.latency.percentile(quantile * 100)
+                    lines.append(f'{name}{{method="{method}",quantile="{quantile:g}"}} {value:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write the export to path atomically, so a collector never reads half a file."""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(self.export())
+        os.replace(temp_path, path)
+
+rpc_metrics = None
+
+def enable_metrics():
+    """Record every RPC call from now on, returning the process-wide RPCMetrics."""
+    global rpc_metrics
+    if rpc_metrics is None:
+        rpc_metrics = RPCMetrics()
+        rpcClient.rpc_hook = rpc_metrics.record
+    return rpc_metrics
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serve the metrics at http://host:port/metrics from a daemon thread, returning the server."""
+    metrics = enable_metrics()
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.export().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would flood the console
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="rpc-metrics", daemon=True).start()
+    print(f"RPC metrics at http://{host}:{server.server_port}/metrics")
+    return server
+
+def start_metrics_file_writer(path, interval=FILE_INTERVAL):
+    """Rewrite path with the metrics every interval seconds from a daemon thread, returning its stop event."""
+    metrics = enable_metrics()
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval):
+            try:
+                metrics.write(path)
+            except OSError as e:
+                print(f"Could not write RPC metrics to {path}: {e}")
+
+    threading.Thread(target=run, name="rpc-metrics-file", daemon=True).start()
+    return stopped
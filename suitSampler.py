@@ -0,0 +1,295 @@
+"""
+suitSampler.py
+
+Draws the card for a hand with exactly the distribution of the original pipeline, but
+with a single block hash lookup.
+
+The original pipeline runs trials until it gets a regular card. A trial picks a
+height h uniformly from [0, tip] and a 3-hex-digit window o uniformly from the 62
+windows of the block hash, giving a value d(h, o). deal_card redraws when d is 4056
+or 4061-4095, and process_deal deals again when d is 4057-4060 (a jackpot). Every
+trial is an independent uniform draw over the same (tip + 1) * 62 pairs, so the loop
+stops on the first pair in
+
+    A = {(h, o) : d(h, o) < 4056}
+
+and that pair is uniform over A. The dealt card is deck[d % 52], so
+
+    P(card c) = |{(h, o) in A : d(h, o) % 52 == c}| / |A|
+
+and a suit's probability is the sum over its 13 cards. These counts depend on the
+actual block hashes (proof of work makes leading hex digits zero, so the cards are
+not uniform), and suit_probabilities() computes them exactly from the block store.
+
+The sampler stores how many accepted windows each height has (one byte per height).
+A hand draws u uniformly from [0, |A|), finds the height holding the u-th accepted
+pair through the running totals, reads that one block hash and takes the matching
+accepted window. That is a uniform draw over A, the same distribution as above,
+without any rejections.
+
+Counting the accepted windows of the whole chain is vectorized with NumPy, which is
+imported when the sampler is created. A hand is drawn in plain Python from the
+running totals, so it pays no NumPy call overhead.
+"""
+
+import math
+import os
+import random
+import tempfile
+import threading
+from bisect import bisect_right
+
+import dealAudit
+from blockStore import REORG_CHECK_DEPTH
+from dealAudit import draw_record, get_audit_log
+from dealCard import deal_card, deal_cards, deck, get_block_store
+
+ACCEPTED_LIMIT = 4056  # Window values below this are dealt as deck cards
+COUNT_CHUNK_SIZE = 65536  # Heights counted per vectorized pass
+BLOCK_SIZE = 256  # Heights per running-total block used to locate a draw
+PIPELINE_SAMPLES = 200_000  # Cards verify_distribution deals one at a time through each real pipeline
+
+def window_values(rows):
+    """Return every 3-hex-digit window value of each hash row as an (n, 62) array."""
+    import numpy as np
+    rows = np.asarray(rows, dtype=np.uint8)
+    nibbles = np.empty((len(rows), 64), dtype=np.int16)
+    nibbles[:, 0::2] = rows >> 4
+    nibbles[:, 1::2] = rows & 0xF
+    return (nibbles[:, :-2] << 8) | (nibbles[:, 1:-1] << 4) | nibbles[:, 2:]
+
+def accepted_windows(block_hash):
+    """(offset, value) of every accepted window of one raw block hash, in window order."""
+    digits = block_hash.hex()
+    windows = []
+    for offset in range(len(digits) - 2):
+        value = int(digits[offset:offset + 3], 16)
+        if value < ACCEPTED_LIMIT:
+            windows.append((offset, value))
+    return windows
+
+class SuitSampler:
+    """Exact single-lookup sampler over the accepted (height, window) pairs of the block store."""
+
+    def __init__(self, store):
+        import numpy as np
+        self.store = store
+        self.lock = threading.Lock()
+        self.counts = np.zeros(0, dtype=np.uint8)  # Accepted windows per height
+        self.block_cumulative = []  # Accepted windows up to the end of each BLOCK_SIZE heights
+        self.card_counts = np.zeros(len(deck), dtype=np.int64)  # Accepted windows per card
+        self.tail = []  # Hashes at the end of the counted range, used to spot reorgs
+
+    @property
+    def total(self):
+        return self.block_cumulative[-1] if self.block_cumulative else 0
+
+    def _count_heights(self, start, end):
+        """Count the accepted windows of heights [start, end) per height and per card."""
+        import numpy as np
+        hashes = self.store.as_array()
+        for chunk_start in range(start, end, COUNT_CHUNK_SIZE):
+            chunk_end = min(chunk_start + COUNT_CHUNK_SIZE, end)
+            values = window_values(hashes[chunk_start:chunk_end])
+            accepted = values < ACCEPTED_LIMIT
+            self.card_counts += np.bincount(values[accepted] % len(deck), minlength=len(deck))
+            self.counts[chunk_start:chunk_end] = accepted.sum(axis=1)
+
+    def _tail(self):
+        """The last REORG_CHECK_DEPTH hashes the counts were built from."""
+        start = max(0, len(self.counts) - REORG_CHECK_DEPTH)
+        return [self.store.get_bytes(height) for height in range(start, len(self.counts))]
+
+    def refresh(self):
+        """Bring the counts up to the store's tip, recounting everything after a reorg."""
+        with self.lock:
+            stored = self.store.count
+            known = len(self.counts)
+            if stored == known and self._tail() == self.tail:
+                return
+            if stored < known or self._tail() != self.tail:
+                # Blocks we counted were replaced, their card counts cannot be undone
+                known = 0
+                self.card_counts[:] = 0
+            import numpy as np
+            counts = np.zeros(stored, dtype=np.uint8)
+            counts[:known] = self.counts[:known]
+            self.counts = counts
+            self._count_heights(known, stored)
+            self.tail = self._tail()
+            padded = np.zeros(-(-stored // BLOCK_SIZE) * BLOCK_SIZE, dtype=np.int64)
+            padded[:stored] = self.counts
+            self.block_cumulative = np.cumsum(padded.reshape(-1, BLOCK_SIZE).sum(axis=1)).tolist()
+
+    def is_ready(self):
+        """The sampler is exact only when the store holds every block up to the chain tip."""
+        return self.store.is_synced()
+
+    def card_probabilities(self):
+        """Exact probability of each deck card under the original pipeline."""
+        self.refresh()
+        return self.card_counts / self.card_counts.sum()
+
+    def suit_probabilities(self):
+        """Exact probability of each suit under the original pipeline, keyed by suit name."""
+        per_card = self.card_probabilities()
+        ranks = len(deck) // 4
+        return {deck[i * ranks].split(" of ")[1]: float(per_card[i * ranks:(i + 1) * ranks].sum())
+                for i in range(4)}
+
+    def draw_index(self, rng):
+        """Draw one deck card index with a single block hash lookup."""
+        return self.draw(rng)[2] % len(deck)
+
+    def draw(self, rng):
+        """
+        Draw one accepted pair with rng (a random.Random), returning (height, window
+        offset, window value, block hash bytes).
+        """
+        while True:
+            self.refresh()
+            with self.lock:
+                u = rng.randrange(self.total)
+                block = bisect_right(self.block_cumulative, u)
+                u -= self.block_cumulative[block - 1] if block else 0
+                height = block * BLOCK_SIZE
+                for count in self.counts[height:height + BLOCK_SIZE].tobytes():
+                    if u < count:
+                        break
+                    u -= count
+                    height += 1
+                # Read under the same lock as the counts, so a refresh cannot swap them in between
+                block_hash = self.store.get_bytes(height)
+                windows = accepted_windows(block_hash) if block_hash is not None else []
+            if len(windows) == count:
+                offset, value = windows[u]
+                return height, offset, value, block_hash
+            # The store replaced the block after the counts were taken (a reorg), count again
+
+    def sample_indices(self, n, rng):
+        """Draw n deck card indices at once, used to check the sampler on large samples."""
+        import numpy as np
+        self.refresh()
+        with self.lock:
+            cumulative = np.cumsum(self.counts, dtype=np.int64)
+        u = rng.integers(0, int(cumulative[-1]), size=n)
+        heights = np.searchsorted(cumulative, u, side='right')
+        u -= np.where(heights > 0, cumulative[heights - 1], 0)
+        values = window_values(self.store.as_array()[heights])
+        accepted = values < ACCEPTED_LIMIT
+        # Position of the u-th accepted window in each row
+        position = np.argmax(np.cumsum(accepted, axis=1) > u[:, np.newaxis], axis=1)
+        return values[np.arange(n), position] % len(deck)
+
+suit_sampler = None
+rng = random.Random()
+
+def get_suit_sampler():
+    """Create the sampler for the dealCard block store on first use."""
+    global suit_sampler
+    if suit_sampler is None:
+        suit_sampler = SuitSampler(get_block_store())
+    return suit_sampler
+
+def draw_card(session_id=None, wager=0):
+    """
+    Deal the card for a hand, never returning a jackpot card, with at most one hash
+    lookup. The draws are written to the deal audit log under one deal id.
+    """
+    sampler = get_suit_sampler()
+    audit_log = get_audit_log()
+    deal_id = audit_log.new_deal()
+    if sampler.is_ready():
+        height, offset, value, block_hash = sampler.draw(rng)
+        audit_log.append([draw_record(deal_id, height, offset, value, block_hash, session_id, wager)])
+        return deck[value % len(deck)]
+    # Until the store has caught up with the chain, use the original pipeline
+    while True:
+        drawn_card = deal_card(session_id, wager, deal_id)
+        if not drawn_card.startswith("Jackpot"):
+            return drawn_card
+
+def legacy_sample_indices(n, generator):
+    """Draw n deck card indices through the original double-rejection pipeline."""
+    import numpy as np
+    result = np.empty(n, dtype=np.int64)
+    remaining = np.arange(n)
+    while len(remaining):
+        indices = deal_cards(len(remaining), generator)
+        regular = indices < len(deck)
+        result[remaining[regular]] = indices[regular]
+        remaining = remaining[~regular]
+    return result
+
+def pipeline_sample_indices(n):
+    """Deal n deck card indices one at a time through deal_card, dealing again on jackpots like process_deal."""
+    import numpy as np
+    card_indices = {card: index for index, card in enumerate(deck)}
+    result = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        drawn_card = deal_card()
+        while drawn_card.startswith("Jackpot"):
+            drawn_card = deal_card()
+        result[i] = card_indices[drawn_card]
+    return result
+
+def chi_square(observed, probabilities):
+    """Return the chi-square statistic and an approximate p-value (Wilson-Hilferty)."""
+    expected = probabilities * observed.sum()
+    mask = expected > 0
+    statistic = float((((observed - expected) ** 2)[mask] / expected[mask]).sum())
+    dof = int(mask.sum()) - 1
+    z = ((statistic / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / (2 / (9 * dof)) ** 0.5
+    return statistic, dof, 0.5 * math.erfc(z / math.sqrt(2))
+
+def verify_distribution(samples=10_000_000, pipeline_samples=PIPELINE_SAMPLES, seed=None):
+    """
+    Accounting mode: deal pipeline_samples cards through the real pipelines (deal_card
+    with the jackpot re-deal of process_deal, and SuitSampler.draw) and samples cards
+    through their vectorized counterparts, and compare each histogram (per card and
+    per suit) against the exact probabilities. The real deals go to a scratch audit
+    log, not the game's.
+    """
+    import numpy as np
+    sampler = get_suit_sampler()
+    generator = np.random.default_rng(seed)
+    draw_rng = random.Random(seed)
+    if seed is not None:
+        random.seed(seed)  # deal_card draws from the random module
+    exact = sampler.card_probabilities()
+
+    previous_path = dealAudit.audit_log_path
+    with tempfile.TemporaryDirectory() as directory:
+        dealAudit.close_audit_log()
+        dealAudit.audit_log_path = os.path.join(directory, 'dealaudit.dat')
+        try:
+            legacy = pipeline_sample_indices(pipeline_samples)
+        finally:
+            dealAudit.close_audit_log()
+            dealAudit.audit_log_path = previous_path
+
+    report = {}
+    for name, indices in (
+        ("legacy", legacy),
+        ("sampler", np.array([sampler.draw_index(draw_rng) for _ in range(pipeline_samples)], dtype=np.int64)),
+        ("legacy_bulk", legacy_sample_indices(samples, generator)),
+        ("sampler_bulk", sampler.sample_indices(samples, generator)),
+    ):
+        observed = np.bincount(indices, minlength=len(deck))
+        suit_observed = observed.reshape(4, -1).sum(axis=1)
+        suit_exact = exact.reshape(4, -1).sum(axis=1)
+        report[name] = {
+            'cards': chi_square(observed, exact),
+            'suits': chi_square(suit_observed, suit_exact),
+            'suit_frequencies': (suit_observed / len(indices)).tolist(),
+        }
+    report['exact_suit_probabilities'] = sampler.suit_probabilities()
+    return report
+
+if __name__ == "__main__":
+    result = verify_distribution()
+    print(f"Exact suit probabilities: {result['exact_suit_probabilities']}")
+    for name in ("legacy", "sampler", "legacy_bulk", "sampler_bulk"):
+        for level in ("cards", "suits"):
+            statistic, dof, p_value = result[name][level]
+            print(f"{name:12} {level:5}: chi2={statistic:.2f} dof={dof} p={p_value:.3f}")
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+"""
+suitsBenchmark.py
+
+Benchmarks the game's hot paths against an in-process fakeLuckycoind, so runs need no
+network and are repeatable:
+
+- deal_card, with hashes coming over RPC (empty block store) and from the synced store
+- GameSession.deal end to end (the deal process_deal runs), including the balance refresh
+- get_filtered_balances_and_utxos for addresses holding different numbers of UTXOs,
+  with a cold and a warm balance cache
+- get_player_addresses_and_balances (the wallet address scan)
+- cashOut.send_lucky spending 1 to 500 inputs
+
+Each benchmark reports latency percentiles and throughput, and the RPC calls made
+during its timed iterations per method (see rpcMetrics), which --rpc-breakdown
+prints. Results are written as
+JSON together with the git commit, so runs can be compared; --compare prints the
+change in median latency against an earlier run and exits with status 1 when a
+benchmark got slower than --threshold.
+
+Example:
+    python suitsBenchmark.py --latency 1 --output results.json
+    python suitsBenchmark.py --compare results.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from ecdsa import SigningKey, SECP256k1
+
+import cashOut
+from coinSelection import estimate_fee
+import dealAudit
+import dealCard
+import getBalances
+from fakeLuckycoind import COIN, FakeLuckycoind
+from gameEngine import GameSession
+from poolUtxos import get_pool_tracker
+from rpcClient import configure_rpc_client
+from rpcMetrics import enable_metrics
+
+PERCENTILES = [50, 90, 99]
+BENCHMARK_KEY = '11' * 32  # Private key of the pool address the stand-in funds
+BENCHMARK_USER = 'benchmark'
+CASH_OUT_UTXO_AMOUNT = COIN  # Every pool UTXO holds 1 lucky, so the amount sets the input count
+
+def measure(func, iterations, warmup=3, setup=None):
+    """Time iterations calls of func, running setup (untimed) before each call."""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+    rpc_metrics = enable_metrics()
+    rpc_metrics.reset()
+    timings = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return {
+        'iterations': iterations,
+        'mean_ms': float(timings.mean()),
+        **{f"p{p}_ms": float(np.percentile(timings, p)) for p in PERCENTILES},
+        'max_ms': float(timings.max()),
+        'ops_per_second': float(iterations / (timings.sum() / 1000)),
+        'rpc': rpc_metrics.summary(),
+    }
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the progress prints of the game modules while they are being timed."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+class BenchmarkEnvironment:
+    """fakeLuckycoind plus the module settings that point the game at it."""
+
+    def __init__(self, args, directory):
+        self.node = FakeLuckycoind(
+            height=args.height, seed=args.seed, rpcuser=BENCHMARK_USER, rpcpassword=BENCHMARK_USER,
+            latency=args.latency, jitter=args.jitter, verify_signatures=args.verify_signatures,
+        )
+        wallet = self.node.wallet
+        wallet.populate(args.addresses, args.utxos, args.watch_only)
+
+        key = SigningKey.from_string(bytes.fromhex(BENCHMARK_KEY), curve=SECP256k1)
+        self.pool_address = cashOut.public_key_to_address(key.get_verifying_key().to_string("compressed"))
+        self.player_address = wallet.new_address()
+        wallet.fund(self.player_address, args.utxos)
+        cashOut.from_address = self.pool_address
+        cashOut.privkey_hex = BENCHMARK_KEY
+        cashOut.dev_fee_address = wallet.new_address()
+
+        # Addresses holding exactly n UTXOs for the balance benchmarks
+        self.utxo_addresses = {}
+        for count in args.utxo_counts:
+            address = wallet.new_address()
+            wallet.fund(address, count, ismine=False)
+            self.utxo_addresses[count] = address
+
+        port = self.node.start_in_thread()
+        configure_rpc_client('127.0.0.1', port, BENCHMARK_USER, BENCHMARK_USER)
+        dealCard.block_store_path = os.path.join(directory, 'blockhashes.dat')
+        dealAudit.audit_log_path = os.path.join(directory, 'dealaudit.dat')
+        cashOut.pool_lock_path = os.path.join(directory, 'pool.lock')
+
+    def fund_cash_outs(self, inputs, iterations):
+        with self.node.lock:
+            self.node.wallet.fund(self.pool_address, inputs * iterations, CASH_OUT_UTXO_AMOUNT, ismine=False)
+        # Funded without a block, so the pool UTXO tracker has to be told to reload
+        get_pool_tracker(self.pool_address).invalidate()
+
+    def close(self):
+        dealCard.get_block_store().close()
+        dealAudit.close_audit_log()
+        self.node.stop()
+
+def run_benchmarks(args, directory):
+    env = BenchmarkEnvironment(args, directory)
+    results = {}
+    try:
+        with quiet():
+            # Empty store: every hash comes over RPC (prefetched in batches)
+            results['deal_card_rpc'] = measure(dealCard.deal_card, args.iterations)
+            print(f"Syncing the block hash store to height {args.height}...", file=sys.stderr)
+            dealCard.get_block_store().sync()
+            dealCard.block_hash_cache.clear()
+            results['deal_card_store'] = measure(dealCard.deal_card, args.iterations)
+
+            session = GameSession(env.player_address, env.pool_address, credits=10 ** 9)
+            session.refresh_balances()
+            results['process_deal'] = measure(lambda: session.deal("Red", 1), args.iterations)
+
+            for count, address in env.utxo_addresses.items():
+                lookup = lambda: getBalances.get_filtered_balances_and_utxos(address, env.pool_address)
+                results[f"balances_cold_{count}_utxos"] = measure(
+                    lookup, args.iterations, setup=getBalances.invalidate_all)
+                results[f"balances_cached_{count}_utxos"] = measure(lookup, args.iterations)
+
+            def list_addresses():
+                return [item for batch in getBalances.iter_player_addresses() for item in batch]
+            results['player_addresses_cold'] = measure(
+                list_addresses, args.iterations, setup=getBalances.watch_only_addresses.clear)
+            results['player_addresses'] = measure(list_addresses, args.iterations)
+
+            for inputs in args.inputs:
+                env.fund_cash_outs(inputs, args.cash_out_iterations + 1)
+                # Needs exactly inputs UTXOs once the fee for that many inputs is added
+                amount = inputs - 0.5 - estimate_fee(inputs, 3) / COIN
+                results[f"cash_out_{inputs}_inputs"] = measure(
+                    lambda: cashOut.send_lucky(env.player_address, amount), args.cash_out_iterations, warmup=1)
+    finally:
+        env.close()
+    return results
+
+def compare(results, baseline, threshold):
+    """Print the median change per benchmark and return the names that regressed."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['p50_ms'], result['p50_ms']
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:32} p50 {before:9.3f} -> {after:9.3f} ms ({change:+.1%}){flag}")
+    return regressions
+
+def print_results(results, rpc_breakdown=False):
+    for name, result in results.items():
+        print(f"{name:32} p50 {result['p50_ms']:9.3f}  p90 {result['p90_ms']:9.3f}  "
+              f"p99 {result['p99_ms']:9.3f} ms  {result['ops_per_second']:10.1f} ops/s")
+        if rpc_breakdown:
+            # Slowest methods in total first, calls are per iteration
+            methods = sorted(result.get('rpc', {}).items(), key=lambda item: -item[1]['total_ms'])
+            for method, rpc in methods:
+                print(f"    {method:28} {rpc['calls'] / result['iterations']:9.2f} calls  "
+                      f"p50 {rpc['p50_ms']:9.3f}  p99 {rpc['p99_ms']:9.3f} ms  {rpc['errors']} errors")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the suits game hot paths against fakeLuckycoind")
+    parser.add_argument('--height', type=int, default=200_000, help="Chain height of the stand-in")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--addresses', type=int, default=200, help="Player addresses in the stand-in wallet")
+    parser.add_argument('--utxos', type=int, default=20, help="UTXOs per player address")
+    parser.add_argument('--watch-only', type=float, default=0.1, help="Fraction of watch-only player addresses")
+    parser.add_argument('--utxo-counts', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help="UTXO counts for the balance lookup benchmarks")
+    parser.add_argument('--inputs', type=int, nargs='+', default=[1, 10, 100, 500],
+                        help="Input counts for the cash-out benchmarks")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--cash-out-iterations', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help="Milliseconds the stand-in adds to every request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random +/- milliseconds added to the latency")
+    parser.add_argument('--verify-signatures', action='store_true',
+                        help="Let the stand-in check cash-out signatures (slows down the cash-out benchmarks)")
+    parser.add_argument('--rpc-breakdown', action='store_true', help="Print the RPC calls of every benchmark")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Median slowdown reported as a regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_benchmarks(args, directory)
+    print_results(results, args.rpc_breakdown)
+
+    report = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'compare', 'rpc_breakdown')},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,59 @@
+import time
+startup_mark = time.perf_counter()  # End of the last startup phase, see mark_startup
 import pygame
-from threading import Timer
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-import pygame_gui
 from pygame import mixer
 import sys
 import os
-import configparser
 import pygame.scrap
-from bitcoinrpc.authproxy import AuthServiceProxy  # Import the AuthServiceProxy for RPC connection
+import assetCache
+from perfOverlay import PerfOverlay
+from rpcClient import get_config_path, get_rpc_client, load_rpc_config
 
-# Import custom modules
-from dealCard import deal_card  # Import the deal_card function
-from getBalances import get_filtered_balances_and_utxos  # Import the get_filtered_balances_and_utxos function
-from cashOut import send_lucky# Import the send_lucky function from cashOut.py
-from buyIn import send_lucky
-
-# Initialize Pygame and other modules
-pygame.init()
-mixer.init()
+# Import custom modules. pygame_gui, the suit sampler (numpy), the signing stack and
+# the game server client are imported where they are first used, after the first frame.
+from dealCard import start_block_sync
+from getBalances import iter_player_addresses
+from gameRules import calculate_max_wager
+from gameEngine import POOL_ADDRESS, GameError, GameSession
 
 # Screen dimensions
 WIDTH, HEIGHT = 1013, 760
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Suit and Color Betting Game")
+screen = None  # Display surface, created by init_display
 
 # Global variables
 player_address = None
 rpc_config = None
 rpc_connection = None
-pool_address = "<Pool Address>"  # Pool address
-credits = 0  # Initialize credits as an integer
+pool_address = POOL_ADDRESS  # Pool address
+credits = 0  # Initialize credits as an integer, mirrors the game session
+game_session = None  # GameSession, or RemoteSession when playing against a game server
+server_url = None  # Game server to play against, None to play locally
+server_token = None  # Token of the game server, None falls back to SUITS_SERVER_TOKEN
+shuffling_sound = None  # Loaded in the background by load_resources
+chain_events = None  # Chain event source (see chainEvents), None to refresh balances on actions only
+
+# Background work: RPC-bound actions run on a worker pool and report back as pygame events
+worker_pool = ThreadPoolExecutor(max_workers=4)
+# Registered with custom_type so they never share ids with pygame_gui's events (UI_BUTTON_PRESSED etc.)
+DEAL_DONE = pygame.event.custom_type()
+BALANCES_DONE = pygame.event.custom_type()
+BUY_IN_DONE = pygame.event.custom_type()
+CASH_OUT_DONE = pygame.event.custom_type()
+BACKGROUND_EVENTS = (DEAL_DONE, BALANCES_DONE, BUY_IN_DONE, CASH_OUT_DONE)
+ADDRESSES_LOADED = pygame.event.custom_type()  # One streamed batch of player addresses
+ADDRESSES_DONE = pygame.event.custom_type()
+CHAIN_EVENT = pygame.event.custom_type()  # A block or a transaction touching the table's addresses
+APP_EVENTS = BACKGROUND_EVENTS + (ADDRESSES_LOADED, ADDRESSES_DONE, CHAIN_EVENT)  # Ours, not pygame_gui's
+ADDRESS_PAGE_SIZE = 10  # Addresses per page of the address dropdown
+pending_jobs = set()  # Event types of background jobs still running
+
+FPS = 60  # Frame rate cap while events keep arriving, an idle screen draws nothing
+RESULT_DISPLAY_SECONDS = 2  # How long the drawn card stays on screen
+UI_IDLE_TIMEOUT = 250  # Milliseconds the pygame_gui screens sleep between idle updates (cursor blink)
+TEXT_CACHE_SIZE = 256  # Rendered text surfaces kept by render_text
 
 # Colors and fonts
 WHITE = (255, 255, 255)
@@ -38,8 +62,122 @@ RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 LIGHT_GRAY = (200, 200, 200)
 DARK_GRAY = (100, 100, 100)
-font = pygame.font.Font(None, 36)
-shuffling_font = pygame.font.Font(None, 72)  # Larger font for the shuffling text
+font = None  # Created by init_display
+shuffling_font = None  # Larger font for the shuffling text
+
+perf_overlay = None  # PerfOverlay, created by init_display and toggled with F3
+
+# Startup timing for --profile-startup
+profile_startup = False
+startup_phases = []  # (phase, seconds) in the order the phases ran
+
+# Set when another screen (the buy-in screen) drew over the game screen
+screen_invalidated = False
+# Rendered text surfaces, (font, text, color) -> Surface, least recently used evicted first
+text_cache = OrderedDict()
+
+def render_text(text, color, text_font=None):
+    """Return the rendered surface for text, rendering each (text, color) once."""
+    text_font = text_font or font
+    key = (text_font, text, color)
+    surface = text_cache.get(key)
+    if surface is None:
+        surface = text_font.render(text, True, color)
+        text_cache[key] = surface
+        if len(text_cache) > TEXT_CACHE_SIZE:
+            text_cache.popitem(last=False)
+    else:
+        text_cache.move_to_end(key)
+    return surface
+
+def wait_for_events(timeout=None):
+    """Sleep until an event arrives (or timeout milliseconds pass) and return every queued event."""
+    event = pygame.event.wait(timeout) if timeout is not None else pygame.event.wait()
+    return [event] + pygame.event.get()
+
+class Renderer:
+    """Redraws only the screen areas whose contents changed since the last frame."""
+
+    def __init__(self, screen, background):
+        self.screen = screen
+        self.background = background
+        self.shown = {}  # name -> (key, rect) of the items drawn last frame
+        self.dirty = [screen.get_rect()]  # The first frame draws everything
+
+    def invalidate(self):
+        """Redraw the whole screen next frame, e.g. after another screen drew over it."""
+        self.dirty = [self.screen.get_rect()]
+
+    def render(self, items):
+        """
+        Draw a frame from (name, key, rect, draw) items in drawing order. An item is
+        redrawn when its key or rect changed, together with everything overlapping it.
+        Returns True when anything was drawn.
+        """
+        shown = {}
+        for name, key, rect, _ in items:
+            old = self.shown.get(name)
+            if old != (key, rect):
+                if old is not None:
+                    self.dirty.append(old[1])
+                self.dirty.append(rect)
+            shown[name] = (key, rect)
+        for name in self.shown.keys() - shown.keys():
+            self.dirty.append(self.shown[name][1])
+        self.shown = shown
+        global screen_invalidated
+        if screen_invalidated:
+            self.invalidate()
+            screen_invalidated = False
+        if not self.dirty:
+            return False
+
+        for area in self.dirty:
+            self.screen.set_clip(area)
+            self.screen.blit(self.background, area, area)
+            for _, _, rect, draw in items:
+                if rect.colliderect(area):
+                    draw()
+        self.screen.set_clip(None)
+        pygame.display.update(self.dirty)
+        self.dirty = []
+        return True
+
+def mark_startup(phase):
+    """Record that a startup phase ended, timed from the end of the previous one."""
+    global startup_mark
+    now = time.perf_counter()
+    startup_phases.append((phase, now - startup_mark))
+    startup_mark = now
+
+def print_startup_profile():
+    total = sum(seconds for _, seconds in startup_phases)
+    print("Startup profile:")
+    for phase, seconds in startup_phases:
+        print(f"  {phase:24} {seconds * 1000:8.1f} ms")
+    print(f"  {'total':24} {total * 1000:8.1f} ms")
+
+def init_display():
+    """Initialize pygame, open the window and create the fonts and the performance overlay."""
+    global screen, font, shuffling_font, perf_overlay
+    pygame.init()
+    mixer.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Suit and Color Betting Game")
+    font = pygame.font.Font(None, 36)
+    shuffling_font = pygame.font.Font(None, 72)
+    perf_overlay = PerfOverlay()
+
+def preload_modules():
+    """Import the modules the first deal, buy-in and cash-out need, off the UI thread."""
+    try:
+        import suitSampler, buyIn, cashOut
+    except Exception as e:
+        print(f"Failed to preload game modules: {e}")
+
+def blit_item(name, surface, rect):
+    """A Renderer item blitting a (cached) surface, redrawn when the surface changes."""
+    return name, surface, rect, lambda: screen.blit(surface, rect)
 
 def get_base_path():
     """Get the base path for resource files."""
@@ -52,32 +190,10 @@ def get_base_path():
 
 def read_rpc_config():
     """Read RPC configuration from RPC.conf file."""
-    base_path = get_base_path()
-    config_path = os.path.join(base_path, 'RPC.conf')
-    
-    config = configparser.ConfigParser()
     try:
-        with open(config_path, 'r') as config_file:
-            config.read_file(config_file)
-        
-        if 'rpcconfig' not in config:
-            raise ValueError("'rpcconfig' section not found in RPC.conf")
-        
-        rpc_config = {
-            'rpcuser': config['rpcconfig'].get('rpcuser'),
-            'rpcpassword': config['rpcconfig'].get('rpcpassword'),
-            'rpchost': config['rpcconfig'].get('rpchost', 'localhost'),
-            'rpcport': config['rpcconfig'].get('rpcport', '22555')
-        }
-        
-        missing_fields = [key for key, value in rpc_config.items() if value is None]
-        if missing_fields:
-            raise ValueError(f"Missing required fields in RPC.conf: {', '.join(missing_fields)}")
-        
-        return rpc_config
-    
+        return load_rpc_config()
     except FileNotFoundError:
-        print(f"RPC.conf not found at {config_path}")
+        print(f"RPC.conf not found at {get_config_path()}")
     except ValueError as e:
         print(f"Error in RPC.conf: {str(e)}")
     except Exception as e:
@@ -85,116 +201,203 @@ def read_rpc_config():
     
     return None
 
-def load_image(filename):
-    """Load an image from the data directory."""
-    return pygame.image.load(os.path.join(get_base_path(), 'data', filename))
+def load_image(filename, scale=1.0):
+    """Load an image from the data directory in the display format, through the asset cache."""
+    return assetCache.load_image(os.path.join(get_base_path(), 'data', filename), scale)
+
+def set_shuffling_sound(sound):
+    global shuffling_sound
+    shuffling_sound = sound
 
 def load_resources():
     """Load images and sounds."""
-    global background, suit_images, shuffling_sound
+    global background, suit_images
     background = load_image("pokerTable.webp")
-    shuffling_sound = mixer.Sound(os.path.join(get_base_path(), 'data', "shuffling-cards-4.mp3"))
-    # Load suit images and resize them
+    # The shuffle sound is not needed for the first frame, deals before it is loaded play silently
+    assetCache.load_sound_in_background(os.path.join(get_base_path(), 'data', "shuffling-cards-4.mp3"),
+                                        set_shuffling_sound)
+    # Load suit images resized to 60%
     suit_images = {
-        "Hearts": load_image("Hearts.webp"),
-        "Diamonds": load_image("Diamonds.webp"),
-        "Clubs": load_image("Clubs.webp"),
-        "Spades": load_image("Spades.webp")
+        "Hearts": load_image("Hearts.webp", 0.6),
+        "Diamonds": load_image("Diamonds.webp", 0.6),
+        "Clubs": load_image("Clubs.webp", 0.6),
+        "Spades": load_image("Spades.webp", 0.6)
     }
-    for suit in suit_images:
-        original_size = suit_images[suit].get_size()
-        new_size = (int(original_size[0] * 0.6), int(original_size[1] * 0.6))
-        suit_images[suit] = pygame.transform.scale(suit_images[suit], new_size)
 
 def initialize_game():
     """Initialize the game state and RPC connection."""
     global rpc_config, rpc_connection
+    if server_url:
+        # The game server talks to luckycoind, the client only needs its resources
+        load_resources()
+        mark_startup("resources")
+        return
     rpc_config = read_rpc_config()
     if rpc_config:
         try:
-            # Establish RPC connection using the credentials
-            rpc_connection = AuthServiceProxy(f"http://{rpc_config['rpcuser']}:{rpc_config['rpcpassword']}@{rpc_config['rpchost']}:{rpc_config['rpcport']}")
+            # Shared keep-alive RPC client, also used by the other modules
+            rpc_connection = get_rpc_client()
         except Exception as e:
             print(f"Failed to connect to luckycoin RPC: {str(e)}")
             rpc_connection = None
     else:
         print("Failed to read RPC configuration.")
         rpc_connection = None
+    mark_startup("rpc config")
+    # Keep the local block hash store synced so deals read hashes from disk
+    start_block_sync()
+    if chain_events:
+        from chainEvents import start_chain_subscriber
+        start_chain_subscriber(chain_events).add_listener(post_chain_event)
+    mark_startup("block sync")
     load_resources()
+    mark_startup("resources")
+
+def post_chain_event(kind, data):
+    """Chain subscriber listener: wake the game loop when the table's balances may have changed."""
+    if kind == 'block' or {player_address, pool_address} & data['addresses']:
+        pygame.event.post(pygame.event.Event(CHAIN_EVENT, kind=kind))
+
+def start_game_session():
+    """Open the table for the selected player address, locally or on the game server."""
+    global game_session
+    if server_url:
+        from gameServer import RemoteSession
+        game_session = RemoteSession(server_url, player_address, server_token)
+    else:
+        game_session = GameSession(player_address, pool_address, credits)
 
 def get_player_addresses_and_balances():
     """Retrieve a list of player addresses and their balances via RPC, excluding watch-only addresses."""
-    global rpc_connection  # Use the global rpc_connection established in initialize_game
-
-    # Retrieve the list of unspent outputs
-    unspent_outputs = rpc_connection.listunspent()
-
-    # Prepare a dictionary to aggregate balances by address
-    address_balances = {}
-
-    # Aggregate balances for each address
-    for output in unspent_outputs:
-        address = output['address']
-        amount = output['amount']
-
-        # Check if the address is watch-only
-        address_info = rpc_connection.validateaddress(address)
-        if address_info.get('iswatchonly', False):
-            continue  # Skip watch-only addresses
-
-        # Initialize the address balance if not already present
-        if address not in address_balances:
-            address_balances[address] = Decimal('0')
-
-        # Add the amount to the address balance
-        address_balances[address] += Decimal(amount)
-
-    # Prepare the list of addresses and balances
-    addresses_and_balances = []
-    for address, balance in address_balances.items():
-        # Only include addresses with a balance greater than 1.0
-        if balance > 1.0:
-            addresses_and_balances.append((address, balance))
+    return [item for batch in iter_player_addresses() for item in batch]
 
-    return addresses_and_balances
+def stream_player_addresses():
+    """Post each batch of player addresses as an ADDRESSES_LOADED event as soon as it is known."""
+    if server_url:
+        from gameServer import list_remote_player_addresses
+        batches = [list_remote_player_addresses(server_url, server_token)]
+    else:
+        batches = iter_player_addresses()
+    for batch in batches:
+        pygame.event.post(pygame.event.Event(ADDRESSES_LOADED, addresses=batch))
 
 def player_address_ui():
     """Handle the player address selection screen."""
     global player_address, player_balance  # Ensure player_balance is global
+    # Load addresses in the background, the screen is usable straight away
+    run_in_background(ADDRESSES_DONE, stream_player_addresses)
+    # Show the table while pygame_gui is imported
+    screen.blit(background, (0, 0))
+    pygame.display.flip()
+    mark_startup("first frame")
+    import pygame_gui
     manager = pygame_gui.UIManager((WIDTH, HEIGHT))
-    addresses = get_player_addresses_and_balances()
-    if not addresses:
-        # Handle error if no addresses are found
-        print("No addresses found.")
-        addresses = [('No Address', Decimal('0'))]
-    
-    # Prepare address options for the dropdown
-    address_options = [(address, f"{address} ({balance} lucky)") for address, balance in addresses]
-    
-    dropdown = pygame_gui.elements.UIDropDownMenu(
-        options_list=[option[1] for option in address_options],  # Use the formatted string for display
-        starting_option=address_options[0][1] if address_options else "No Address",  # Use the formatted string for the starting option
-        relative_rect=pygame.Rect((WIDTH//2 - 200, HEIGHT//2 - 20), (400, 40)),
+    address_options = []  # (address, display string) in the order they were loaded
+    search = ""
+    page = 0
+    loading = True
+    dropdown = None
+    shown_options = None  # Display strings currently in the dropdown
+
+    search_box = pygame_gui.elements.UITextEntryLine(
+        relative_rect=pygame.Rect((WIDTH//2 - 200, HEIGHT//2 - 80), (400, 40)),
+        manager=manager,
+        placeholder_text="Search addresses"
+    )
+    prev_button = pygame_gui.elements.UIButton(
+        relative_rect=pygame.Rect((WIDTH//2 - 200, HEIGHT//2 + 30), (80, 40)),
+        text="<",
+        manager=manager
+    )
+    page_label = pygame_gui.elements.UILabel(
+        relative_rect=pygame.Rect((WIDTH//2 - 110, HEIGHT//2 + 30), (220, 40)),
+        text="Loading addresses...",
+        manager=manager
+    )
+    next_button = pygame_gui.elements.UIButton(
+        relative_rect=pygame.Rect((WIDTH//2 + 120, HEIGHT//2 + 30), (80, 40)),
+        text=">",
         manager=manager
     )
-    
     submit_button = pygame_gui.elements.UIButton(
-        relative_rect=pygame.Rect((WIDTH//2 - 50, HEIGHT//2 + 50), (100, 40)),
+        relative_rect=pygame.Rect((WIDTH//2 - 50, HEIGHT//2 + 90), (100, 40)),
         text="Submit",
         manager=manager
     )
-    
+
+    def matching_options():
+        return [option for option in address_options if search in option[1].lower()]
+
+    def page_count():
+        return max(1, -(-len(matching_options()) // ADDRESS_PAGE_SIZE))
+
+    def refresh_dropdown():
+        """Show the current page, rebuilding the dropdown only when its options change."""
+        nonlocal dropdown, shown_options
+        options = matching_options()[page * ADDRESS_PAGE_SIZE:(page + 1) * ADDRESS_PAGE_SIZE]
+        page_label.set_text(f"Page {page + 1} of {page_count()}" + (" (loading...)" if loading else ""))
+        displays = [display for _, display in options]
+        if not displays:
+            displays = ["Loading addresses..." if loading else "No Address"]
+        if displays == shown_options:
+            return
+        if dropdown is not None:
+            dropdown.kill()
+        dropdown = pygame_gui.elements.UIDropDownMenu(
+            options_list=displays,  # Use the formatted string for display
+            starting_option=displays[0],
+            relative_rect=pygame.Rect((WIDTH//2 - 200, HEIGHT//2 - 20), (400, 40)),
+            manager=manager
+        )
+        shown_options = displays
+
+    refresh_dropdown()
+    mark_startup("address screen")
+    if profile_startup:
+        print_startup_profile()
+    worker_pool.submit(preload_modules)
+
     running = True
     clock = pygame.time.Clock()
     while running:
-        time_delta = clock.tick(60)/1000.0
-        for event in pygame.event.get():
+        events = wait_for_events(perf_overlay.wait_timeout(UI_IDLE_TIMEOUT))
+        time_delta = clock.tick(FPS)/1000.0
+        perf_overlay.start_frame()
+        for event in events:
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+            if perf_overlay.handle_event(event):
+                continue
+            perf_overlay.enter('logic')
+            if event.type == ADDRESSES_LOADED:
+                address_options.extend((address, f"{address} ({balance} lucky)") for address, balance in event.addresses)
+                refresh_dropdown()
+                continue
+            if event.type == ADDRESSES_DONE:
+                pending_jobs.discard(ADDRESSES_DONE)
+                loading = False
+                if event.error:
+                    print(f"Failed to load addresses: {event.error}")
+                if not address_options:
+                    # Handle error if no addresses are found
+                    print("No addresses found.")
+                refresh_dropdown()
+                continue
+            perf_overlay.enter('events')
             manager.process_events(event)
-            if event.type == pygame_gui.UI_BUTTON_PRESSED:
-                if event.ui_element == submit_button:
+            if event.type == pygame_gui.UI_TEXT_ENTRY_CHANGED and event.ui_element == search_box:
+                search = event.text.strip().lower()
+                page = 0
+                refresh_dropdown()
+            elif event.type == pygame_gui.UI_BUTTON_PRESSED:
+                if event.ui_element == prev_button and page > 0:
+                    page -= 1
+                    refresh_dropdown()
+                elif event.ui_element == next_button and page + 1 < page_count():
+                    page += 1
+                    refresh_dropdown()
+                elif event.ui_element == submit_button:
                     selected_option = dropdown.selected_option
                     
                     # Debugging output to check the selected option
@@ -209,18 +412,22 @@ def player_address_ui():
                     # Debugging output to check the assigned player address
                     print(f"Selected Player Address: {player_address}")
 
-                    if player_address is not None:
+                    if player_address is not None and not server_url:
                         # Update player balance after selecting the address
                         player_balance = update_player_balance(player_address)  # Ensure player_balance is updated
                         print(f"Updated Player Balance: {player_balance}")
-                    else:
+                    elif player_address is None:
                         print("No valid address selected.")
                     running = False  # Exit the UI
+        perf_overlay.enter('logic')
         manager.update(time_delta)
+        perf_overlay.enter('draw')
         # Draw background
         screen.blit(background, (0, 0))
         manager.draw_ui(screen)
+        perf_overlay.draw(screen)
         pygame.display.flip()
+        perf_overlay.end_frame()
 
 def update_player_balance(address):
     """Retrieve and return the balance for the given player address."""
@@ -228,22 +435,38 @@ def update_player_balance(address):
     balance = rpc_connection.getreceivedbyaddress(address)
     return balance
 
+def run_in_background(event_type, func, *args):
+    """Run func on the worker pool and post event_type with its result (or error) when it finishes."""
+    pending_jobs.add(event_type)
+
+    def post_result(future):
+        error = future.exception()
+        pygame.event.post(pygame.event.Event(
+            event_type,
+            result=None if error else future.result(),
+            error=error,
+            args=args,
+        ))
+
+    worker_pool.submit(func, *args).add_done_callback(post_result)
+
+def action_in_progress():
+    """Return True while a deal, buy-in or cash-out is still running in the background."""
+    return bool(pending_jobs.intersection((DEAL_DONE, BUY_IN_DONE, CASH_OUT_DONE)))
+
 def suits_game_ui():
     """Handle the main game screen."""
     global credits, player_address  # Declare credits and player_address as global
     wager = 1
     result = ""
     selected_bet = None
-    show_result = False
-    result_timer = None
+    result_until = 0  # time.monotonic() until which the drawn card is shown
     deal_in_progress = False
     player_pool_balance = 0.0
-    player_pool_utxos = []
     player_balance = Decimal('0')
     drawn_suit = None
     drawn_card = None
-    buy_in_active = False
-    buy_in_completed = False
+    balances_stale = False  # A chain event arrived while a balance refresh was running
 
     # Initialize cursors
     cursor_hand = pygame.cursors.Cursor(pygame.SYSTEM_CURSOR_HAND)
@@ -254,17 +477,75 @@ def suits_game_ui():
     buttons, choice_buttons, other_buttons = create_game_buttons()
 
     # Update pool info
-    player_pool_balance, player_pool_utxos, player_balance = update_pool_info()
+    run_in_background(BALANCES_DONE, update_pool_info)
 
+    renderer = Renderer(screen, background)
     running = True
     clock = pygame.time.Clock()
     while running:
-        time_delta = clock.tick(60)/1000.0
-        for event in pygame.event.get():
+        # Block until something happens, waking up only to take the drawn card off the table
+        remaining = result_until - time.monotonic()
+        events = wait_for_events(perf_overlay.wait_timeout(int(remaining * 1000) + 1 if remaining > 0 else None))
+        clock.tick(FPS)  # Caps the frame rate during bursts of events such as mouse motion
+        perf_overlay.start_frame()
+        for event in events:
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+            if perf_overlay.handle_event(event):
+                continue
+            perf_overlay.enter('logic')
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                renderer.invalidate()
+                continue
+            if event.type == CHAIN_EVENT:
+                # The balance cache already holds the change, refreshing reads it without RPC
+                if BALANCES_DONE in pending_jobs:
+                    balances_stale = True  # Refreshed again once the running refresh is done
+                else:
+                    run_in_background(BALANCES_DONE, update_pool_info)
+                continue
+            if event.type in BACKGROUND_EVENTS:
+                pending_jobs.discard(event.type)
+                if event.type == BALANCES_DONE and balances_stale:
+                    balances_stale = False
+                    run_in_background(BALANCES_DONE, update_pool_info)
+                if event.error:
+                    print(f"Background task failed: {event.error}")
+                if event.type == DEAL_DONE:
+                    deal_in_progress = False
+                    if event.error:
+                        credits += event.args[1]  # The stake of a failed deal is never taken
+                        result = str(event.error) if isinstance(event.error, GameError) else "Deal failed. Your bet was returned."
+                    else:
+                        state = event.result
+                        credits = state['credits']
+                        drawn_card, drawn_suit, result = state['last_card'], state['last_suit'], state['result']
+                        player_pool_balance, player_balance = state['pool_balance'], state['player_balance']
+                        result_until = time.monotonic() + RESULT_DISPLAY_SECONDS
+                elif event.type == BALANCES_DONE and not event.error:
+                    player_pool_balance, player_balance = event.result['pool_balance'], event.result['player_balance']
+                elif event.type == BUY_IN_DONE:
+                    if not event.error:
+                        credits = event.result['credits']  # Update credits only if the buy-in was successful
+                        player_pool_balance, player_balance = event.result['pool_balance'], event.result['player_balance']
+                        result = event.result['result']
+                        print(f"Buy-in successful. New credits: {credits}")
+                    else:
+                        result = "Buy-in failed."
+                        print("Buy-in failed, credits not updated.")
+                elif event.type == CASH_OUT_DONE:
+                    if not event.error:
+                        credits = event.result['credits']
+                        player_pool_balance, player_balance = event.result['pool_balance'], event.result['player_balance']
+                        result = event.result['result']
+                    elif isinstance(event.error, GameError):
+                        result = str(event.error)
+                    else:
+                        result = "Cash out failed. Please try again."
+                continue
             # Handle events
+            perf_overlay.enter('events')
             credits, wager, result, selected_bet, deal_in_progress, player_pool_balance, player_balance = handle_game_events(
                 event, buttons, choice_buttons, credits, wager, result, selected_bet, 
                 deal_in_progress, player_pool_balance, player_balance
@@ -274,39 +555,27 @@ def suits_game_ui():
             over_button = any(button.rect.collidepoint(mouse_pos) for button in buttons)
             pygame.mouse.set_cursor(cursor_hand if over_button else cursor_arrow)
 
-        # Update game logic
-        if deal_in_progress and not show_result:
-            drawn_card, drawn_suit, credits, result, show_result, result_timer = process_deal(
-                selected_bet, wager, credits, player_pool_balance
-            )
-            deal_in_progress = False
-
-        # Draw screen
-        # Draw background
-        screen.blit(background, (0, 0))
-        # Draw buttons
-        for button in buttons:
-            button.draw(screen)
-        # Draw text displays
-        draw_game_texts(screen, credits, wager, selected_bet, result, player_balance, player_pool_balance)
-        if deal_in_progress and not show_result:
-            shuffling_text_display = shuffling_font.render("Shuffling", True, WHITE)
-            shuffling_rect = shuffling_text_display.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-            screen.blit(shuffling_text_display, shuffling_rect)
-        elif show_result:
+        # Draw the parts of the screen that changed
+        perf_overlay.enter('draw')
+        items = [(button.text, button.is_pressed, button.rect, lambda button=button: button.draw(screen))
+                 for button in buttons]
+        items += [blit_item(name, surface, rect) for name, (surface, rect) in
+                  game_texts(credits, wager, selected_bet, result, player_balance, player_pool_balance).items()]
+        if deal_in_progress:
+            shuffling_text_display = render_text("Shuffling", WHITE, shuffling_font)
+            items.append(blit_item("center", shuffling_text_display,
+                                   shuffling_text_display.get_rect(center=(WIDTH // 2, HEIGHT // 2))))
+        elif result_until > time.monotonic():
             if drawn_suit and drawn_suit in suit_images:
                 card_image = suit_images[drawn_suit]
-                card_rect = card_image.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-                screen.blit(card_image, card_rect)
             else:
-                result_text_display = font.render("No card drawn", True, WHITE)
-                result_rect = result_text_display.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-                screen.blit(result_text_display, result_rect)
-            # Reset show_result after some time
-            if result_timer and not result_timer.is_alive():
-                show_result = False
-
-        pygame.display.flip()
+                card_image = render_text("No card drawn", WHITE)
+            items.append(blit_item("center", card_image, card_image.get_rect(center=(WIDTH // 2, HEIGHT // 2))))
+        overlay_item = perf_overlay.item(screen)
+        if overlay_item:
+            items.append(overlay_item)
+        renderer.render(items)
+        perf_overlay.end_frame()
 
 def handle_game_events(event, buttons, choice_buttons, credits, wager, result, selected_bet, deal_in_progress, player_pool_balance, player_balance):
     """Handle game events."""
@@ -319,10 +588,12 @@ def handle_game_events(event, buttons, choice_buttons, credits, wager, result, s
                     selected_bet = button.text
                     result = f"You selected {selected_bet}"
                 elif button.text == "Deal":
-                    if not deal_in_progress and selected_bet and wager <= credits:
+                    if not action_in_progress() and selected_bet and wager <= credits:
                         deal_in_progress = True
                         credits -= wager
-                        shuffling_sound.play()
+                        if shuffling_sound is not None:
+                            shuffling_sound.play()
+                        run_in_background(DEAL_DONE, process_deal, selected_bet, wager)
                     else:
                         result = "Cannot deal now."
                 elif button.text == "- Bet":
@@ -332,26 +603,20 @@ def handle_game_events(event, buttons, choice_buttons, credits, wager, result, s
                     if wager < calculate_max_wager(credits, player_pool_balance):
                         wager += 1
                 elif button.text == "Buy In":
+                    if action_in_progress():
+                        result = "Please wait for the current action to finish."
+                        break
+                    perf_overlay.cancel_frame()  # The buy-in screen is not part of this frame
                     buy_in_amount = buy_in_ui()
                     if buy_in_amount is not None and buy_in_amount > 0:
-                        success, new_credits, txid = handle_buy_in(buy_in_amount)
-                        if success:
-                            credits = new_credits  # Update credits only if the buy-in was successful
-                            print(f"Buy-in successful. New credits: {credits}")
-                            # Update player balance and pool balance
-                            player_pool_balance, _, player_balance = update_pool_info()
-                        else:
-                            print("Buy-in failed, credits not updated.")
+                        result = f"Buying in {buy_in_amount} lucky..."
+                        run_in_background(BUY_IN_DONE, handle_buy_in, buy_in_amount)
                 elif button.text == "Cash Out":
-                    if credits > 0:
-                        txid = handle_cash_out(credits, player_address)
-                        if txid:
-                            result = f"Cashed out {credits} lucky. TXID: {txid}"
-                            credits = 0
-                            # Update player balance and pool balance
-                            player_pool_balance, _, player_balance = update_pool_info()
-                        else:
-                            result = "Cash out failed. Please try again."
+                    if action_in_progress():
+                        result = "Please wait for the current action to finish."
+                    elif credits > 0:
+                        result = f"Cashing out {credits} lucky..."
+                        run_in_background(CASH_OUT_DONE, handle_cash_out)
                     else:
                         result = "No credits to cash out."
                 break
@@ -388,109 +653,59 @@ def create_game_buttons():
     other_buttons = buttons[len(choice_buttons):]  # Non-choice buttons
     return buttons, choice_buttons, other_buttons
 
-def calculate_max_wager(credits, player_pool_balance):
-    """Calculate the maximum wager based on credits and pool balance."""
-    pool_minus_credits = max(0, Decimal(player_pool_balance) - Decimal(credits))
-    max_wager = min(credits, int(pool_minus_credits * Decimal('0.1')))
-    return max(1, max_wager)  # Ensure minimum wager is 1
-
-def process_deal(selected_bet, wager, credits, player_pool_balance):
-    while True:
-        drawn_card = deal_card()
-        if not drawn_card.startswith("Jackpot"):
-            break
-    
-    drawn_suit = drawn_card.split(" of ")[1]
-    # Update pool info
-    player_pool_balance, _, _ = update_pool_info()
-    
-    if selected_bet == drawn_suit:
-        winnings = wager * 4  # 4x payout for correct suit
-        credits += winnings
-        result = f"You won {winnings}! Card: {drawn_card}."
-    elif (selected_bet == "Red" and drawn_suit in ["Hearts", "Diamonds"]) or \
-         (selected_bet == "Black" and drawn_suit in ["Clubs", "Spades"]):
-        winnings = wager * 2  # 2x payout for correct color
-        credits += winnings
-        result = f"You won {winnings}! Card: {drawn_card}."
-    else:
-        result = f"You Won 0. Card: {drawn_card}"
-    
-    show_result = True
-    result_timer = Timer(2.0, lambda: None)  # Placeholder
-    result_timer.start()
-    return drawn_card, drawn_suit, credits, result, show_result, result_timer
+def process_deal(selected_bet, wager):
+    """Deal a card for a bet on the game session and return the new table state."""
+    with perf_overlay.time_deal():
+        return game_session.deal(selected_bet, wager)
 
 def update_pool_info():
     """Update player pool and balance information."""
-    balances = get_filtered_balances_and_utxos(player_address, pool_address)
-    player_pool_balance = balances['player_pool_wallet']['balance']
-    player_pool_utxos = balances['player_pool_wallet']['utxos']
-    player_balance = balances['player_wallet']['balance']
-    return player_pool_balance, player_pool_utxos, player_balance
+    return game_session.refresh_balances()
 
-def draw_game_texts(screen, credits, wager, selected_bet, result, player_balance, player_pool_balance):
-    """Draw the game texts on the screen."""
-    credit_text = font.render(f"Credits: {credits}", True, WHITE)
-    screen.blit(credit_text, (50, 50))
+def game_texts(credits, wager, selected_bet, result, player_balance, player_pool_balance):
+    """Return the (surface, rect) of every text on the game screen by name."""
+    texts = {}
+    credit_text = render_text(f"Credits: {credits}", WHITE)
+    texts['credits'] = credit_text, credit_text.get_rect(topleft=(50, 50))
     max_wager = calculate_max_wager(credits, player_pool_balance)
-    wager_text = font.render(f"Bet: {wager} of {max_wager} Max Bet", True, WHITE)
-    screen.blit(wager_text, (50, 90))
-    result_text_display = font.render(result, True, WHITE)
-    screen.blit(result_text_display, (50, 130))
+    wager_text = render_text(f"Bet: {wager} of {max_wager} Max Bet", WHITE)
+    texts['wager'] = wager_text, wager_text.get_rect(topleft=(50, 90))
+    result_text_display = render_text(result, WHITE)
+    texts['result'] = result_text_display, result_text_display.get_rect(topleft=(50, 130))
     if selected_bet:
-        bet_text = font.render(f"Current Bet: {selected_bet}", True, WHITE)
-        screen.blit(bet_text, (50, 170))
-    
+        bet_text = render_text(f"Current Bet: {selected_bet}", WHITE)
+        texts['bet'] = bet_text, bet_text.get_rect(topleft=(50, 170))
+
     # Ensure player_balance is a valid number
     if player_balance is None:
         player_balance = 0  # Default to 0 if player_balance is None
-    player_balance_text = font.render(f"Player Balance: {int(player_balance)} lucky", True, WHITE)
-    player_balance_rect = player_balance_text.get_rect(center=(WIDTH // 2, HEIGHT - 680))
-    screen.blit(player_balance_text, player_balance_rect)
-    player_pool_balance_text = font.render(f"Player Pool: {int(player_pool_balance)} lucky", True, WHITE)
-    player_pool_balance_rect = player_pool_balance_text.get_rect(center=(WIDTH // 2, HEIGHT - 650))
-    screen.blit(player_pool_balance_text, player_pool_balance_rect)
+    player_balance_text = render_text(f"Player Balance: {int(player_balance)} lucky", WHITE)
+    texts['player_balance'] = player_balance_text, player_balance_text.get_rect(center=(WIDTH // 2, HEIGHT - 680))
+    player_pool_balance_text = render_text(f"Player Pool: {int(player_pool_balance)} lucky", WHITE)
+    texts['player_pool_balance'] = player_pool_balance_text, player_pool_balance_text.get_rect(center=(WIDTH // 2, HEIGHT - 650))
+    return texts
 
+def draw_game_texts(screen, credits, wager, selected_bet, result, player_balance, player_pool_balance):
+    """Draw the game texts on the screen."""
+    for surface, rect in game_texts(credits, wager, selected_bet, result, player_balance, player_pool_balance).values():
+        screen.blit(surface, rect)
 
 def handle_buy_in(buy_in_amount):
-    """Handle the buy-in process and update credits."""
-    global credits, player_address, pool_address, rpc_connection
-    if buy_in_amount > 0:
-        try:
-            print(f"Attempting to buy in with amount: {buy_in_amount} to address: {pool_address}")
-            
-            # Call the send_lucky function from buyIn.py
-            txid = send_lucky(player_address, pool_address, buy_in_amount)
-            
-            if txid:
-                print(f"Buy-in successful. Transaction ID: {txid}")
-                
-                # Update pool info after buy-in
-                player_pool_balance, _, player_balance = update_pool_info()
-                
-                # Increase credits by the buy-in amount
-                new_credits = credits + buy_in_amount
-                
-                print(f"Updated Player Pool Balance: {player_pool_balance}")
-                print(f"Updated Player Balance: {player_balance}")
-                print(f"Credits increased by: {buy_in_amount}")
-                
-                return True, new_credits, txid
-            else:
-                print("Buy-in failed: No transaction ID returned from buyIn.py")
-                return False, credits, None
-        except Exception as e:
-            print(f"Buy-in process failed: {str(e)}")
-            import traceback
-            traceback.print_exc()  # Print the full stack trace
-            return False, credits, None
-    else:
-        print("Invalid buy-in amount.")
-        return False, credits, None
+    """Handle the buy-in process and return the new table state."""
+    print(f"Attempting to buy in with amount: {buy_in_amount} to address: {pool_address}")
+    try:
+        state = game_session.buy_in(buy_in_amount)
+        print(f"Buy-in successful. Transaction ID: {state['last_txid']}")
+        return state
+    except Exception as e:
+        print(f"Buy-in process failed: {str(e)}")
+        import traceback
+        traceback.print_exc()  # Print the full stack trace
+        raise
 
 def buy_in_ui():
     """Handle the buy-in screen and return the buy-in amount."""
+    import pygame_gui
     manager = pygame_gui.UIManager((WIDTH, HEIGHT))
     buy_in_amount = 0
     buy_in_text = pygame_gui.elements.UILabel(
@@ -517,14 +732,21 @@ def buy_in_ui():
         text="Submit",
         manager=manager
     )
+    global screen_invalidated
+    screen_invalidated = True  # The game screen has to be redrawn in full afterwards
     running = True
     clock = pygame.time.Clock()
+    deferred = []  # Background results and chain events that arrive meanwhile, handed back to the game screen
     while running:
-        time_delta = clock.tick(60)/1000.0
-        for event in pygame.event.get():
+        events = wait_for_events(UI_IDLE_TIMEOUT)
+        time_delta = clock.tick(FPS)/1000.0
+        for index, event in enumerate(events):
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+            if event.type in APP_EVENTS:
+                deferred.append(event)
+                continue
             manager.process_events(event)
             if event.type == pygame_gui.UI_BUTTON_PRESSED:
                 if event.ui_element == buy_in_minus:
@@ -536,6 +758,9 @@ def buy_in_ui():
                     buy_in_text.set_text(f"Buy In Amount: {buy_in_amount}")
                 elif event.ui_element == buy_in_submit:
                     running = False
+                    deferred.extend(later for later in events[index + 1:] if later.type in APP_EVENTS)
+                    for deferred_event in deferred:
+                        pygame.event.post(deferred_event)
                     return buy_in_amount  # Return the buy-in amount
         manager.update(time_delta)
         # Draw background
@@ -559,7 +784,7 @@ class Button:
         else:
             pygame.draw.rect(screen, self.color, self.rect)
             text_color = BLACK if self.color != BLACK else WHITE
-            text_surface = font.render(self.text, True, text_color)
+            text_surface = render_text(self.text, text_color)
             text_rect = text_surface.get_rect(center=self.rect.center)
             screen.blit(text_surface, text_rect)
         if self.is_pressed:
@@ -567,26 +792,46 @@ class Button:
     def is_clicked(self, pos):
         return self.rect.collidepoint(pos)
 
-def handle_cash_out(amount, address):
-    """Handle the cash out process."""
-    from cashOut import send_lucky
+def handle_cash_out():
+    """Handle the cash out process and return the new table state."""
     try:
-        txid = send_lucky(address, amount)
-        if txid:
-            print(f"Cash out successful. TXID: {txid}")
-            return txid
-        else:
-            print("Cash out failed: No transaction ID returned")
-            return None
+        state = game_session.cash_out()
+        print(f"Cash out successful. TXID: {state['last_txid']}")
+        return state
     except Exception as e:
         print(f"Cash out process failed: {str(e)}")
         import traceback
         traceback.print_exc()  # Print the full stack trace
-        return None
+        raise
 
 def main():
+    global server_url, server_token, chain_events, profile_startup
+    mark_startup("imports")
+    if '--server' in sys.argv:
+        # Play against a game server, e.g. --server http://host:8080
+        server_url = sys.argv[sys.argv.index('--server') + 1]
+    if '--server-token' in sys.argv:
+        # Token the game server was started with, SUITS_SERVER_TOKEN otherwise
+        server_token = sys.argv[sys.argv.index('--server-token') + 1]
+    if '--chain-events' in sys.argv:
+        # Push balance updates from the node, e.g. --chain-events longpoll or tcp://127.0.0.1:28332
+        chain_events = sys.argv[sys.argv.index('--chain-events') + 1]
+    if '--metrics-port' in sys.argv:
+        # Export per-method RPC metrics, e.g. --metrics-port 9464 (see rpcMetrics)
+        from rpcMetrics import start_metrics_server
+        start_metrics_server(int(sys.argv[sys.argv.index('--metrics-port') + 1]))
+    if '--metrics-file' in sys.argv:
+        from rpcMetrics import start_metrics_file_writer
+        start_metrics_file_writer(sys.argv[sys.argv.index('--metrics-file') + 1])
+    # Print how long each startup phase took once the address screen is up
+    profile_startup = '--profile-startup' in sys.argv
+    init_display()
+    # Show the performance overlay from the start, F3 toggles it
+    perf_overlay.visible = '--perf-overlay' in sys.argv
+    mark_startup("display")
     initialize_game()
     player_address_ui()
+    start_game_session()
     suits_game_ui()
 
 if __name__ == '__main__':
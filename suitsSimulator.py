@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+"""
+suitsSimulator.py
+
+Headless Monte Carlo simulator for the suits game. It applies the payout and max-bet
+rules from gameRules to cards drawn with dealCard.deal_cards, so results reflect the
+real card distribution of the synced block hash store. Many independent pools are
+simulated side by side as NumPy arrays, and chunks of pools can be spread across a
+process pool.
+
+For each starting pool size it reports the return to player (RTP), the spread of
+per-round results, drawdown percentiles and the probability that the pool is ruined.
+
+Example:
+    python suitsSimulator.py --pools 100 1000 10000 --paths 20000 --rounds 5000 \\
+        --player Hearts:5:1 --player Red:10:2 --workers 8
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import numpy as np
+
+import gameRules
+from dealCard import deal_cards, deck, get_block_store
+
+DRAWDOWN_PERCENTILES = [50, 90, 99, 99.9]
+SUITS_PER_DECK = len(gameRules.SUITS)
+RANKS_PER_SUIT = len(deck) // SUITS_PER_DECK
+
+class PlayerProfile:
+    """A kind of player in the mix: what they bet on, how much, and how often they play."""
+
+    def __init__(self, bet, wager, weight=1.0):
+        if bet not in gameRules.BETS:
+            raise ValueError(f"Unknown bet {bet}, expected one of {', '.join(gameRules.BETS)}")
+        self.bet = bet
+        self.wager = int(wager)
+        self.weight = float(weight)
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse a profile written as bet:wager[:weight], for example Red:10:2."""
+        parts = spec.split(':')
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Invalid player profile {spec}, expected bet:wager[:weight]")
+        return cls(*parts)
+
+    def __repr__(self):
+        return f"{self.bet}:{self.wager}:{self.weight:g}"
+
+def payout_table():
+    """Return a (bets, suits) array of payout multipliers taken from gameRules."""
+    return np.array([
+        [gameRules.payout_multiplier(bet, suit) for suit in gameRules.SUITS]
+        for bet in gameRules.BETS
+    ], dtype=np.int64)
+
+def max_wager_array(credits, pool_balance):
+    """Vectorized gameRules.calculate_max_wager for integer credits and pool balances."""
+    numerator, denominator = gameRules.MAX_WAGER_POOL_FRACTION.as_integer_ratio()
+    pool_minus_credits = np.maximum(0, pool_balance - credits)
+    max_wager = np.minimum(credits, pool_minus_credits * numerator // denominator)
+    return np.maximum(gameRules.MIN_WAGER, max_wager)
+
+def check_max_wager_array():
+    """Make sure the vectorized max-bet rule matches gameRules.calculate_max_wager."""
+    credits = np.array([0, 1, 5, 50, 500, 5000, 7, 1000])
+    pools = np.array([0, 10, 100, 1000, 10000, 100000, 3, 1009])
+    expected = [gameRules.calculate_max_wager(int(c), Decimal(int(p))) for c, p in zip(credits, pools)]
+    if max_wager_array(credits, pools).tolist() != expected:
+        raise AssertionError("Vectorized max wager does not match gameRules.calculate_max_wager")
+
+def draw_suits(n, rng):
+    """Draw n suit indices the way process_deal does, re-dealing jackpot cards."""
+    suits = np.empty(n, dtype=np.int64)
+    remaining = np.arange(n)
+    while len(remaining):
+        card_indices = deal_cards(len(remaining), rng)
+        regular = card_indices < len(deck)
+        suits[remaining[regular]] = card_indices[regular] // RANKS_PER_SUIT
+        remaining = remaining[~regular]
+    return suits
+
+def simulate_chunk(pool_size, player_credits, profiles, paths, rounds, seed):
+    """
+    Simulate paths independent pools for up to rounds rounds each.
+
+    The pool's equity is its balance minus the credits it owes the player. Players
+    top their credits back up between rounds, so the max-bet rule always sees
+    player_credits against a pool balance of equity + player_credits. A pool is
+    ruined once its equity can no longer cover the minimum bet.
+    """
+    rng = np.random.default_rng(seed)
+    table = payout_table()
+    bet_index = np.array([gameRules.BETS.index(profile.bet) for profile in profiles])
+    desired_wager = np.array([profile.wager for profile in profiles], dtype=np.int64)
+    weights = np.array([profile.weight for profile in profiles])
+    weights /= weights.sum()
+
+    equity = np.full(paths, pool_size, dtype=np.int64)
+    peak = equity.copy()
+    max_drawdown = np.zeros(paths, dtype=np.int64)
+    ruined_at = np.full(paths, -1, dtype=np.int64)
+    alive = np.arange(paths)
+    total_wagered = 0
+    total_paid = 0
+    total_rounds = 0
+    net_sum = 0.0
+    net_square_sum = 0.0
+
+    for round_number in range(rounds):
+        if not len(alive):
+            break
+        count = len(alive)
+        players = rng.choice(len(profiles), size=count, p=weights)
+        wagers = np.minimum(
+            desired_wager[players],
+            max_wager_array(player_credits, equity[alive] + player_credits),
+        )
+        suits = draw_suits(count, rng)
+        winnings = wagers * table[bet_index[players], suits]
+        house_result = wagers - winnings
+
+        equity[alive] += house_result
+        peak[alive] = np.maximum(peak[alive], equity[alive])
+        max_drawdown[alive] = np.maximum(max_drawdown[alive], peak[alive] - equity[alive])
+
+        total_wagered += int(wagers.sum())
+        total_paid += int(winnings.sum())
+        total_rounds += count
+        net_sum += float(house_result.sum())
+        net_square_sum += float((house_result.astype(np.float64) ** 2).sum())
+
+        broke = equity[alive] < gameRules.MIN_WAGER
+        ruined_at[alive[broke]] = round_number + 1
+        alive = alive[~broke]
+
+    return {
+        'total_wagered': total_wagered,
+        'total_paid': total_paid,
+        'total_rounds': total_rounds,
+        'net_sum': net_sum,
+        'net_square_sum': net_square_sum,
+        'max_drawdown': max_drawdown,
+        'ruined_at': ruined_at,
+        'final_equity': equity,
+    }
+
+def merge_chunks(chunks):
+    """Combine the results of several simulate_chunk calls."""
+    merged = {key: sum(chunk[key] for chunk in chunks) for key in
+              ('total_wagered', 'total_paid', 'total_rounds', 'net_sum', 'net_square_sum')}
+    for key in ('max_drawdown', 'ruined_at', 'final_equity'):
+        merged[key] = np.concatenate([chunk[key] for chunk in chunks])
+    return merged
+
+def summarize(pool_size, result):
+    """Turn merged simulation results into the report for one pool size."""
+    rounds = result['total_rounds']
+    mean = result['net_sum'] / rounds if rounds else 0.0
+    variance = result['net_square_sum'] / rounds - mean ** 2 if rounds else 0.0
+    ruined = result['ruined_at'] >= 0
+    return {
+        'pool_size': pool_size,
+        'paths': len(result['ruined_at']),
+        'rounds': rounds,
+        'total_wagered': result['total_wagered'],
+        'total_paid': result['total_paid'],
+        'rtp': result['total_paid'] / result['total_wagered'] if result['total_wagered'] else 0.0,
+        'house_result_per_round': mean,
+        'house_result_stddev': max(variance, 0.0) ** 0.5,
+        'ruin_probability': float(ruined.mean()),
+        'median_rounds_to_ruin': float(np.median(result['ruined_at'][ruined])) if ruined.any() else None,
+        'drawdown_percentiles': {
+            str(p): float(np.percentile(result['max_drawdown'], p)) for p in DRAWDOWN_PERCENTILES
+        },
+        'mean_final_equity': float(result['final_equity'].mean()),
+    }
+
+def run_simulation(pool_sizes, player_credits, profiles, paths, rounds, workers=1, chunk_paths=10000, seed=None):
+    """Simulate every pool size and return one summary per pool size."""
+    check_max_wager_array()
+    if get_block_store().count == 0:
+        raise RuntimeError("Block hash store is empty, sync it first (--sync) so cards come from real block hashes")
+
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(pool_sizes) * (paths // chunk_paths + 1)))
+    jobs = []
+    for pool_size in pool_sizes:
+        for start in range(0, paths, chunk_paths):
+            chunk = min(chunk_paths, paths - start)
+            jobs.append((pool_size, (pool_size, player_credits, profiles, chunk, rounds, next(seeds))))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(pool_size, executor.submit(simulate_chunk, *args)) for pool_size, args in jobs]
+            results = [(pool_size, future.result()) for pool_size, future in futures]
+    else:
+        results = [(pool_size, simulate_chunk(*args)) for pool_size, args in jobs]
+
+    summaries = []
+    for pool_size in pool_sizes:
+        chunks = [result for size, result in results if size == pool_size]
+        summaries.append(summarize(pool_size, merge_chunks(chunks)))
+    return summaries
+
+def print_report(summaries, profiles):
+    print(f"Player mix: {', '.join(repr(profile) for profile in profiles)}")
+    for summary in summaries:
+        drawdowns = ', '.join(f"p{p}={value:.0f}" for p, value in summary['drawdown_percentiles'].items())
+        print(f"Pool {summary['pool_size']}: {summary['rounds']} rounds over {summary['paths']} pools")
+        print(f"  RTP: {summary['rtp']:.4%}  house edge: {1 - summary['rtp']:.4%}")
+        print(f"  House result per round: {summary['house_result_per_round']:.4f} "
+              f"(stddev {summary['house_result_stddev']:.4f})")
+        print(f"  Max drawdown: {drawdowns}")
+        print(f"  Ruin probability: {summary['ruin_probability']:.4%}"
+              + (f" (median after {summary['median_rounds_to_ruin']:.0f} rounds)"
+                 if summary['median_rounds_to_ruin'] is not None else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo RTP and pool ruin simulator for the suits game")
+    parser.add_argument('--pools', type=int, nargs='+', default=[100, 1000, 10000], help="Starting pool sizes in lucky")
+    parser.add_argument('--credits', type=int, default=100, help="Credits each player keeps bought in")
+    parser.add_argument('--player', action='append', type=PlayerProfile.parse,
+                        help="Player profile bet:wager[:weight], may be repeated")
+    parser.add_argument('--paths', type=int, default=10000, help="Independent pools simulated per pool size")
+    parser.add_argument('--rounds', type=int, default=1000, help="Rounds played against each pool")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--chunk-paths', type=int, default=10000, help="Pools simulated per worker task")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for reproducible runs")
+    parser.add_argument('--sync', action='store_true', help="Sync the block hash store to the chain tip first")
+    parser.add_argument('--json', help="Also write the summaries to this JSON file")
+    args = parser.parse_args()
+
+    profiles = args.player or [PlayerProfile("Red", 1, 1), PlayerProfile("Hearts", 1, 1)]
+    if args.sync:
+        print(f"Block hash store synced to height {get_block_store().sync()}")
+
+    summaries = run_simulation(args.pools, args.credits, profiles, args.paths, args.rounds,
+                               workers=args.workers, chunk_paths=args.chunk_paths, seed=args.seed)
+    print_report(summaries, profiles)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=2)
+
+if __name__ == "__main__":
+    main()